@@ -1,19 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-import plotly.graph_objs as go
-import plotly.utils
-import json
+import hmac
 from datetime import datetime, timedelta
 import asyncio
 import threading
 import schedule
 import time
 
-from models import db, User, Subscription, Signal, Performance, Notification, Strategy, SubscriptionStatus, SignalType, TradeOutcome
+from models import db, User, Subscription, Signal, SubscriptionStatus, SignalType
 from config import Config
 from telegram_bot import TradingBot
 from technical_analysis import TechnicalAnalyzer
+from outcome_resolver import OutcomeResolver
+from performance_rollup import PerformanceRollup
+from outbox import enqueue_broadcast, enqueue_signal
+from subscriber_index import subscriber_index
+from metrics import REGISTRY
+from pagination import keyset_paginate
+from chart_payloads import get_chart
+from user_search import user_search_filter
+from dashboard_stats import dashboard_counters
+import migrations
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -30,6 +38,9 @@ login_manager.login_view = 'login'
 # Global bot instance
 bot = None
 analyzer = TechnicalAnalyzer(Config)
+outcome_resolver = OutcomeResolver(Config, analyzer)
+performance_rollup = PerformanceRollup()
+dashboard_counters.ttl = Config.DASHBOARD_COUNTERS_TTL
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -53,17 +64,21 @@ def init_database():
     """Initialize database and create tables"""
     with app.app_context():
         db.create_all()
+        # Bring tables created by earlier versions up to the current schema
+        migrations.upgrade()
         create_admin_user()
 
 def start_bot():
     """Start the Telegram bot in a separate thread"""
     global bot
-    bot = TradingBot(Config)
+    bot = TradingBot(Config, app)
     
     def run_bot():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         loop.run_until_complete(bot.start())
+        # Keep polling, the outbox workers and submitted jobs running
+        loop.run_forever()
     
     bot_thread = threading.Thread(target=run_bot, daemon=True)
     bot_thread.start()
@@ -72,14 +87,27 @@ def run_scheduled_tasks():
     """Run scheduled tasks for automated analysis and notifications"""
     def check_expiry():
         if bot:
-            asyncio.run(bot.check_subscription_expiry())
+            bot.submit(bot.check_subscription_expiry())
     
     def run_analysis():
         if bot:
-            asyncio.run(bot.run_automated_analysis())
+            bot.submit(bot.run_automated_analysis())
+    
+    def resolve_outcomes():
+        with app.app_context():
+            try:
+                outcome_resolver.resolve_pending_signals()
+            except Exception as e:
+                app.logger.error(f"Error resolving signal outcomes: {e}")
+            # Also picks up signals an earlier failed run did not roll up
+            try:
+                performance_rollup.run()
+            except Exception as e:
+                app.logger.error(f"Error rolling up performance: {e}")
     
     # Schedule tasks
     schedule.every().hour.do(run_analysis)
+    schedule.every(Config.OUTCOME_RESOLVER_INTERVAL_MINUTES).minutes.do(resolve_outcomes)
     schedule.every().day.at("09:00").do(check_expiry)
     
     while True:
@@ -116,41 +144,20 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get statistics
-    total_users = User.query.count()
-    active_subscriptions = Subscription.query.filter(
-        Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE])
-    ).count()
-    total_signals = Signal.query.count()
-    
-    # Get recent performance
-    recent_performance = Performance.query.order_by(Performance.date.desc()).limit(7).all()
-    
-    # Create performance chart
-    dates = [p.date.strftime('%Y-%m-%d') for p in recent_performance]
-    success_rates = [p.success_rate for p in recent_performance]
-    
-    performance_chart = go.Figure(data=[
-        go.Scatter(x=dates, y=success_rates, mode='lines+markers', name='Success Rate')
-    ])
-    performance_chart.update_layout(
-        title='Success Rate (Last 7 Days)',
-        xaxis_title='Date',
-        yaxis_title='Success Rate (%)'
-    )
+    # Get statistics; the performance chart is loaded from /api/charts
+    counters = dashboard_counters.get()
     
     return render_template('dashboard.html',
-                         total_users=total_users,
-                         active_subscriptions=active_subscriptions,
-                         total_signals=total_signals,
-                         performance_chart=json.dumps(performance_chart, cls=plotly.utils.PlotlyJSONEncoder))
+                         total_users=counters['total_users'],
+                         active_subscriptions=counters['active_subscriptions'],
+                         total_signals=counters['total_signals'])
 
 @app.route('/signals')
 @login_required
 def signals():
-    page = request.args.get('page', 1, type=int)
-    signals = Signal.query.order_by(Signal.timestamp.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    signals = keyset_paginate(
+        Signal.query, Signal.timestamp, Signal.id,
+        after=request.args.get('after'), before=request.args.get('before'), per_page=20
     )
     return render_template('signals.html', signals=signals)
 
@@ -168,20 +175,17 @@ def new_signal():
             strategy_used=request.form['strategy_used']
         )
         db.session.add(signal)
-        db.session.commit()
         
-        # Send signal via bot if available
-        if bot:
-            signal_data = {
-                'symbol': signal.asset_symbol,
-                'type': signal.signal_type.value.upper(),
-                'price': signal.entry_price,
-                'strategy': signal.strategy_used,
-                'reason': signal.content,
-                'strength': 'medium'
-            }
-            asyncio.run(bot.send_signal_to_channel(signal_data))
-            asyncio.run(bot.send_signal_to_subscribers(signal_data))
+        # Queue the signal for the bot in the same transaction
+        enqueue_signal({
+            'symbol': signal.asset_symbol,
+            'type': signal.signal_type.value.upper(),
+            'price': signal.entry_price,
+            'strategy': signal.strategy_used,
+            'reason': signal.content,
+            'strength': 'medium'
+        }, commit=False)
+        db.session.commit()
         
         flash('Signal created successfully!', 'success')
         return redirect(url_for('signals'))
@@ -202,6 +206,9 @@ def edit_signal(signal_id):
         signal.content = request.form['content']
         signal.strategy_used = request.form['strategy_used']
         
+        if signal.resolved_at and signal.closed_at:
+            # Its day's per-strategy and per-asset rollup rows may have changed
+            performance_rollup.refresh_days([signal.closed_at.date()])
         db.session.commit()
         flash('Signal updated successfully!', 'success')
         return redirect(url_for('signals'))
@@ -212,7 +219,11 @@ def edit_signal(signal_id):
 @login_required
 def delete_signal(signal_id):
     signal = Signal.query.get_or_404(signal_id)
+    closed_on = signal.closed_at.date() if signal.resolved_at and signal.closed_at else None
     db.session.delete(signal)
+    if closed_on:
+        # The day's rollup no longer matches its signals
+        performance_rollup.refresh_days([closed_on])
     db.session.commit()
     flash('Signal deleted successfully!', 'success')
     return redirect(url_for('signals'))
@@ -220,19 +231,15 @@ def delete_signal(signal_id):
 @app.route('/subscribers')
 @login_required
 def subscribers():
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
+    search = request.args.get('search', '').strip()
     
     query = User.query
     if search:
-        query = query.filter(
-            (User.username.contains(search)) |
-            (User.first_name.contains(search)) |
-            (User.last_name.contains(search))
-        )
+        query = query.filter(user_search_filter(search))
     
-    users = query.order_by(User.join_date.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    users = keyset_paginate(
+        query, User.join_date, User.id,
+        after=request.args.get('after'), before=request.args.get('before'), per_page=20
     )
     
     return render_template('subscribers.html', users=users, search=search)
@@ -260,6 +267,7 @@ def extend_subscription(user_id):
     
     user.subscription.status = SubscriptionStatus.ACTIVE
     db.session.commit()
+    subscriber_index.update(user.telegram_id, user.subscription.end_date)
     
     flash(f'Subscription extended by {days} days', 'success')
     return redirect(url_for('subscriber_detail', user_id=user_id))
@@ -267,40 +275,8 @@ def extend_subscription(user_id):
 @app.route('/analytics')
 @login_required
 def analytics():
-    # Get performance data
-    performance_data = Performance.query.order_by(Performance.date.desc()).limit(30).all()
-    
-    # Create charts
-    dates = [p.date.strftime('%Y-%m-%d') for p in performance_data]
-    success_rates = [p.success_rate for p in performance_data]
-    total_signals = [p.total_signals for p in performance_data]
-    winning_signals = [p.winning_signals for p in performance_data]
-    
-    # Success rate chart
-    success_chart = go.Figure(data=[
-        go.Scatter(x=dates, y=success_rates, mode='lines+markers', name='Success Rate')
-    ])
-    success_chart.update_layout(
-        title='Success Rate Over Time',
-        xaxis_title='Date',
-        yaxis_title='Success Rate (%)'
-    )
-    
-    # Signals chart
-    signals_chart = go.Figure(data=[
-        go.Bar(x=dates, y=total_signals, name='Total Signals'),
-        go.Bar(x=dates, y=winning_signals, name='Winning Signals')
-    ])
-    signals_chart.update_layout(
-        title='Signals Performance',
-        xaxis_title='Date',
-        yaxis_title='Number of Signals',
-        barmode='group'
-    )
-    
-    return render_template('analytics.html',
-                         success_chart=json.dumps(success_chart, cls=plotly.utils.PlotlyJSONEncoder),
-                         signals_chart=json.dumps(signals_chart, cls=plotly.utils.PlotlyJSONEncoder))
+    # The charts are loaded from /api/charts
+    return render_template('analytics.html')
 
 @app.route('/settings')
 @login_required
@@ -313,27 +289,10 @@ def broadcast():
     if request.method == 'POST':
         message = request.form['message']
         
-        # Send to all active subscribers
-        active_subscriptions = Subscription.query.filter(
-            Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE])
-        ).all()
-        
-        sent_count = 0
-        for subscription in active_subscriptions:
-            if subscription.is_active():
-                user = subscription.user
-                try:
-                    if bot:
-                        asyncio.run(bot.send_notification(
-                            user.telegram_id,
-                            f"📢 **Broadcast Message**\n\n{message}",
-                            "broadcast"
-                        ))
-                        sent_count += 1
-                except Exception as e:
-                    print(f"Error sending to {user.telegram_id}: {e}")
+        # Queued for every active subscriber; the bot fans it out
+        enqueue_broadcast(f"📢 **Broadcast Message**\n\n{message}", "broadcast")
         
-        flash(f'Message sent to {sent_count} subscribers', 'success')
+        flash('Message queued for all active subscribers', 'success')
         return redirect(url_for('broadcast'))
     
     return render_template('broadcast.html')
@@ -344,13 +303,42 @@ def run_analysis():
     """API endpoint to manually trigger analysis"""
     try:
         if bot:
-            asyncio.run(bot.run_automated_analysis())
-        flash('Analysis completed successfully!', 'success')
+            bot.submit(bot.run_automated_analysis())
+        flash('Analysis started, new signals will be sent when it completes', 'success')
     except Exception as e:
         flash(f'Error running analysis: {e}', 'error')
     
     return redirect(url_for('dashboard'))
 
+@app.route('/api/stats')
+@login_required
+def api_stats():
+    """Dashboard totals as JSON"""
+    return jsonify(dashboard_counters.get())
+
+@app.route('/api/charts/<name>')
+@login_required
+def api_chart(name):
+    """Stored chart JSON, revalidated by the browser with ETag and Last-Modified"""
+    chart = get_chart(name)
+    if chart is None:
+        abort(404)
+    response = Response(chart.payload, mimetype='application/json')
+    response.set_etag(chart.etag)
+    response.last_modified = chart.updated_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Delivery metrics in the Prometheus text format"""
+    if Config.METRICS_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {Config.METRICS_TOKEN}".encode()):
+            return Response(status=401)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     init_database()
     start_bot()
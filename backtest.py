@@ -0,0 +1,256 @@
+import argparse
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indicators import build_price_matrix, compute_indicator_matrix
+
+logger = logging.getLogger(__name__)
+
+# Parameters each built-in strategy depends on, besides the shared trade settings
+STRATEGY_PARAMETERS = {
+    'RSI Oversold': ['rsi_period', 'rsi_oversold'],
+    'RSI Overbought': ['rsi_period', 'rsi_overbought'],
+    'MACD Bullish': ['macd_fast', 'macd_slow', 'macd_signal'],
+    'MACD Bearish': ['macd_fast', 'macd_slow', 'macd_signal'],
+    'Bollinger Bands': ['bb_period', 'bb_dev'],
+    'EMA Crossover': ['ema_fast', 'ema_slow']
+}
+
+TRADE_PARAMETERS = ['target_pct', 'stop_loss_pct', 'max_holding_bars']
+
+def default_parameters(config) -> Dict:
+    """Strategy and trade parameters matching the live TechnicalAnalyzer settings"""
+    return {
+        'rsi_period': config.RSI_PERIOD,
+        'rsi_overbought': config.RSI_OVERBOUGHT,
+        'rsi_oversold': config.RSI_OVERSOLD,
+        'macd_fast': config.MACD_FAST,
+        'macd_slow': config.MACD_SLOW,
+        'macd_signal': config.MACD_SIGNAL,
+        'bb_period': 20,
+        'bb_dev': 2.0,
+        'ema_fast': 20,
+        'ema_slow': 50,
+        'target_pct': config.SIGNAL_TARGET_PCT,
+        'stop_loss_pct': config.SIGNAL_STOP_LOSS_PCT,
+        'max_holding_bars': config.BACKTEST_MAX_HOLDING_BARS
+    }
+
+def build_timestamp_matrix(frames: Dict[str, pd.DataFrame], symbols: List[str], bars: int) -> np.ndarray:
+    """Right-aligned bar timestamps (int64 UTC ns, -1 for padding) matching build_price_matrix"""
+    timestamps = np.full((len(symbols), bars), -1, dtype=np.int64)
+    for row, symbol in enumerate(symbols):
+        index = pd.DatetimeIndex(frames[symbol].index[-bars:])
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        values = index.tz_convert('UTC').as_unit('ns').asi8
+        timestamps[row, bars - len(values):] = values
+    return timestamps
+
+def strategy_masks(indicators: Dict[str, np.ndarray], closes: np.ndarray, parameters: Dict,
+                   strategies: Optional[List[str]] = None) -> Dict[str, Tuple[np.ndarray, int]]:
+    """Boolean (assets x bars) entry conditions for the built-in strategies (default: all)
+
+    Applies the same rules as TechnicalAnalyzer.generate_signals to every bar at
+    once. Values are (mask, direction) with direction 1 for BUY and -1 for SELL.
+    NaN indicators never satisfy a condition, as in the live rules. Only the
+    indicators of the requested strategies need to be in `indicators`.
+    """
+    def wanted(strategy: str) -> bool:
+        return strategies is None or strategy in strategies
+
+    masks = {}
+    with np.errstate(invalid='ignore'):
+        if wanted('RSI Oversold'):
+            masks['RSI Oversold'] = (indicators['rsi'] < parameters['rsi_oversold'], 1)
+        if wanted('RSI Overbought'):
+            masks['RSI Overbought'] = (indicators['rsi'] > parameters['rsi_overbought'], -1)
+        if wanted('MACD Bullish') or wanted('MACD Bearish'):
+            macd = indicators['macd']
+            signal = indicators['macd_signal']
+            diff = indicators['macd_diff']
+            if wanted('MACD Bullish'):
+                masks['MACD Bullish'] = ((macd > signal) & (diff > 0), 1)
+            if wanted('MACD Bearish'):
+                masks['MACD Bearish'] = ((macd < signal) & (diff < 0), -1)
+        if wanted('Bollinger Bands'):
+            masks['Bollinger Bands BUY'] = (closes <= indicators['bb_lower'], 1)
+            masks['Bollinger Bands SELL'] = (closes >= indicators['bb_upper'], -1)
+        if wanted('EMA Crossover'):
+            ema_fast = indicators[f"ema_{parameters['ema_fast']}"]
+            ema_slow = indicators[f"ema_{parameters['ema_slow']}"]
+            masks['EMA Crossover BUY'] = (ema_fast > ema_slow, 1)
+            masks['EMA Crossover SELL'] = (ema_fast < ema_slow, -1)
+    return masks
+
+def simulate_trades(mask: np.ndarray, direction: int, closes: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                    target_pct: float, stop_loss_pct: float, max_holding_bars: int) -> Dict[str, np.ndarray]:
+    """Simulate every entry of one strategy with array operations
+
+    A trade opens at the close of each bar where the condition switches on and
+    is checked against the highs and lows of the next `max_holding_bars` bars.
+    The first bar touching the target or the stop decides the outcome; a bar
+    touching both counts as a loss. Trades hitting neither close at the last
+    bar of the window. Returns per-trade asset row, entry and exit bar, and
+    percentage return.
+    """
+    previous = np.zeros_like(mask)
+    previous[:, 1:] = mask[:, :-1]
+    rows, entries = np.nonzero(mask & ~previous)
+
+    horizon = max(1, int(max_holding_bars))
+    offsets = entries[:, None] + 1 + np.arange(horizon)
+    in_range = offsets < closes.shape[1]
+    offsets = np.minimum(offsets, closes.shape[1] - 1)
+
+    entry_price = closes[rows, entries]
+    window_close = np.where(in_range, closes[rows[:, None], offsets], np.nan)
+    window_high = np.where(in_range, highs[rows[:, None], offsets], np.nan)
+    window_low = np.where(in_range, lows[rows[:, None], offsets], np.nan)
+
+    if direction > 0:
+        target = entry_price * (1 + target_pct / 100)
+        stop = entry_price * (1 - stop_loss_pct / 100)
+        with np.errstate(invalid='ignore'):
+            hit_target = window_high >= target[:, None]
+            hit_stop = window_low <= stop[:, None]
+    else:
+        target = entry_price * (1 - target_pct / 100)
+        stop = entry_price * (1 + stop_loss_pct / 100)
+        with np.errstate(invalid='ignore'):
+            hit_target = window_low <= target[:, None]
+            hit_stop = window_high >= stop[:, None]
+
+    # First bar of the window that hits each level, `horizon` when never hit
+    first_target = np.where(hit_target.any(axis=1), hit_target.argmax(axis=1), horizon)
+    first_stop = np.where(hit_stop.any(axis=1), hit_stop.argmax(axis=1), horizon)
+
+    # Trades that time out close at the last bar actually available
+    available = (~np.isnan(window_close)).sum(axis=1)
+    last_bar = np.maximum(available - 1, 0)
+    timeout_close = window_close[np.arange(len(rows)), last_bar]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        timeout_return = direction * (timeout_close / entry_price - 1) * 100
+
+    stopped = (first_stop < horizon) & (first_stop <= first_target)
+    targeted = (first_target < horizon) & ~stopped
+    returns = np.where(stopped, -stop_loss_pct, np.where(targeted, target_pct, timeout_return))
+    exit_offset = np.where(stopped, first_stop, np.where(targeted, first_target, last_bar))
+
+    # Entries on the very last bar have nothing to be evaluated against
+    valid = (available > 0) & ~np.isnan(entry_price) & ~np.isnan(returns)
+    return {
+        'rows': rows[valid],
+        'entries': entries[valid],
+        'exits': entries[valid] + 1 + exit_offset[valid],
+        'returns': returns[valid]
+    }
+
+class Backtester:
+    """Replays the built-in signal rules over historical bars
+
+    Indicators for all assets come from one compute_indicator_matrix sweep and
+    each strategy's trades are simulated together, so run time grows with the
+    number of trades rather than with assets x bars Python iterations.
+    """
+
+    def __init__(self, config, parameters: Optional[Dict] = None):
+        self.config = config
+        # Without a config, `parameters` must be complete (see default_parameters)
+        self.parameters = default_parameters(config) if config is not None else {}
+        if parameters:
+            self.parameters.update(parameters)
+
+    def run_matrices(self, closes: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                     timestamps: Optional[np.ndarray] = None, equity: bool = True,
+                     strategies: Optional[List[str]] = None,
+                     indicators: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Dict]:
+        """Backtest the strategies (default: all) on right-aligned (assets x bars) price matrices
+
+        `indicators` may hold precomputed indicator matrices for these
+        parameters, as returned by compute_indicator_matrix.
+        """
+        parameters = self.parameters
+        if indicators is None:
+            indicators = compute_indicator_matrix(
+                closes,
+                rsi_period=int(parameters['rsi_period']),
+                macd_fast=int(parameters['macd_fast']),
+                macd_slow=int(parameters['macd_slow']),
+                macd_signal=int(parameters['macd_signal']),
+                bb_period=int(parameters['bb_period']),
+                bb_dev=float(parameters['bb_dev']),
+                ema_periods=(int(parameters['ema_fast']), int(parameters['ema_slow']))
+            )
+        parameters = dict(parameters, ema_fast=int(parameters['ema_fast']), ema_slow=int(parameters['ema_slow']))
+
+        # Both directions of a strategy are reported together under its live name
+        trades_by_strategy: Dict[str, List[Dict[str, np.ndarray]]] = {}
+        for name, (mask, direction) in strategy_masks(indicators, closes, parameters, strategies).items():
+            strategy = name.replace(' BUY', '').replace(' SELL', '')
+            trades = simulate_trades(
+                mask, direction, closes, highs, lows,
+                float(parameters['target_pct']),
+                float(parameters['stop_loss_pct']),
+                int(parameters['max_holding_bars'])
+            )
+            trades_by_strategy.setdefault(strategy, []).append(trades)
+
+        results = {}
+        for strategy, parts in trades_by_strategy.items():
+            trades = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+            results[strategy] = self._summarize(strategy, trades, timestamps if equity else None)
+        return results
+
+    def _summarize(self, strategy: str, trades: Dict[str, np.ndarray], timestamps: Optional[np.ndarray]) -> Dict:
+        returns = trades['returns']
+        wins = int((returns > 0).sum())
+        total = len(returns)
+        result = {
+            'strategy': strategy,
+            'trades': total,
+            'wins': wins,
+            'losses': total - wins,
+            'win_rate': wins / total * 100 if total else 0.0,
+            'total_return': float(returns.sum()),
+            'average_return': float(returns.mean()) if total else 0.0
+        }
+        if timestamps is not None:
+            # Cumulative percentage return, one point per bar time with exits
+            exit_times = timestamps[trades['rows'], trades['exits']]
+            curve = pd.Series(returns, index=pd.to_datetime(exit_times, utc=True)).groupby(level=0).sum()
+            result['equity'] = curve.sort_index().cumsum()
+        return result
+
+    def run(self, market_data: Dict[str, pd.DataFrame], bars: Optional[int] = None) -> Dict[str, Dict]:
+        """Backtest every strategy on per-symbol OHLCV frames"""
+        symbols, closes = build_price_matrix(market_data, 'Close', bars)
+        if not symbols:
+            return {}
+        _, highs = build_price_matrix(market_data, 'High', bars)
+        _, lows = build_price_matrix(market_data, 'Low', bars)
+        timestamps = build_timestamp_matrix(market_data, symbols, closes.shape[1])
+        return self.run_matrices(closes, highs, lows, timestamps)
+
+def main():
+    from config import Config
+    from technical_analysis import TechnicalAnalyzer
+
+    parser = argparse.ArgumentParser(description='Backtest the built-in signal strategies')
+    parser.add_argument('--period', default='10y', help='History to replay, as a yfinance period string')
+    parser.add_argument('--symbols', nargs='*', default=Config.MONITORED_ASSETS)
+    args = parser.parse_args()
+
+    analyzer = TechnicalAnalyzer(Config)
+    market_data = analyzer.get_market_data_bulk(args.symbols, period=args.period)
+    results = Backtester(Config).run(market_data)
+
+    for strategy, result in results.items():
+        print(f"{strategy:<16} trades={result['trades']:<6} win_rate={result['win_rate']:6.2f}% "
+              f"total_return={result['total_return']:9.2f}%")
+
+if __name__ == '__main__':
+    main()
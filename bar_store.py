@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: series are only locked between threads of one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+class _SeriesLock:
+    """Reentrant lock on one cached series, held across threads and, with fcntl, across processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+class BarStore:
+    """On-disk columnar OHLCV store keyed by symbol and interval
+
+    Every (interval, symbol) pair lives in its own directory holding one raw
+    little-endian file per column (timestamps as int64 UTC nanoseconds, prices and
+    volume as float64) plus a small meta.json. Columns are read back with
+    np.memmap, so analysis never re-parses the data, and new bars are written
+    in place after the kept history instead of rewriting it. A column that
+    would shrink is rewritten to a temporary file and swapped in, so memory
+    maps held elsewhere never lose pages under them.
+
+    The analyzer of the Flask app, the bot, the delivery shards and the
+    webhook workers share one store, so every access to a series holds a
+    lock file (flock) for it as well as a thread lock. Writes mark meta.json
+    as in progress first and replace it last; a series left damaged or
+    marked by an interrupted write is dropped on the next access and
+    downloaded again.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._locks: Dict[tuple, _SeriesLock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _lock(self, symbol: str, interval: str) -> _SeriesLock:
+        with self._locks_guard:
+            lock = self._locks.get((symbol, interval))
+            if lock is None:
+                # Outside the series directory, which clear() removes
+                lock_path = os.path.join(self.root, '.locks', interval, quote(symbol, safe=''))
+                lock = self._locks[(symbol, interval)] = _SeriesLock(lock_path)
+            return lock
+
+    def _path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, quote(symbol, safe=''))
+
+    def _column_file(self, path: str, column: str) -> str:
+        return os.path.join(path, f"{column.lower()}.bin")
+
+    def get_meta(self, symbol: str, interval: str) -> Optional[Dict]:
+        """Return the stored metadata for a series, or None if it is not cached"""
+        meta_path = os.path.join(self._path(symbol, interval), 'meta.json')
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path: str, meta: Dict):
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    def _intact(self, path: str, meta: Dict) -> bool:
+        if meta.get('writing'):
+            return False
+        expected = meta['rows'] * 8
+        for column in ['timestamp'] + BAR_COLUMNS:
+            try:
+                if os.path.getsize(self._column_file(path, column)) != expected:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def verify(self, symbol: str, interval: str) -> bool:
+        """Drop a series left inconsistent by an interrupted write; returns whether a usable series remains"""
+        with self._lock(symbol, interval):
+            meta = self.get_meta(symbol, interval)
+            if meta is None:
+                return False
+            if self._intact(self._path(symbol, interval), meta):
+                return True
+            logger.warning(f"Cached bars for {symbol} ({interval}) do not match their metadata, dropping them")
+            self.clear(symbol, interval)
+            return False
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[pd.Timestamp]:
+        """Timestamp of the newest cached bar"""
+        meta = self.get_meta(symbol, interval)
+        if not meta or not meta['rows']:
+            return None
+        return pd.Timestamp(meta['last'], unit='ns', tz='UTC').tz_convert(meta['tz'])
+
+    def coverage_start(self, symbol: str, interval: str) -> Optional[datetime]:
+        """Earliest point in time the cached series is known to be complete from"""
+        meta = self.get_meta(symbol, interval)
+        if not meta or meta.get('coverage_start') is None:
+            return None
+        return datetime.fromisoformat(meta['coverage_start'])
+
+    def columns(self, symbol: str, interval: str) -> Dict[str, np.ndarray]:
+        """Memory-map the cached columns of a series without copying them"""
+        with self._lock(symbol, interval):
+            meta = self.get_meta(symbol, interval)
+            if not meta or not meta['rows'] or not self.verify(symbol, interval):
+                return {}
+        path = self._path(symbol, interval)
+        rows = meta['rows']
+        arrays = {'timestamp': np.memmap(self._column_file(path, 'timestamp'), dtype='<i8', mode='r', shape=(rows,))}
+        for column in BAR_COLUMNS:
+            arrays[column] = np.memmap(self._column_file(path, column), dtype='<f8', mode='r', shape=(rows,))
+        return arrays
+
+    def read(self, symbol: str, interval: str, start: Optional[datetime] = None) -> pd.DataFrame:
+        """Load a cached series as a DataFrame, optionally from a start time"""
+        with self._lock(symbol, interval):
+            meta = self.get_meta(symbol, interval)
+            arrays = self.columns(symbol, interval)
+            if not arrays:
+                return pd.DataFrame()
+
+            timestamps = arrays['timestamp']
+            first = 0
+            if start is not None:
+                start = pd.Timestamp(start)
+                if start.tzinfo is None:
+                    start = start.tz_localize('UTC')
+                first = int(np.searchsorted(timestamps, start.as_unit('ns').value, side='left'))
+
+            index = pd.DatetimeIndex(np.asarray(timestamps[first:]).astype('datetime64[ns]'), name='Date')
+            index = index.tz_localize('UTC').tz_convert(meta['tz'])
+            return pd.DataFrame({column: np.array(arrays[column][first:]) for column in BAR_COLUMNS}, index=index)
+
+    def write(self, symbol: str, interval: str, data: pd.DataFrame, coverage_start: Optional[datetime] = None):
+        """Merge freshly downloaded bars into the cache
+
+        Bars at or after the first timestamp of `data` replace what is cached (the
+        last cached bar is usually still forming), and everything newer is appended.
+        Passing `coverage_start` marks a full download and discards existing bars.
+        """
+        if data.empty:
+            return
+
+        index = pd.DatetimeIndex(data.index)
+        tz = str(index.tz) if index.tz is not None else 'UTC'
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        timestamps = index.tz_convert('UTC').as_unit('ns').asi8.astype('<i8')
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        values = {column: data[column].to_numpy(dtype='<f8')[order] for column in BAR_COLUMNS}
+
+        path = self._path(symbol, interval)
+        with self._lock(symbol, interval):
+            os.makedirs(path, exist_ok=True)
+            meta = self.get_meta(symbol, interval)
+            if meta is None or coverage_start is not None:
+                keep = 0
+                meta = {
+                    'symbol': symbol,
+                    'interval': interval,
+                    'tz': tz,
+                    'coverage_start': coverage_start.isoformat() if coverage_start else None
+                }
+            else:
+                existing = self.columns(symbol, interval).get('timestamp')
+                if existing is None and meta['rows']:
+                    # columns() dropped the damaged series; appending to it would keep a partial history
+                    raise ValueError(f"Cached bars for {symbol} ({interval}) were damaged and have been dropped")
+                keep = int(np.searchsorted(existing, timestamps[0], side='left')) if existing is not None else 0
+                del existing
+
+            # Until the new meta.json is written the columns may be partly updated
+            self._write_meta(path, {**meta, 'rows': meta.get('rows', 0), 'writing': True})
+            for column, array in [('timestamp', timestamps)] + list(values.items()):
+                self._write_column(self._column_file(path, column), keep, array)
+
+            meta['rows'] = keep + len(timestamps)
+            meta['last'] = int(timestamps[-1])
+            self._write_meta(path, meta)
+
+    def _write_column(self, file_path: str, keep: int, array: np.ndarray):
+        """Replace everything after the first `keep` values of a column file by `array`"""
+        size = (keep + len(array)) * 8
+        if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+            # Shrinking in place would pull pages from under memory maps held by readers
+            tmp_path = f"{file_path}.tmp"
+            with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                dst.write(src.read(keep * 8))
+                dst.write(array.tobytes())
+            os.replace(tmp_path, file_path)
+            return
+        with open(file_path, 'r+b' if os.path.exists(file_path) else 'wb') as f:
+            f.seek(keep * 8)
+            f.write(array.tobytes())
+
+    def clear(self, symbol: str, interval: str):
+        """Drop a cached series"""
+        path = self._path(symbol, interval)
+        with self._lock(symbol, interval):
+            if os.path.isdir(path):
+                for name in os.listdir(path):
+                    os.remove(os.path.join(path, name))
+                os.rmdir(path)
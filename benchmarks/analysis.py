@@ -0,0 +1,192 @@
+"""Benchmarks for the technical-analysis hot path
+
+Times market data fetching (through an in-memory provider), indicator
+computation and signal generation on synthetic OHLCV for a grid of universe
+sizes and history lengths, and writes the results as JSON so runs from
+different versions can be compared:
+
+    python -m benchmarks.analysis --symbols 10 100 1000 --bars 100 1000 10000
+    python -m benchmarks.analysis --compare benchmark_results.json
+"""
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from indicators import IndicatorEngine, build_price_matrix, compute_indicator_matrix
+from market_data import MarketDataProvider
+from technical_analysis import TechnicalAnalyzer
+
+class InMemoryProvider(MarketDataProvider):
+    """Serves pre-generated frames, standing in for a network provider"""
+
+    cacheable = False
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], latency: float = 0.0):
+        self.frames = frames
+        self.latency = latency
+
+    def history(self, symbol: str, period: str = None, interval: str = "1d", start=None) -> pd.DataFrame:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.frames.get(symbol, pd.DataFrame())
+
+def synthetic_universe(symbols: int, bars: int, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Random-walk OHLCV frames for `symbols` assets of `bars` bars each"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end=pd.Timestamp('2024-01-01', tz='UTC'), periods=bars, freq='h', name='Date')
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (symbols, bars)), axis=1))
+    spread = np.abs(rng.normal(0, 0.005, (symbols, bars))) * closes
+    volume = rng.integers(1_000, 1_000_000, (symbols, bars)).astype(float)
+    frames = {}
+    for row in range(symbols):
+        frames[f'SYM{row:05d}'] = pd.DataFrame({
+            'Open': closes[row],
+            'High': closes[row] + spread[row],
+            'Low': closes[row] - spread[row],
+            'Close': closes[row],
+            'Volume': volume[row]
+        }, index=index)
+    return frames
+
+def benchmark_config(symbols: List[str], streaming: bool, vectorized: bool):
+    """Config for an analyzer that never touches disk or network"""
+    class BenchmarkConfig(Config):
+        MONITORED_ASSETS = symbols
+        BAR_CACHE_ENABLED = False
+        BULK_FETCH_ENABLED = True
+        STREAMING_INDICATORS_ENABLED = streaming
+        VECTORIZED_ANALYSIS_ENABLED = vectorized
+        INDICATOR_STATE_PATH = ''
+    return BenchmarkConfig
+
+def measure(function: Callable, memory: bool) -> Dict:
+    """Wall time of one call, and its peak traced allocation in a second call"""
+    gc.collect()
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': seconds, 'peak_memory_bytes': peak}
+
+def run_case(symbols: int, bars: int, memory: bool, seed: int = 0) -> List[Dict]:
+    """All phases for one universe size"""
+    frames = synthetic_universe(symbols, bars, seed)
+    names = list(frames)
+    analyzer = TechnicalAnalyzer(benchmark_config(names, False, False), InMemoryProvider(frames))
+    analyses = analyzer.analyze_universe(frames)
+
+    def streaming_seed():
+        for symbol, frame in frames.items():
+            IndicatorEngine.from_config(Config).seed(frame['Close'].iloc[:-1])
+
+    def vectorized():
+        _, closes = build_price_matrix(frames)
+        compute_indicator_matrix(closes)
+
+    phases = {
+        'fetch': lambda: analyzer.get_market_data_bulk(names),
+        'indicators_ta': lambda: [analyzer.analyze_asset(symbol, frame) for symbol, frame in frames.items()],
+        'indicators_streaming_seed': streaming_seed,
+        'indicators_vectorized': vectorized,
+        'signals': lambda: [analyzer.generate_signals(symbol, analysis=analysis) for symbol, analysis in analyses.items()],
+        'analyze_all_assets_ta': TechnicalAnalyzer(benchmark_config(names, False, False), InMemoryProvider(frames)).analyze_all_assets,
+        'analyze_all_assets_vectorized': TechnicalAnalyzer(benchmark_config(names, False, True), InMemoryProvider(frames)).analyze_all_assets
+    }
+
+    results = []
+    for phase, function in phases.items():
+        result = measure(function, memory)
+        result.update({
+            'phase': phase,
+            'symbols': symbols,
+            'bars': bars,
+            'symbols_per_second': symbols / result['seconds'] if result['seconds'] else None,
+            'bars_per_second': symbols * bars / result['seconds'] if result['seconds'] else None
+        })
+        results.append(result)
+        print(f"{phase:<32} symbols={symbols:<6} bars={bars:<7} {result['seconds']:9.4f}s "
+              f"{result['bars_per_second'] or 0:14.0f} bars/s"
+              + (f" peak={result['peak_memory_bytes'] / 2**20:9.1f} MiB" if result['peak_memory_bytes'] is not None else ''))
+    return results
+
+def environment() -> Dict:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor()
+    }
+
+def load_baseline(path: str) -> Dict:
+    with open(path) as f:
+        return {(r['phase'], r['symbols'], r['bars']): r for r in json.load(f)['results']}
+
+def compare(current: List[Dict], baseline: Dict, baseline_path: str):
+    """Print the time ratio of every phase against a previous results file"""
+    print(f"\nCompared with {baseline_path} (ratio > 1 is slower):")
+    for result in current:
+        previous = baseline.get((result['phase'], result['symbols'], result['bars']))
+        if previous and previous['seconds']:
+            print(f"{result['phase']:<32} symbols={result['symbols']:<6} bars={result['bars']:<7} "
+                  f"{result['seconds'] / previous['seconds']:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the technical-analysis hot path')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--bars', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--max-cells', type=float, default=1e7,
+                        help='Skip sizes whose symbols x bars exceeds this')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the peak memory pass')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help='Previous results file to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Read the baseline before this run's results can overwrite it
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    results = []
+    skipped = []
+    for symbols in args.symbols:
+        for bars in args.bars:
+            if symbols * bars > args.max_cells:
+                skipped.append({'symbols': symbols, 'bars': bars})
+                continue
+            results.extend(run_case(symbols, bars, not args.no_memory, args.seed))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results, 'skipped': skipped}, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}"
+          + (f" ({len(skipped)} sizes skipped by --max-cells)" if skipped else ''))
+
+    if baseline is not None:
+        compare(results, baseline, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Benchmarks for the dashboard and bot database queries
+
+Seeds a database with synthetic users, subscriptions, signals and
+notifications (1M signals and 100k users by default), then times the queries
+behind /dashboard, /signals, /subscribers, the expiry check and the
+subscriber index, first without the indexes added by the migrations and then
+with them. Deep pages of the signal and subscriber lists are timed with the
+old OFFSET queries and with the keyset queries that replaced them:
+
+    python -m benchmarks.database
+    python -m benchmarks.database --signals 100000 --users 10000 --explain
+    python -m benchmarks.database --database postgresql://localhost/bench --reuse
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import migrations
+from benchmarks.analysis import environment
+from models import db, User, Subscription, Signal, Performance, Notification, SubscriptionStatus, SignalType, TradeOutcome
+from pagination import encode_cursor, keyset_paginate
+from user_search import user_search_filter
+
+CHUNK_SIZE = 50_000
+PER_PAGE = 20
+SIGNALS_DEEP_PAGE = 10_000
+SUBSCRIBERS_DEEP_PAGE = 2_500
+
+def _insert_chunks(connection, table, rows: Callable[[int, int], List[Dict]], total: int):
+    for start in range(0, total, CHUNK_SIZE):
+        connection.execute(sa.insert(table), rows(start, min(start + CHUNK_SIZE, total)))
+
+def seed(engine, users: int, signals: int, notifications: int, seed: int = 0):
+    """Fill empty tables with synthetic rows spread over the last two years"""
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    span = timedelta(days=730).total_seconds()
+    statuses = list(SubscriptionStatus)
+    outcomes = [TradeOutcome.WIN, TradeOutcome.LOSS, TradeOutcome.PENDING]
+    symbols = [f'SYM{i:03d}' for i in range(200)]
+
+    join_offsets = rng.uniform(0, span, users)
+    subscription_status = rng.choice(len(statuses), users, p=[0.2, 0.4, 0.35, 0.05])
+    # Trials and active subscriptions end in the future, the others have ended
+    end_offsets = np.where(subscription_status < 2, rng.uniform(0, span / 8, users), -rng.uniform(0, span / 4, users))
+    signal_offsets = rng.uniform(0, span, signals)
+    signal_outcomes = rng.choice(len(outcomes), signals, p=[0.55, 0.44, 0.01])
+    signal_symbols = rng.integers(0, len(symbols), signals)
+    notification_users = rng.integers(1, users + 1, notifications)
+    notification_offsets = rng.uniform(0, span, notifications)
+
+    with engine.begin() as connection:
+        _insert_chunks(connection, User.__table__, lambda start, stop: [
+            {'id': i + 1, 'telegram_id': str(10_000_000 + i), 'username': f'user{i}', 'first_name': f'First{i}',
+             'last_name': f'Last{i}', 'join_date': now - timedelta(seconds=join_offsets[i]), 'is_admin': False}
+            for i in range(start, stop)
+        ], users)
+        _insert_chunks(connection, Subscription.__table__, lambda start, stop: [
+            {'id': i + 1, 'user_id': i + 1, 'status': statuses[subscription_status[i]],
+             'start_date': now - timedelta(seconds=join_offsets[i]), 'end_date': now + timedelta(seconds=end_offsets[i]),
+             'payment_amount': 29.99, 'payment_method': 'manual'}
+            for i in range(start, stop)
+        ], users)
+        _insert_chunks(connection, Signal.__table__, lambda start, stop: [
+            {'id': i + 1, 'asset_symbol': symbols[signal_symbols[i]],
+             'signal_type': SignalType.BUY if i % 2 else SignalType.SELL,
+             'entry_price': 100.0, 'target_price': 105.0, 'stop_loss': 97.0, 'content': 'Synthetic benchmark signal',
+             'strategy_used': 'RSI', 'timestamp': now - timedelta(seconds=signal_offsets[i]),
+             'outcome': outcomes[signal_outcomes[i]], 'profit_loss': None, 'closed_at': None}
+            for i in range(start, stop)
+        ], signals)
+        _insert_chunks(connection, Notification.__table__, lambda start, stop: [
+            {'id': i + 1, 'user_id': int(notification_users[i]), 'message': 'Synthetic notification',
+             'notification_type': 'signal', 'sent_at': now - timedelta(seconds=notification_offsets[i]), 'is_read': False}
+            for i in range(start, stop)
+        ], notifications)
+        connection.execute(sa.insert(Performance.__table__), [
+            {'date': (now - timedelta(days=day)).date(), 'total_signals': 100, 'winning_signals': 55,
+             'losing_signals': 45, 'total_profit': 0.0, 'success_rate': 55.0}
+            for day in range(730)
+        ])
+
+def _offset(page: int, rows: int) -> int:
+    # The deepest page that exists if the tables are smaller than the page asked for
+    return max(0, min((page - 1) * PER_PAGE, rows - PER_PAGE))
+
+def deep_cursors(engine, users: int, signals: int) -> Dict[str, str]:
+    """Cursors that the keyset queries continue from to reach the deep pages"""
+    with Session(engine) as session:
+        signal = session.execute(
+            sa.select(Signal.timestamp, Signal.id).order_by(Signal.timestamp.desc(), Signal.id.desc())
+            .offset(_offset(SIGNALS_DEEP_PAGE, signals) - 1 if signals > PER_PAGE else 0).limit(1)).first()
+        user = session.execute(
+            sa.select(User.join_date, User.id).order_by(User.join_date.desc(), User.id.desc())
+            .offset(_offset(SUBSCRIBERS_DEEP_PAGE, users) - 1 if users > PER_PAGE else 0).limit(1)).first()
+    return {'signals': encode_cursor(*signal), 'subscribers': encode_cursor(*user)}
+
+def queries(users: int, signals: int, cursors: Dict[str, str]) -> Dict[str, Callable[[Session], object]]:
+    """The application's queries, written as the routes and the bot issue them"""
+    active = [SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE]
+    some_user = max(1, users // 2)
+
+    def subscribers_page(session):
+        page = session.scalars(sa.select(User).order_by(User.join_date.desc()).limit(20)).all()
+        # subscribers.html reads each user's subscription
+        return [session.scalars(sa.select(Subscription).filter_by(user_id=user.id)).first() for user in page]
+
+    return {
+        'dashboard': lambda session: (
+            session.scalar(sa.select(sa.func.count()).select_from(User)),
+            session.scalar(sa.select(sa.func.count()).select_from(Subscription).where(Subscription.status.in_(active))),
+            session.scalar(sa.select(sa.func.count()).select_from(Signal)),
+            session.scalars(sa.select(Performance).order_by(Performance.date.desc()).limit(7)).all()
+        ),
+        'signals_first_page': lambda session: session.scalars(
+            sa.select(Signal).order_by(Signal.timestamp.desc()).limit(20)).all(),
+        'signals_deep_page_offset': lambda session: session.scalars(
+            sa.select(Signal).order_by(Signal.timestamp.desc()).limit(PER_PAGE)
+            .offset(_offset(SIGNALS_DEEP_PAGE, signals))).all(),
+        'signals_deep_page_keyset': lambda session: keyset_paginate(
+            session.query(Signal), Signal.timestamp, Signal.id, after=cursors['signals']).items,
+        'subscribers_first_page': subscribers_page,
+        'subscribers_deep_page_offset': lambda session: session.scalars(
+            sa.select(User).order_by(User.join_date.desc()).limit(PER_PAGE)
+            .offset(_offset(SUBSCRIBERS_DEEP_PAGE, users))).all(),
+        'subscribers_deep_page_keyset': lambda session: keyset_paginate(
+            session.query(User), User.join_date, User.id, after=cursors['subscribers']).items,
+        'subscribers_search': lambda session: keyset_paginate(
+            session.query(User).filter(user_search_filter('user123', session)), User.join_date, User.id).items,
+        'expiring_subscriptions': lambda session: session.execute(
+            sa.select(User.telegram_id, Subscription.end_date).join(User, Subscription.user_id == User.id).where(
+                Subscription.end_date <= datetime.utcnow() + timedelta(days=3),
+                Subscription.status.in_(active))).all(),
+        'subscriber_index_load': lambda session: session.execute(
+            sa.select(User.telegram_id, Subscription.end_date).join(Subscription, Subscription.user_id == User.id).where(
+                Subscription.status.in_(active))).all(),
+        'pending_signals': lambda session: session.execute(
+            sa.select(Signal.id, Signal.asset_symbol).where(Signal.outcome == TradeOutcome.PENDING)).all(),
+        'user_notifications': lambda session: session.scalars(
+            sa.select(Notification).where(Notification.user_id == some_user)
+            .order_by(Notification.sent_at.desc()).limit(20)).all()
+    }
+
+def time_queries(engine, users: int, signals: int, cursors: Dict[str, str], repeat: int) -> Dict[str, float]:
+    """Median seconds of each query over `repeat` runs, after one warm-up run"""
+    timings = {}
+    for name, query in queries(users, signals, cursors).items():
+        samples = []
+        for run in range(repeat + 1):
+            with Session(engine) as session:
+                started = time.perf_counter()
+                query(session)
+                if run:
+                    samples.append(time.perf_counter() - started)
+        timings[name] = statistics.median(samples)
+    return timings
+
+def explain(engine, users: int, signals: int, cursors: Dict[str, str]):
+    """Print the plan of each query's first statement (SQLite and PostgreSQL)"""
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    for name, query in queries(users, signals, cursors).items():
+        statements = []
+
+        def record(connection, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        sa.event.listen(engine, 'before_cursor_execute', record)
+        try:
+            with Session(engine) as session:
+                query(session)
+        finally:
+            sa.event.remove(engine, 'before_cursor_execute', record)
+
+        print(f"\n{name}")
+        statement, parameters = statements[0]
+        with engine.connect() as connection:
+            for row in connection.exec_driver_sql(prefix + statement, parameters):
+                print(f"    {row[-1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard and bot database queries')
+    parser.add_argument('--database', default=None, help='SQLAlchemy URL of an empty database (default: a temporary SQLite file)')
+    parser.add_argument('--reuse', action='store_true', help='Use the rows already in --database instead of seeding')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--signals', type=int, default=1_000_000)
+    parser.add_argument('--notifications', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--explain', action='store_true', help='Print query plans with and without the indexes')
+    parser.add_argument('--output', default='database_benchmark_results.json')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    temporary = None
+    if args.database is None:
+        temporary = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temporary.close()
+        args.database = f"sqlite:///{temporary.name}"
+    engine = sa.create_engine(args.database)
+
+    try:
+        db.metadata.create_all(engine)
+        if not args.reuse:
+            started = time.perf_counter()
+            seed(engine, args.users, args.signals, args.notifications, args.seed)
+            print(f"Seeded {args.users} users, {args.signals} signals and {args.notifications} notifications "
+                  f"in {time.perf_counter() - started:.1f}s")
+
+        # Measure the schema as it was before the index migrations
+        with engine.begin() as connection:
+            for table, name, columns in migrations.QUERY_INDEXES:
+                migrations.drop_index(connection, table, name, columns)
+            migrations.drop_user_search(connection)
+            connection.execute(sa.delete(migrations.SchemaVersion))
+        with engine.connect() as connection:
+            users = connection.scalar(sa.select(sa.func.count()).select_from(User))
+            signals = connection.scalar(sa.select(sa.func.count()).select_from(Signal))
+        cursors = deep_cursors(engine, users, signals)
+        if args.explain:
+            print("\nPlans without indexes:")
+            explain(engine, users, signals, cursors)
+        before = time_queries(engine, users, signals, cursors, args.repeat)
+
+        started = time.perf_counter()
+        migrations.upgrade(engine)
+        migration_seconds = time.perf_counter() - started
+        if args.explain:
+            print("\nPlans with indexes:")
+            explain(engine, users, signals, cursors)
+        after = time_queries(engine, users, signals, cursors, args.repeat)
+    finally:
+        engine.dispose()
+        if temporary:
+            os.unlink(temporary.name)
+
+    print(f"\nMigrations applied in {migration_seconds:.1f}s\n")
+    print(f"{'query':<30} {'before':>12} {'after':>12} {'speedup':>9}")
+    results = []
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else None
+        print(f"{name:<30} {before[name] * 1000:10.2f}ms {after[name] * 1000:10.2f}ms {speedup or 0:8.1f}x")
+        results.append({'query': name, 'before_seconds': before[name], 'after_seconds': after[name], 'speedup': speedup})
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': environment(),
+            'database': engine.dialect.name,
+            'rows': {'users': args.users, 'signals': args.signals, 'notifications': args.notifications},
+            'migration_seconds': migration_seconds,
+            'results': results
+        }, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Subscription, Signal, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+class BotDatabase:
+    """Runs the bot's blocking database work off its event loop
+
+    Calls go to a dedicated thread pool. Each call gets its own Flask
+    application context, and therefore its own SQLAlchemy session, which is
+    removed when the call returns. Query functions must return plain data
+    rather than ORM objects, since those are detached once their session
+    closes.
+    """
+
+    def __init__(self, app, workers: int = 8):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-db')
+
+    def _call(self, function, args, kwargs):
+        if self.app is None:
+            return function(*args, **kwargs)
+        with self.app.app_context():
+            return function(*args, **kwargs)
+
+    async def run(self, function, *args, **kwargs):
+        """Run `function(*args, **kwargs)` in the database pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, function, args, kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def _profile(user: User) -> Dict:
+    subscription = user.subscription
+    return {
+        'id': user.id,
+        'telegram_id': user.telegram_id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'join_date': user.join_date,
+        'subscription': {
+            'status': subscription.status,
+            'start_date': subscription.start_date,
+            'end_date': subscription.end_date,
+            'payment_amount': subscription.payment_amount,
+            'days_remaining': subscription.days_remaining(),
+            'active': subscription.is_active()
+        } if subscription else None
+    }
+
+def get_user_profile(telegram_id: str) -> Optional[Dict]:
+    """A user and their subscription as plain data, or None if not registered"""
+    user = User.query.options(db.joinedload(User.subscription)).filter_by(telegram_id=telegram_id).first()
+    return _profile(user) if user else None
+
+def register_user(telegram_id: str, username: Optional[str], first_name: Optional[str],
+                  last_name: Optional[str], trial_days: int) -> Tuple[Dict, bool]:
+    """Get or create a user with a trial subscription; returns (profile, created)"""
+    profile = get_user_profile(telegram_id)
+    if profile:
+        return profile, False
+
+    user = User(telegram_id=telegram_id, username=username, first_name=first_name, last_name=last_name)
+    user.subscription = Subscription(
+        status=SubscriptionStatus.TRIAL,
+        end_date=datetime.utcnow() + timedelta(days=trial_days)
+    )
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same user pressed /start twice at once; the other call registered them
+        db.session.rollback()
+        return get_user_profile(telegram_id), False
+    return _profile(user), True
+
+def activate_subscription(telegram_id: str, days: int, price: float) -> Optional[Dict]:
+    """Start a paid subscription of `days` for a registered user"""
+    user = User.query.filter_by(telegram_id=telegram_id).first()
+    if not user:
+        return None
+
+    subscription = user.subscription
+    if not subscription:
+        subscription = Subscription(user_id=user.id)
+        db.session.add(subscription)
+
+    subscription.status = SubscriptionStatus.ACTIVE
+    subscription.start_date = datetime.utcnow()
+    subscription.end_date = datetime.utcnow() + timedelta(days=days)
+    subscription.payment_amount = price
+    subscription.payment_method = "manual"
+    db.session.commit()
+    return _profile(user)
+
+def get_recent_signals(limit: int = 5) -> List[Dict]:
+    """Latest signals as plain data, newest first"""
+    signals = Signal.query.order_by(Signal.timestamp.desc()).limit(limit).all()
+    return [
+        {
+            'asset_symbol': signal.asset_symbol,
+            'signal_type': signal.signal_type,
+            'entry_price': signal.entry_price,
+            'target_price': signal.target_price,
+            'stop_loss': signal.stop_loss,
+            'content': signal.content,
+            'timestamp': signal.timestamp,
+            'outcome': signal.outcome
+        }
+        for signal in signals
+    ]
+
+def get_expiring_subscribers(warning_days: int) -> List[Tuple[str, int]]:
+    """(telegram_id, days_left) of active subscriptions ending within `warning_days`"""
+    warning_date = datetime.utcnow() + timedelta(days=warning_days)
+    subscriptions = Subscription.query.options(db.joinedload(Subscription.user)).filter(
+        Subscription.end_date <= warning_date,
+        Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE])
+    ).all()
+    return [
+        (subscription.user.telegram_id, subscription.days_remaining())
+        for subscription in subscriptions
+        if subscription.is_active() and subscription.days_remaining() <= warning_days
+    ]
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ChartPayload, Performance
+
+logger = logging.getLogger(__name__)
+
+def _daily_totals(days: int) -> List[Performance]:
+    return Performance.query.filter(
+        Performance.strategy.is_(None), Performance.asset_symbol.is_(None)
+    ).order_by(Performance.date.desc()).limit(days).all()
+
+def _layout(title: str, xaxis_title: str, yaxis_title: str, **extra) -> Dict:
+    layout = {
+        'title': {'text': title},
+        'xaxis': {'title': {'text': xaxis_title}},
+        'yaxis': {'title': {'text': yaxis_title}}
+    }
+    layout.update(extra)
+    return layout
+
+def _performance_chart() -> Dict:
+    performance = _daily_totals(7)
+    return {
+        'data': [{
+            'type': 'scatter', 'mode': 'lines+markers', 'name': 'Success Rate',
+            'x': [p.date.strftime('%Y-%m-%d') for p in performance],
+            'y': [p.success_rate for p in performance]
+        }],
+        'layout': _layout('Success Rate (Last 7 Days)', 'Date', 'Success Rate (%)')
+    }
+
+def _success_rate_chart() -> Dict:
+    performance = _daily_totals(30)
+    return {
+        'data': [{
+            'type': 'scatter', 'mode': 'lines+markers', 'name': 'Success Rate',
+            'x': [p.date.strftime('%Y-%m-%d') for p in performance],
+            'y': [p.success_rate for p in performance]
+        }],
+        'layout': _layout('Success Rate Over Time', 'Date', 'Success Rate (%)')
+    }
+
+def _signals_chart() -> Dict:
+    performance = _daily_totals(30)
+    dates = [p.date.strftime('%Y-%m-%d') for p in performance]
+    return {
+        'data': [
+            {'type': 'bar', 'name': 'Total Signals', 'x': dates, 'y': [p.total_signals for p in performance]},
+            {'type': 'bar', 'name': 'Winning Signals', 'x': dates, 'y': [p.winning_signals for p in performance]}
+        ],
+        'layout': _layout('Signals Performance', 'Date', 'Number of Signals', barmode='group')
+    }
+
+# Charts served by /api/charts/<name>; the dashboard shows 'performance',
+# analytics the other two
+CHARTS: Dict[str, Callable[[], Dict]] = {
+    'performance': _performance_chart,
+    'success_rate': _success_rate_chart,
+    'signals': _signals_chart,
+}
+
+def refresh_charts() -> List[str]:
+    """Recompute every chart from the Performance rows; returns the names that changed
+
+    Writes in the current session without committing, so callers store the
+    charts in the same transaction as the rollup they were computed from. A
+    chart whose JSON is unchanged keeps its ETag and `updated_at`, so browsers
+    holding it keep getting 304s.
+    """
+    changed = []
+    now = datetime.utcnow()
+    for name, build in CHARTS.items():
+        payload = json.dumps(build(), separators=(',', ':'))
+        etag = hashlib.sha1(payload.encode()).hexdigest()
+        chart = db.session.get(ChartPayload, name)
+        if chart is None:
+            db.session.add(ChartPayload(name=name, payload=payload, etag=etag, updated_at=now))
+        elif chart.etag != etag:
+            chart.payload, chart.etag, chart.updated_at = payload, etag, now
+        else:
+            continue
+        changed.append(name)
+    if changed:
+        logger.info(f"Refreshed charts: {', '.join(changed)}")
+    return changed
+
+def get_chart(name: str) -> Optional[ChartPayload]:
+    """The stored chart `name`, computed first if it has never been stored"""
+    if name not in CHARTS:
+        return None
+    chart = db.session.get(ChartPayload, name)
+    if chart is None:
+        try:
+            refresh_charts()
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the charts first
+            db.session.rollback()
+        chart = db.session.get(ChartPayload, name)
+    return chart
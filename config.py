@@ -7,6 +7,18 @@ class Config:
     # Telegram Bot Configuration
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')
+    # Bot API server, e.g. a local one or fake_telegram.py; empty uses api.telegram.org
+    TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+    
+    # How the bot receives updates: 'polling' or 'webhook'
+    BOT_UPDATE_MODE = os.getenv('BOT_UPDATE_MODE', 'polling').lower()
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 1))
     ADMIN_USER_ID = os.getenv('ADMIN_USER_ID')
     
     # Database Configuration
@@ -27,6 +39,29 @@ class Config:
     MACD_FAST = int(os.getenv('MACD_FAST', 12))
     MACD_SLOW = int(os.getenv('MACD_SLOW', 26))
     MACD_SIGNAL = int(os.getenv('MACD_SIGNAL', 9))
+    STREAMING_INDICATORS_ENABLED = os.getenv('STREAMING_INDICATORS_ENABLED', 'False').lower() == 'true'
+    INDICATOR_STATE_PATH = os.getenv('INDICATOR_STATE_PATH', 'data/indicator_state.json')
+    VECTORIZED_ANALYSIS_ENABLED = os.getenv('VECTORIZED_ANALYSIS_ENABLED', 'False').lower() == 'true'
+    
+    # Multi-timeframe analysis: the base interval is downloaded once and resampled
+    # into every analysis timeframe; the first timeframe is the one signals come from
+    MULTI_TIMEFRAME_ENABLED = os.getenv('MULTI_TIMEFRAME_ENABLED', 'False').lower() == 'true'
+    BASE_INTERVAL = os.getenv('BASE_INTERVAL', '1h')
+    BASE_PERIOD = os.getenv('BASE_PERIOD', '3mo')
+    ANALYSIS_TIMEFRAMES = [tf.strip() for tf in os.getenv('ANALYSIS_TIMEFRAMES', '1h,4h,1d').split(',') if tf.strip()]
+    
+    # Trade levels used to evaluate signals (percent from entry)
+    SIGNAL_TARGET_PCT = float(os.getenv('SIGNAL_TARGET_PCT', 2.0))
+    SIGNAL_STOP_LOSS_PCT = float(os.getenv('SIGNAL_STOP_LOSS_PCT', 1.0))
+    BACKTEST_MAX_HOLDING_BARS = int(os.getenv('BACKTEST_MAX_HOLDING_BARS', 20))
+    SIGNAL_MAX_OPEN_DAYS = int(os.getenv('SIGNAL_MAX_OPEN_DAYS', 30))
+    OUTCOME_BAR_INTERVAL = os.getenv('OUTCOME_BAR_INTERVAL', '1d')
+    OUTCOME_RESOLVER_INTERVAL_MINUTES = int(os.getenv('OUTCOME_RESOLVER_INTERVAL_MINUTES', 60))
+    
+    # Strategy parameter optimization
+    OPTIMIZER_WORKERS = int(os.getenv('OPTIMIZER_WORKERS', 0))  # 0 uses every CPU core
+    OPTIMIZER_METRIC = os.getenv('OPTIMIZER_METRIC', 'total_return')  # total_return, win_rate, average_return
+    OPTIMIZER_MIN_TRADES = int(os.getenv('OPTIMIZER_MIN_TRADES', 30))
     
     # Assets to monitor
     MONITORED_ASSETS = [
@@ -34,9 +69,63 @@ class Config:
         'EURUSD=X', 'GBPUSD=X', 'USDJPY=X'
     ]
     
+    # Market data fetching
+    MARKET_DATA_PROVIDER = os.getenv('MARKET_DATA_PROVIDER', 'yfinance')  # yfinance, replay
+    REPLAY_DATA_DIR = os.getenv('REPLAY_DATA_DIR', 'data/replay')
+    REPLAY_SPEED = float(os.getenv('REPLAY_SPEED', 0))
+    BULK_FETCH_ENABLED = os.getenv('BULK_FETCH_ENABLED', 'True').lower() == 'true'
+    FETCH_BATCH_SIZE = int(os.getenv('FETCH_BATCH_SIZE', 50))
+    FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', 8))
+    FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', 30))
+    BAR_CACHE_ENABLED = os.getenv('BAR_CACHE_ENABLED', 'True').lower() == 'true'
+    BAR_CACHE_DIR = os.getenv('BAR_CACHE_DIR', 'data/bars')
+    
     # Signal intervals (in minutes)
     SIGNAL_INTERVAL = int(os.getenv('SIGNAL_INTERVAL', 60))
     
+    # Threads running the bot's database queries off its event loop
+    BOT_DB_WORKERS = int(os.getenv('BOT_DB_WORKERS', 8))
+    # Updates handled at the same time (1 processes them one by one)
+    BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', 64))
+    # Rendered /signals and /status replies (seconds, responses)
+    RENDER_CACHE_TTL = float(os.getenv('RENDER_CACHE_TTL', 60))
+    RENDER_CACHE_MAX_ENTRIES = int(os.getenv('RENDER_CACHE_MAX_ENTRIES', 50000))
+    
+    # Telegram delivery limits (Telegram allows about 30 messages per second per bot
+    # and one per second per chat)
+    DELIVERY_RATE_LIMIT = float(os.getenv('DELIVERY_RATE_LIMIT', 25))
+    DELIVERY_PER_CHAT_INTERVAL = float(os.getenv('DELIVERY_PER_CHAT_INTERVAL', 1.0))
+    DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', 50))
+    DELIVERY_MAX_RETRIES = int(os.getenv('DELIVERY_MAX_RETRIES', 3))
+    
+    # Outbox of queued Telegram messages, drained on the bot's event loop
+    OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 200))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1.0))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_RETRY_BACKOFF = float(os.getenv('OUTBOX_RETRY_BACKOFF', 30))
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 300))
+    # Worker processes that fan signals and broadcasts out, each for the
+    # subscribers whose telegram_id hashes to it (0 sends from the bot process)
+    DELIVERY_SHARDS = int(os.getenv('DELIVERY_SHARDS', 0))
+    
+    # Seconds the dashboard totals are reused between counts
+    DASHBOARD_COUNTERS_TTL = float(os.getenv('DASHBOARD_COUNTERS_TTL', 30))
+    
+    # Bearer token required to scrape /metrics (empty leaves it open)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    
+    # Full reload of the in-memory active subscriber index
+    SUBSCRIBER_INDEX_REFRESH_MINUTES = int(os.getenv('SUBSCRIBER_INDEX_REFRESH_MINUTES', 60))
+    
+    # Signal delivery: 'individual' sends each signal as its own message, 'digest'
+    # groups the signals of an analysis run (or a window of runs) into one message
+    SIGNAL_DELIVERY_MODE = os.getenv('SIGNAL_DELIVERY_MODE', 'individual').lower()
+    DIGEST_WINDOW_MINUTES = float(os.getenv('DIGEST_WINDOW_MINUTES', 0))
+    DIGEST_URGENT_STRENGTHS = [s.strip() for s in os.getenv('DIGEST_URGENT_STRENGTHS', 'strong').split(',') if s.strip()]
+    
     # Notification settings
     ENABLE_NOTIFICATIONS = os.getenv('ENABLE_NOTIFICATIONS', 'True').lower() == 'true'
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 500))
+    NOTIFICATION_FLUSH_SECONDS = float(os.getenv('NOTIFICATION_FLUSH_SECONDS', 5.0))
     SUBSCRIPTION_WARNING_DAYS = int(os.getenv('SUBSCRIPTION_WARNING_DAYS', 1)) 
\ No newline at end of file
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User, Subscription, Signal, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+class DashboardCounters:
+    """Dashboard totals, counted in one query and cached for `ttl` seconds
+
+    Commits that add or remove users or signals, or change a subscription,
+    drop the cached totals so the next read recounts. Changes committed by
+    other processes show up once the TTL runs out. Concurrent readers of an
+    expired value wait for a single recount instead of each running one.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._values: Optional[Dict] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _count(self) -> Dict:
+        active = [SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE]
+        total_users, active_subscriptions, total_signals = db.session.query(
+            db.select(db.func.count()).select_from(User).scalar_subquery(),
+            db.select(db.func.count()).select_from(Subscription).where(Subscription.status.in_(active)).scalar_subquery(),
+            db.select(db.func.count()).select_from(Signal).scalar_subquery()
+        ).one()
+        return {
+            'total_users': total_users,
+            'active_subscriptions': active_subscriptions,
+            'total_signals': total_signals,
+            'counted_at': datetime.utcnow().isoformat()
+        }
+
+    def _cached(self) -> Optional[Dict]:
+        with self._lock:
+            if self._values is not None and time.monotonic() < self._expires_at:
+                return self._values
+        return None
+
+    def get(self) -> Dict:
+        """Current totals; must run inside an application context"""
+        values = self._cached()
+        if values is not None:
+            return values
+        with self._refresh_lock:
+            values = self._cached()
+            if values is not None:
+                return values
+            with self._lock:
+                generation = self._generation
+            values = self._count()
+            with self._lock:
+                # A commit during the count makes the result stale; use it once but don't keep it
+                if generation == self._generation:
+                    self._values = values
+                    self._expires_at = time.monotonic() + self.ttl
+            return values
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+            self._generation += 1
+
+# Shared by the dashboard and /api/stats
+dashboard_counters = DashboardCounters()
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Signal, 'after_insert')
+@event.listens_for(Signal, 'after_delete')
+@event.listens_for(Subscription, 'after_insert')
+@event.listens_for(Subscription, 'after_update')
+@event.listens_for(Subscription, 'after_delete')
+def _counted_row_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['dashboard_counts_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('dashboard_counts_changed', False):
+        dashboard_counters.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('dashboard_counts_changed', None)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of a single send
+DELIVERED = 'delivered'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+# Telegram accepts 4096 characters per message; the margin covers emoji
+# counted as two
+MAX_MESSAGE_LENGTH = 4000
+
+# BadRequest messages meaning the chat can never be reached again
+UNREACHABLE_CHAT_ERRORS = ('chat not found', 'user is deactivated', 'peer_id_invalid')
+
+SEND_SECONDS = REGISTRY.histogram(
+    'delivery_send_seconds', 'Time to send one message, including rate-limit waits and retries',
+    ['category', 'outcome']
+)
+SEND_RETRIES = REGISTRY.counter('delivery_retries_total', 'Send attempts repeated after a transient error', ['category', 'reason'])
+SEND_FAILURES = REGISTRY.counter('delivery_failures_total', 'Messages that were not delivered, by error', ['category', 'reason'])
+FANOUT_SECONDS = REGISTRY.histogram(
+    'delivery_fanout_seconds', 'Time from a signal, digest or broadcast being queued to its last recipient', ['category']
+)
+QUEUE_LATENCY_SECONDS = REGISTRY.histogram(
+    'delivery_latency_seconds', 'Time from a message being queued in the outbox to its delivery', ['category']
+)
+
+def format_signal_message(signal_data: dict, heading: str) -> str:
+    """Markdown text of a signal as sent to the channel and to subscribers"""
+    signal_type_emoji = {"BUY": "🟢", "SELL": "🔴"}
+    
+    message = f"""
+{signal_type_emoji[signal_data['type']]} **{heading}**
+
+**Asset:** {signal_data['symbol']}
+**Strategy:** {signal_data['strategy']}
+**Price:** ${signal_data['price']:.2f}
+**Strength:** {signal_data['strength'].title()}
+
+**Reason:**
+{signal_data['reason']}
+
+⏰ {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
+    """
+    return message.strip()
+
+def format_digest_messages(signals: List[dict]) -> List[str]:
+    """Markdown digest of several signals, one line each, split to fit Telegram's length limit"""
+    signal_type_emoji = {"BUY": "🟢", "SELL": "🔴"}
+    header = f"📋 **SIGNAL DIGEST** ({len(signals)} signals)\n"
+    footer = f"\n⏰ {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+    
+    messages = []
+    lines: List[str] = []
+    for signal_data in signals:
+        line = (f"{signal_type_emoji[signal_data['type']]} **{signal_data['type']} {signal_data['symbol']}** "
+                f"${signal_data['price']:.2f} · {signal_data['strategy']} ({signal_data['strength'].title()})")
+        if lines and len(header) + len(footer) + sum(len(l) + 1 for l in lines) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            messages.append(header + "\n" + "\n".join(lines) + footer)
+            lines = []
+        lines.append(line)
+    if lines:
+        messages.append(header + "\n" + "\n".join(lines) + footer)
+    return messages
+
+class TokenBucket:
+    """Asyncio token bucket shared by every send of a bot
+
+    Tokens refill at `rate` per second up to `capacity`. `pause` empties the
+    bucket until a deadline, which is how a flood-control RetryAfter from
+    Telegram is applied to all in-flight sends at once.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now < self.paused_until:
+            self.updated = now
+            return
+        start = max(self.updated, self.paused_until)
+        self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class MessageDispatcher:
+    """Concurrent Telegram sender that stays inside the platform's rate limits
+
+    Sends run concurrently (at most `concurrency` in flight) but each one takes
+    a token from a global bucket refilling at `rate` messages per second, and
+    consecutive messages to the same chat are spaced `per_chat_interval`
+    seconds apart. RetryAfter pauses the whole bucket for the requested time;
+    timeouts and network errors are retried with exponential backoff. Chats
+    that blocked the bot or no longer exist are reported as blocked and not
+    retried.
+    """
+
+    def __init__(self, bot, rate: float = 25.0, per_chat_interval: float = 1.0,
+                 concurrency: int = 50, max_retries: int = 3, backoff: float = 1.0):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._next_chat_send: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, bot, config, share: float = 1.0) -> 'MessageDispatcher':
+        """Dispatcher using `share` of the configured rate and concurrency"""
+        return cls(
+            bot,
+            rate=config.DELIVERY_RATE_LIMIT * share,
+            per_chat_interval=config.DELIVERY_PER_CHAT_INTERVAL,
+            concurrency=max(1, int(config.DELIVERY_CONCURRENCY * share)),
+            max_retries=config.DELIVERY_MAX_RETRIES
+        )
+
+    async def _wait_for_chat(self, chat_id: str):
+        """Reserve the next send slot of a chat and sleep until it opens"""
+        now = time.monotonic()
+        slot = max(now, self._next_chat_send.get(chat_id, 0.0))
+        self._next_chat_send[chat_id] = slot + self.per_chat_interval
+        if len(self._next_chat_send) > 100_000:
+            self._next_chat_send = {chat: at for chat, at in self._next_chat_send.items() if at > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def send(self, chat_id, text: str, category: str = 'message',
+                   queued_at: Optional[datetime] = None, **kwargs) -> str:
+        """Send one message, retrying where it makes sense; returns DELIVERED, FAILED or BLOCKED
+
+        `category` labels the message in the delivery metrics, and `queued_at`
+        (UTC) is when it entered the outbox, for the end-to-end latency.
+        """
+        started = time.monotonic()
+        result, error = await self._send(str(chat_id), text, category, kwargs)
+        SEND_SECONDS.observe(time.monotonic() - started, category=category, outcome=result)
+        if error is not None:
+            SEND_FAILURES.inc(category=category, reason=type(error).__name__)
+        elif queued_at is not None:
+            QUEUE_LATENCY_SECONDS.observe((datetime.utcnow() - queued_at).total_seconds(), category=category)
+        return result
+
+    async def _send(self, chat_id: str, text: str, category: str, kwargs: Dict):
+        """(outcome, error that decided it)"""
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                await self._wait_for_chat(chat_id)
+                await self.bucket.acquire()
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    return DELIVERED, None
+                except RetryAfter as e:
+                    retry_after = e.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    logger.warning(f"Flood control hit sending to {chat_id}, pausing sends for {retry_after}s")
+                    self.bucket.pause(float(retry_after))
+                    if attempt >= self.max_retries:
+                        return FAILED, e
+                    SEND_RETRIES.inc(category=category, reason=type(e).__name__)
+                except Forbidden as e:
+                    logger.info(f"Chat {chat_id} is unreachable: {e}")
+                    return BLOCKED, e
+                except BadRequest as e:
+                    if any(error in str(e).lower() for error in UNREACHABLE_CHAT_ERRORS):
+                        logger.info(f"Chat {chat_id} is unreachable: {e}")
+                        return BLOCKED, e
+                    logger.error(f"Error sending message to {chat_id}: {e}")
+                    return FAILED, e
+                except (TimedOut, NetworkError) as e:
+                    if attempt >= self.max_retries:
+                        logger.error(f"Error sending message to {chat_id} after {attempt + 1} attempts: {e}")
+                        return FAILED, e
+                    SEND_RETRIES.inc(category=category, reason=type(e).__name__)
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                except Exception as e:
+                    logger.error(f"Error sending message to {chat_id}: {e}")
+                    return FAILED, e
+                attempt += 1
+
+    async def broadcast(self, chat_ids: Iterable, text: str, category: str = 'broadcast',
+                        queued_at: Optional[datetime] = None, **kwargs) -> Dict:
+        """Send the same message to many chats concurrently
+
+        Returns delivered, failed and blocked counts plus the lists of failed
+        and blocked chat ids, so callers can retry or stop targeting them.
+        """
+        chat_ids = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids))
+        started = time.monotonic()
+        results = await asyncio.gather(*(self.send(chat_id, text, category, queued_at, **kwargs) for chat_id in chat_ids))
+        if chat_ids:
+            FANOUT_SECONDS.observe(time.monotonic() - started, category=category)
+
+        report = {DELIVERED: 0, FAILED: 0, BLOCKED: 0, 'failed_chats': [], 'blocked_chats': []}
+        for chat_id, result in zip(chat_ids, results):
+            report[result] += 1
+            if result == FAILED:
+                report['failed_chats'].append(chat_id)
+            elif result == BLOCKED:
+                report['blocked_chats'].append(chat_id)
+        logger.info(f"Broadcast to {len(chat_ids)} chats in {time.monotonic() - started:.1f}s: "
+                    f"{report[DELIVERED]} delivered, {report[FAILED]} failed, {report[BLOCKED]} blocked")
+        return report
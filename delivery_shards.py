@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.request import HTTPXRequest
+
+from delivery import BLOCKED, DELIVERED, FAILED, MessageDispatcher
+from metrics import REGISTRY
+from notification_writer import NotificationWriter
+from subscriber_index import subscriber_index
+
+logger = logging.getLogger(__name__)
+
+def shard_for(chat_id, shards: int) -> int:
+    """Shard owning a chat; a stable hash of its id, so every process agrees"""
+    return zlib.crc32(str(chat_id).encode()) % shards
+
+def shard_share(config) -> float:
+    """Part of the bot's rate budget for each sender: the bot process and every shard"""
+    return 1.0 / (config.DELIVERY_SHARDS + 1)
+
+class DeliveryShard:
+    """Delivery worker process for the chats in one hash range
+
+    Each job it receives is published to every shard, together with the
+    active subscribers whose telegram_id hashes to it. The shard sends it to
+    those chats, and to the channel if the channel hashes to it, through its own bot connection and a dispatcher
+    holding an equal share of the bot's rate budget. Notifications for
+    delivered messages are written by the shard itself; the report sent back
+    lists the chats that failed or blocked the bot.
+    """
+
+    def __init__(self, shard: int, shards: int, app, config):
+        self.shard = shard
+        self.shards = shards
+        self.app = app
+        self.config = config
+
+    async def deliver(self, job: Dict, dispatcher: MessageDispatcher, writer: NotificationWriter) -> Dict:
+        chat_ids = job['chat_ids']
+        report = {'id': job['id'], 'shard': self.shard, DELIVERED: 0, FAILED: 0, BLOCKED: 0,
+                  'failed_sends': [], 'blocked_chats': []}
+
+        channel_id = self.config.TELEGRAM_CHANNEL_ID
+        targets = []
+        if channel_id and shard_for(channel_id, self.shards) == self.shard:
+            targets.extend(([channel_id], text, None, 'channel') for text in job['channel_texts'])
+        targets.extend((chat_ids, text, job['notification_type'], job['category']) for text in job['texts'])
+
+        # Texts go out one after another so multi-part digests arrive in order
+        for recipients, text, notification_type, category in targets:
+            result = await dispatcher.broadcast(recipients, text, category, job['queued_at'], parse_mode=ParseMode.MARKDOWN)
+            for outcome in (DELIVERED, FAILED, BLOCKED):
+                report[outcome] += result[outcome]
+            report['failed_sends'].extend(
+                (chat_id, text, notification_type, category) for chat_id in result['failed_chats']
+            )
+            report['blocked_chats'].extend(result['blocked_chats'])
+            if notification_type:
+                undelivered = set(result['failed_chats']) | set(result['blocked_chats'])
+                for chat_id in recipients:
+                    if chat_id not in undelivered:
+                        writer.add(chat_id, text, notification_type)
+        return report
+
+    async def run(self, jobs, results):
+        """Deliver jobs from the `jobs` queue until it yields None"""
+        builder_kwargs = {}
+        if self.config.TELEGRAM_API_BASE_URL:
+            base_url = self.config.TELEGRAM_API_BASE_URL.rstrip('/')
+            builder_kwargs = {'base_url': f"{base_url}/bot", 'base_file_url': f"{base_url}/file/bot"}
+        dispatcher_share = shard_share(self.config)
+        pool_size = max(1, int(self.config.DELIVERY_CONCURRENCY * dispatcher_share))
+        bot = Bot(self.config.TELEGRAM_BOT_TOKEN, request=HTTPXRequest(connection_pool_size=pool_size), **builder_kwargs)
+        writer = NotificationWriter.from_config(self.app, self.config)
+        writer.start()
+        try:
+            async with bot:
+                dispatcher = MessageDispatcher.from_config(bot, self.config, dispatcher_share)
+                logger.info(f"Delivery shard {self.shard + 1}/{self.shards} ready")
+                while True:
+                    job = await asyncio.to_thread(jobs.get)
+                    if job is None:
+                        break
+                    try:
+                        report = await self.deliver(job, dispatcher, writer)
+                    except Exception as e:
+                        logger.error(f"Delivery shard {self.shard} failed on job {job['id']}: {e}")
+                        report = {'id': job['id'], 'shard': self.shard, 'error': str(e)}
+                    # The process serving /metrics merges what the shard recorded
+                    report['metrics'] = REGISTRY.drain()
+                    results.put(report)
+        finally:
+            await asyncio.to_thread(writer.stop)
+
+def _run_shard(shard: int, shards: int, jobs, results):
+    from app import app
+    from config import Config
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(DeliveryShard(shard, shards, app, Config).run(jobs, results))
+
+class ShardCoordinator:
+    """Publishes delivery jobs to DELIVERY_SHARDS worker processes and collects their reports
+
+    Each job is put once on every shard's queue, with the slice of the
+    subscriber index that hashes to that shard, so shards never query the
+    subscribers themselves. `publish` resolves when all
+    shards have reported and returns the combined counts, the failed
+    (chat_id, text, notification_type, category) sends, the blocked chats and
+    the shards that could not deliver the job at all, with their errors. A
+    shard process that dies is restarted, and the jobs it had not reported are
+    listed as failed on it, so the caller can resend just that shard's chats.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.shards = config.DELIVERY_SHARDS
+        self.context = multiprocessing.get_context('spawn')
+        self.jobs = [self.context.Queue() for _ in range(self.shards)]
+        self.results = self.context.Queue()
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * self.shards
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._reader: Optional[threading.Thread] = None
+
+    def _spawn(self, shard: int):
+        process = self.context.Process(
+            target=_run_shard, args=(shard, self.shards, self.jobs[shard], self.results),
+            name=f'delivery-shard-{shard}', daemon=True
+        )
+        process.start()
+        self.processes[shard] = process
+
+    def start(self):
+        self._stopping = False
+        for shard in range(self.shards):
+            self._spawn(shard)
+        self._reader = threading.Thread(target=self._read_results, name='delivery-shard-results', daemon=True)
+        self._reader.start()
+        logger.info(f"Started {self.shards} delivery shards")
+
+    def stop(self):
+        self._stopping = True
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.processes:
+            if process:
+                process.join(timeout=30)
+        if self._reader:
+            self._reader.join()
+            self._reader = None
+
+    def _read_results(self):
+        while not self._stopping:
+            try:
+                report = self.results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_processes()
+                continue
+            self._collect(report)
+
+    def _check_processes(self):
+        for shard, process in enumerate(self.processes):
+            if process is not None and not process.is_alive() and not self._stopping:
+                logger.error(f"Delivery shard {shard} exited with code {process.exitcode}, restarting it")
+                self._spawn(shard)
+                self._fail_pending(shard, f"delivery shard {shard} exited")
+
+    def _fail_pending(self, shard: int, error: str):
+        with self._lock:
+            waiting = [job_id for job_id, entry in self._pending.items() if shard not in entry['reported']]
+        for job_id in waiting:
+            self._collect({'id': job_id, 'shard': shard, 'error': error})
+
+    def _collect(self, report: Dict):
+        REGISTRY.merge(report.get('metrics', {}))
+        with self._lock:
+            entry = self._pending.get(report['id'])
+            if entry is None or report['shard'] in entry['reported']:
+                return
+            entry['reported'].add(report['shard'])
+            combined = entry['report']
+            if 'error' in report:
+                combined['failed_shards'].append(report['shard'])
+                combined['errors'].append(report['error'])
+            else:
+                for key in (DELIVERED, FAILED, BLOCKED):
+                    combined[key] += report[key]
+                combined['failed_sends'].extend(report['failed_sends'])
+                combined['blocked_chats'].extend(report['blocked_chats'])
+            if len(entry['reported']) < self.shards:
+                return
+            del self._pending[report['id']]
+
+        future, loop = entry['future'], entry['loop']
+        loop.call_soon_threadsafe(lambda: future.done() or future.set_result(entry['report']))
+
+    async def publish(self, channel_texts: List[str], texts: List[str], notification_type: Optional[str] = None,
+                      category: str = 'broadcast', queued_at: Optional[datetime] = None) -> Dict:
+        """Deliver texts to the channel and every active subscriber across all shards"""
+        job = {
+            'id': str(uuid.uuid4()),
+            'channel_texts': channel_texts,
+            'texts': texts,
+            'notification_type': notification_type,
+            'category': category,
+            'queued_at': queued_at
+        }
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        chat_ids: List[List[str]] = [[] for _ in range(self.shards)]
+        for chat_id in subscriber_index.chat_ids():
+            chat_ids[shard_for(chat_id, self.shards)].append(chat_id)
+        with self._lock:
+            self._pending[job['id']] = {
+                'future': future,
+                'loop': loop,
+                'reported': set(),
+                'report': {DELIVERED: 0, FAILED: 0, BLOCKED: 0, 'failed_sends': [], 'blocked_chats': [],
+                           'failed_shards': [], 'errors': []}
+            }
+        for shard, jobs in enumerate(self.jobs):
+            jobs.put({**job, 'chat_ids': chat_ids[shard]})
+        try:
+            return await future
+        finally:
+            with self._lock:
+                self._pending.pop(job['id'], None)
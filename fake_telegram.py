@@ -0,0 +1,160 @@
+"""Stand-in for the Telegram Bot API for exercising the bot locally
+
+Serves the Bot API methods the bot calls, recording every message it sends,
+and posts synthetic command updates to the bot's webhook with the secret token.
+Point the bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 and
+BOT_UPDATE_MODE=webhook, then run:
+
+    python fake_telegram.py --updates 100 --command /help
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+from webhook import SECRET_TOKEN_HEADER
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': 'Signals Bot', 'username': 'signals_test_bot'}
+
+class FakeTelegramServer:
+    """Minimal Bot API: answers method calls and records sent messages"""
+
+    def __init__(self):
+        self.sent_messages: List[Dict] = []
+        self.webhook: Dict = {}
+        self._message_ids = itertools.count(1)
+        self.runner: Optional[web.AppRunner] = None
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in ('sendMessage', 'editMessageText'):
+            self.sent_messages.append(dict(params, method=method))
+            result = {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']) if str(params['chat_id']).lstrip('-').isdigit() else 0, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', '')
+            }
+        elif method == 'setWebhook':
+            self.webhook = params
+            result = True
+        elif method == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle_method)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+def command_update(update_id: int, chat_id: int, text: str) -> Dict:
+    """Update JSON for a user sending a bot command in a private chat"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}', 'username': f'user{chat_id}'}
+    command = text.split()[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        }
+    }
+
+async def post_updates(webhook_url: str, secret_token: str, updates: List[Dict], concurrency: int = 20) -> Dict[int, int]:
+    """POST updates to a webhook the way Telegram does; returns a count per HTTP status"""
+    statuses: Dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        async def post(update):
+            async with semaphore:
+                async with session.post(webhook_url, data=json.dumps(update),
+                                        headers={SECRET_TOKEN_HEADER: secret_token, 'Content-Type': 'application/json'}) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+        await asyncio.gather(*(post(update) for update in updates))
+    return statuses
+
+async def wait_for_webhook(webhook_url: str, timeout: float) -> bool:
+    """Wait until the bot's webhook endpoint answers its health check"""
+    health_url = str(URL(webhook_url).with_path('/healthz'))
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(health_url) as response:
+                    if response.status == 200:
+                        return True
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+async def run(args):
+    server = FakeTelegramServer()
+    await server.start(args.host, args.port)
+    print(f"Fake Bot API on http://{args.host}:{args.port}, waiting for the bot at {args.webhook}")
+    if not await wait_for_webhook(args.webhook, args.startup_timeout):
+        print("The bot's webhook endpoint did not come up")
+        await server.stop()
+        return
+
+    updates = [command_update(update_id, 10_000 + update_id % args.users, args.command) for update_id in range(1, args.updates + 1)]
+    started = time.perf_counter()
+    statuses = await post_updates(args.webhook, args.secret, updates)
+    print(f"Posted {len(updates)} updates in {time.perf_counter() - started:.2f}s: {statuses}")
+
+    # Give the bot time to reply
+    deadline = time.monotonic() + args.wait
+    while len(server.sent_messages) < len(updates) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    print(f"Bot sent {len(server.sent_messages)} messages after {time.perf_counter() - started:.2f}s")
+    await server.stop()
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API that posts updates to the bot webhook')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--webhook', default=f"http://127.0.0.1:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=Config.WEBHOOK_SECRET_TOKEN)
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--command', default='/help')
+    parser.add_argument('--wait', type=float, default=10.0, help='Seconds to wait for the bot to reply')
+    parser.add_argument('--startup-timeout', type=float, default=60.0, help='Seconds to wait for the bot to start')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+import math
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+class EMAState:
+    """Exponential moving average updated one value at a time
+
+    Mirrors pandas ewm(adjust=False, min_periods=window): the average starts at
+    the first value and is reported once `window` values have been seen.
+    """
+
+    def __init__(self, window: int, alpha: Optional[float] = None):
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2.0 / (window + 1)
+        self.value = None
+        self.count = 0
+
+    def _next(self, x: float) -> float:
+        if self.value is None:
+            return x
+        return self.value + self.alpha * (x - self.value)
+
+    def update(self, x: float) -> Optional[float]:
+        if _is_missing(x):
+            return self.current()
+        self.value = self._next(x)
+        self.count += 1
+        return self.current()
+
+    def peek(self, x: float) -> Optional[float]:
+        if _is_missing(x):
+            return self.current()
+        if self.count + 1 < self.window:
+            return None
+        return self._next(x)
+
+    def current(self) -> Optional[float]:
+        return self.value if self.count >= self.window else None
+
+    def to_dict(self) -> Dict:
+        return {'window': self.window, 'alpha': self.alpha, 'value': self.value, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'EMAState':
+        ema = cls(state['window'], state['alpha'])
+        ema.value = state['value']
+        ema.count = state['count']
+        return ema
+
+class RSIState:
+    """Wilder RSI matching ta.momentum.RSIIndicator"""
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self.prev_close = None
+        self.up = EMAState(window, alpha=1.0 / window)
+        self.down = EMAState(window, alpha=1.0 / window)
+
+    def _moves(self, close: float) -> Tuple[float, float]:
+        diff = 0.0 if self.prev_close is None else close - self.prev_close
+        return max(diff, 0.0), max(-diff, 0.0)
+
+    @staticmethod
+    def _rsi(up: Optional[float], down: Optional[float]) -> Optional[float]:
+        if up is None or down is None:
+            return None
+        if down == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + up / down)
+
+    def update(self, close: float) -> Optional[float]:
+        if _is_missing(close):
+            return self.current()
+        up, down = self._moves(close)
+        self.prev_close = close
+        return self._rsi(self.up.update(up), self.down.update(down))
+
+    def peek(self, close: float) -> Optional[float]:
+        if _is_missing(close):
+            return self.current()
+        up, down = self._moves(close)
+        return self._rsi(self.up.peek(up), self.down.peek(down))
+
+    def current(self) -> Optional[float]:
+        return self._rsi(self.up.current(), self.down.current())
+
+    def to_dict(self) -> Dict:
+        return {'window': self.window, 'prev_close': self.prev_close, 'up': self.up.to_dict(), 'down': self.down.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'RSIState':
+        rsi = cls(state['window'])
+        rsi.prev_close = state['prev_close']
+        rsi.up = EMAState.from_dict(state['up'])
+        rsi.down = EMAState.from_dict(state['down'])
+        return rsi
+
+class MACDState:
+    """MACD line, signal line and histogram matching ta.trend.MACD"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMAState(fast)
+        self.slow = EMAState(slow)
+        self.signal = EMAState(signal)
+
+    @staticmethod
+    def _result(macd: Optional[float], signal: Optional[float]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        diff = macd - signal if macd is not None and signal is not None else None
+        return macd, signal, diff
+
+    def update(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        if _is_missing(close):
+            return self.current()
+        fast = self.fast.update(close)
+        slow = self.slow.update(close)
+        if fast is None or slow is None:
+            return None, None, None
+        macd = fast - slow
+        return self._result(macd, self.signal.update(macd))
+
+    def peek(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        if _is_missing(close):
+            return self.current()
+        fast = self.fast.peek(close)
+        slow = self.slow.peek(close)
+        if fast is None or slow is None:
+            return None, None, None
+        macd = fast - slow
+        return self._result(macd, self.signal.peek(macd))
+
+    def current(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        fast = self.fast.current()
+        slow = self.slow.current()
+        if fast is None or slow is None:
+            return None, None, None
+        return self._result(fast - slow, self.signal.current())
+
+    def to_dict(self) -> Dict:
+        return {'fast': self.fast.to_dict(), 'slow': self.slow.to_dict(), 'signal': self.signal.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'MACDState':
+        macd = cls()
+        macd.fast = EMAState.from_dict(state['fast'])
+        macd.slow = EMAState.from_dict(state['slow'])
+        macd.signal = EMAState.from_dict(state['signal'])
+        return macd
+
+class BollingerState:
+    """Bollinger Bands over a rolling window matching ta.volatility.BollingerBands
+
+    Keeps a running sum and sum of squares of the window. The sums are rebuilt
+    from the window once per `window` updates so floating point drift cannot
+    accumulate, which keeps the amortized cost per bar constant.
+    """
+
+    def __init__(self, window: int = 20, window_dev: float = 2.0):
+        self.window = window
+        self.window_dev = window_dev
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.since_rebuild = 0
+
+    def _bands(self, total: float, total_sq: float, count: int) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        if count < self.window:
+            return None, None, None
+        mean = total / count
+        std = math.sqrt(max(total_sq / count - mean * mean, 0.0))
+        return mean + self.window_dev * std, mean - self.window_dev * std, mean
+
+    def _window_after(self, close: float) -> Tuple[float, float, int]:
+        total = self.total + close
+        total_sq = self.total_sq + close * close
+        count = len(self.values) + 1
+        if len(self.values) == self.window:
+            oldest = self.values[0]
+            total -= oldest
+            total_sq -= oldest * oldest
+            count -= 1
+        return total, total_sq, count
+
+    def update(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        if _is_missing(close):
+            return self.current()
+        self.total, self.total_sq, _ = self._window_after(close)
+        self.values.append(close)
+        self.since_rebuild += 1
+        if self.since_rebuild >= self.window:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+            self.since_rebuild = 0
+        return self.current()
+
+    def peek(self, close: float) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        if _is_missing(close):
+            return self.current()
+        return self._bands(*self._window_after(close))
+
+    def current(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        return self._bands(self.total, self.total_sq, len(self.values))
+
+    def to_dict(self) -> Dict:
+        return {'window': self.window, 'window_dev': self.window_dev, 'values': list(self.values)}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'BollingerState':
+        bb = cls(state['window'], state['window_dev'])
+        for value in state['values']:
+            bb.update(value)
+        return bb
+
+class IndicatorEngine:
+    """Incremental RSI, MACD, Bollinger Bands and EMA state for one series
+
+    `update` commits a finished bar in constant time, `peek` evaluates the
+    indicators as if a (still forming) bar were appended without changing the
+    state. Feeding the same closes produces the values of the `ta` indicators
+    used by TechnicalAnalyzer.
+    """
+
+    def __init__(self, rsi_period: int = 14, macd_fast: int = 12, macd_slow: int = 26, macd_signal: int = 9,
+                 bb_period: int = 20, bb_dev: float = 2.0, ema_periods: Iterable[int] = (20, 50)):
+        self.params = {
+            'rsi_period': rsi_period,
+            'macd_fast': macd_fast,
+            'macd_slow': macd_slow,
+            'macd_signal': macd_signal,
+            'bb_period': bb_period,
+            'bb_dev': bb_dev,
+            'ema_periods': list(ema_periods)
+        }
+        self.rsi = RSIState(rsi_period)
+        self.macd = MACDState(macd_fast, macd_slow, macd_signal)
+        self.bollinger = BollingerState(bb_period, bb_dev)
+        self.emas = {period: EMAState(period) for period in ema_periods}
+        self.first_timestamp: Optional[pd.Timestamp] = None
+        self.last_timestamp: Optional[pd.Timestamp] = None
+
+    @classmethod
+    def from_config(cls, config) -> 'IndicatorEngine':
+        return cls(
+            rsi_period=config.RSI_PERIOD,
+            macd_fast=config.MACD_FAST,
+            macd_slow=config.MACD_SLOW,
+            macd_signal=config.MACD_SIGNAL
+        )
+
+    @staticmethod
+    def _values(rsi, macd, bands, emas) -> Dict:
+        values = {
+            'rsi': rsi,
+            'macd': macd[0],
+            'macd_signal': macd[1],
+            'macd_diff': macd[2],
+            'bb_upper': bands[0],
+            'bb_lower': bands[1],
+            'bb_middle': bands[2]
+        }
+        for period, ema in emas.items():
+            values[f'ema_{period}'] = ema
+        return values
+
+    def update(self, close: float, timestamp=None) -> Dict:
+        """Commit a completed bar and return the indicator values after it"""
+        values = self._values(
+            self.rsi.update(close),
+            self.macd.update(close),
+            self.bollinger.update(close),
+            {period: ema.update(close) for period, ema in self.emas.items()}
+        )
+        if timestamp is not None:
+            self.last_timestamp = pd.Timestamp(timestamp)
+            if self.first_timestamp is None:
+                self.first_timestamp = self.last_timestamp
+        return values
+
+    def peek(self, close: float) -> Dict:
+        """Indicator values if `close` were the next bar, without committing it"""
+        return self._values(
+            self.rsi.peek(close),
+            self.macd.peek(close),
+            self.bollinger.peek(close),
+            {period: ema.peek(close) for period, ema in self.emas.items()}
+        )
+
+    def current(self) -> Dict:
+        """Indicator values as of the last committed bar"""
+        return self._values(
+            self.rsi.current(),
+            self.macd.current(),
+            self.bollinger.current(),
+            {period: ema.current() for period, ema in self.emas.items()}
+        )
+
+    def seed(self, closes: pd.Series) -> Dict:
+        """Warm the state up from a history of completed bars"""
+        values = self.current()
+        for timestamp, close in closes.items():
+            values = self.update(float(close), timestamp)
+        return values
+
+    def to_dict(self) -> Dict:
+        return {
+            'params': self.params,
+            'first_timestamp': self.first_timestamp.isoformat() if self.first_timestamp is not None else None,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+            'rsi': self.rsi.to_dict(),
+            'macd': self.macd.to_dict(),
+            'bollinger': self.bollinger.to_dict(),
+            'emas': {str(period): ema.to_dict() for period, ema in self.emas.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'IndicatorEngine':
+        engine = cls(**state['params'])
+        if state.get('first_timestamp'):
+            engine.first_timestamp = pd.Timestamp(state['first_timestamp'])
+        if state['last_timestamp']:
+            engine.last_timestamp = pd.Timestamp(state['last_timestamp'])
+        engine.rsi = RSIState.from_dict(state['rsi'])
+        engine.macd = MACDState.from_dict(state['macd'])
+        engine.bollinger = BollingerState.from_dict(state['bollinger'])
+        engine.emas = {int(period): EMAState.from_dict(ema) for period, ema in state['emas'].items()}
+        return engine
+
+def _ema_matrix(values: np.ndarray, window: int, alpha: Optional[float] = None) -> np.ndarray:
+    """EMA along the bar axis of an (assets x bars) matrix
+
+    Steps through the bars once, updating every asset together, with the same
+    semantics as the ta indicators (pandas ewm, adjust=False, min_periods=window).
+    Each row starts at its own first non-NaN value and NaN bars carry the
+    previous average forward.
+    """
+    if alpha is None:
+        alpha = 2.0 / (window + 1)
+    out = np.full(values.shape, np.nan)
+    state = np.full(values.shape[0], np.nan)
+    count = np.zeros(values.shape[0], dtype=np.int64)
+    for bar in range(values.shape[1]):
+        x = values[:, bar]
+        valid = ~np.isnan(x)
+        state = np.where(valid, np.where(np.isnan(state), x, state + alpha * (x - state)), state)
+        count += valid
+        out[:, bar] = np.where(count >= window, state, np.nan)
+    return out
+
+def _rolling_mean_std(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rolling mean and population standard deviation along the bar axis
+
+    Windows that contain a NaN produce NaN. Rows are centred on their own mean
+    before the cumulative sums to keep cancellation error small.
+    """
+    missing = np.isnan(values)
+    with np.errstate(all='ignore'):
+        offset = np.nanmean(values, axis=1, keepdims=True)
+    offset = np.nan_to_num(offset)
+    centred = np.where(missing, 0.0, values - offset)
+
+    def window_sum(x):
+        cumulative = np.cumsum(x, axis=1)
+        summed = cumulative.copy()
+        summed[:, window:] = cumulative[:, window:] - cumulative[:, :-window]
+        return summed
+
+    total = window_sum(centred)
+    total_sq = window_sum(centred * centred)
+    count = window_sum((~missing).astype(np.int64))
+
+    mean = total / window
+    std = np.sqrt(np.maximum(total_sq / window - mean * mean, 0.0))
+    complete = count == window
+    complete[:, :window - 1] = False
+    return np.where(complete, mean + offset, np.nan), np.where(complete, std, np.nan)
+
+class IndicatorMatrixCache:
+    """Indicator matrices of one price matrix, each computed once per distinct setting
+
+    Parameter sweeps ask for the same RSI, EMA and Bollinger periods again and
+    again; this keeps every matrix computed so far, keyed by its parameters,
+    and only computes the indicators that are asked for.
+    """
+
+    def __init__(self, closes: np.ndarray):
+        closes = np.asarray(closes, dtype=float)
+        if closes.ndim == 1:
+            closes = closes[np.newaxis, :]
+        self.closes = closes
+        self._matrices: Dict[tuple, object] = {}
+
+    def _cached(self, key: tuple, compute):
+        if key not in self._matrices:
+            self._matrices[key] = compute()
+        return self._matrices[key]
+
+    def _rsi(self, period: int) -> np.ndarray:
+        # The first bar of each row contributes a zero move, as in ta
+        closes = self.closes
+        missing = np.isnan(closes)
+        diff = np.diff(closes, axis=1, prepend=np.nan)
+        diff = np.where(missing, np.nan, np.nan_to_num(diff, nan=0.0))
+        up = np.where(diff > 0, diff, np.where(missing, np.nan, 0.0))
+        down = np.where(diff < 0, -diff, np.where(missing, np.nan, 0.0))
+        avg_up = _ema_matrix(up, period, alpha=1.0 / period)
+        avg_down = _ema_matrix(down, period, alpha=1.0 / period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+        return np.where(np.isnan(avg_up) | np.isnan(avg_down), np.nan, rsi)
+
+    def rsi(self, period: int) -> np.ndarray:
+        return self._cached(('rsi', period), lambda: self._rsi(period))
+
+    def ema(self, period: int) -> np.ndarray:
+        return self._cached(('ema', period), lambda: _ema_matrix(self.closes, period))
+
+    def macd(self, fast: int, slow: int, signal: int) -> Tuple[np.ndarray, np.ndarray]:
+        """MACD line and signal line"""
+        macd = self._cached(('macd', fast, slow), lambda: self.ema(fast) - self.ema(slow))
+        return macd, self._cached(('macd_signal', fast, slow, signal), lambda: _ema_matrix(macd, signal))
+
+    def bollinger(self, period: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rolling mean and population standard deviation (as in ta)"""
+        return self._cached(('bollinger', period), lambda: _rolling_mean_std(self.closes, period))
+
+    def get(self, rsi_period: Optional[int] = None, macd: Optional[Tuple[int, int, int]] = None,
+            bollinger: Optional[Tuple[int, float]] = None, ema_periods: Iterable[int] = ()) -> Dict[str, np.ndarray]:
+        """Indicators under the keys compute_indicator_matrix uses; those given as None are left out
+
+        `macd` is (fast, slow, signal) and `bollinger` is (period, deviations).
+        """
+        result = {}
+        if rsi_period is not None:
+            result['rsi'] = self.rsi(rsi_period)
+        if macd is not None:
+            line, signal = self.macd(*macd)
+            result.update(macd=line, macd_signal=signal, macd_diff=line - signal)
+        if bollinger is not None:
+            period, deviations = bollinger
+            middle, std = self.bollinger(period)
+            result.update(bb_upper=middle + deviations * std, bb_lower=middle - deviations * std, bb_middle=middle)
+        for period in ema_periods:
+            result[f'ema_{period}'] = self.ema(period)
+        return result
+
+def compute_indicator_matrix(closes: np.ndarray, rsi_period: int = 14, macd_fast: int = 12, macd_slow: int = 26,
+                             macd_signal: int = 9, bb_period: int = 20, bb_dev: float = 2.0,
+                             ema_periods: Iterable[int] = (20, 50)) -> Dict[str, np.ndarray]:
+    """Compute every indicator for a whole universe in one vectorized sweep
+
+    `closes` is an (assets x bars) matrix. Assets with shorter histories are
+    padded with NaN at the start of their row. Every returned array has the
+    same shape as `closes` and matches what the ta indicators produce for the
+    unpadded series of each row.
+    """
+    return IndicatorMatrixCache(closes).get(
+        rsi_period=rsi_period,
+        macd=(macd_fast, macd_slow, macd_signal),
+        bollinger=(bb_period, bb_dev),
+        ema_periods=ema_periods
+    )
+
+def build_price_matrix(frames: Dict[str, pd.DataFrame], column: str = 'Close',
+                       bars: Optional[int] = None) -> Tuple[List[str], np.ndarray]:
+    """Stack per-symbol bar frames into a right-aligned (assets x bars) matrix
+
+    Row i holds the last `bars` values of symbols[i]; shorter histories are
+    padded with NaN at the start so the latest bar of every asset is in the
+    last column.
+    """
+    symbols = [symbol for symbol, frame in frames.items() if not frame.empty]
+    width = bars or max((len(frames[symbol]) for symbol in symbols), default=0)
+    matrix = np.full((len(symbols), width), np.nan)
+    for row, symbol in enumerate(symbols):
+        values = frames[symbol][column].to_numpy(dtype=float)[-width:] if width else []
+        if len(values):
+            matrix[row, width - len(values):] = values
+    return symbols, matrix
@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from bar_store import BAR_COLUMNS
+
+# Lookback covered by each yfinance period string
+PERIOD_OFFSETS = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=5),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10)
+}
+
+class MarketDataProvider:
+    """Source of OHLCV bars used by TechnicalAnalyzer
+
+    Implementations return DataFrames indexed by bar timestamp with at least
+    the Open, High, Low, Close and Volume columns, or an empty DataFrame.
+    """
+
+    # Whether fetched bars and derived indicator state may be persisted between runs
+    cacheable = True
+
+    def now(self) -> pd.Timestamp:
+        """Current time as seen by this provider"""
+        return pd.Timestamp.now(tz='UTC')
+
+    def history(self, symbol: str, period: str = None, interval: str = "1d", start=None) -> pd.DataFrame:
+        """Bars for one symbol, either for a period string or from a start time"""
+        raise NotImplementedError
+
+    def download(self, symbols: List[str], period: str = None, interval: str = "1d", start=None) -> Dict[str, pd.DataFrame]:
+        """Bars for several symbols; providers with a bulk endpoint override this"""
+        results = {}
+        for symbol in symbols:
+            data = self.history(symbol, period=period, interval=interval, start=start)
+            if not data.empty:
+                results[symbol] = data
+        return results
+
+class YFinanceProvider(MarketDataProvider):
+    """Yahoo Finance bars through yfinance"""
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+
+    def history(self, symbol: str, period: str = None, interval: str = "1d", start=None) -> pd.DataFrame:
+        ticker = yf.Ticker(symbol)
+        if start is not None:
+            return ticker.history(start=start, interval=interval, timeout=self.timeout)
+        return ticker.history(period=period, interval=interval, timeout=self.timeout)
+
+    def download(self, symbols: List[str], period: str = None, interval: str = "1d", start=None) -> Dict[str, pd.DataFrame]:
+        """Download a batch of tickers with a single yfinance request"""
+        window = {'start': start} if start is not None else {'period': period}
+        raw = yf.download(
+            tickers=symbols,
+            interval=interval,
+            group_by='ticker',
+            auto_adjust=True,
+            threads=False,
+            progress=False,
+            timeout=self.timeout,
+            **window
+        )
+        if raw is None or raw.empty:
+            return {}
+
+        frames = {}
+        if isinstance(raw.columns, pd.MultiIndex):
+            available = raw.columns.get_level_values(0)
+            for symbol in symbols:
+                if symbol in available:
+                    frames[symbol] = raw[symbol]
+        elif len(symbols) == 1:
+            frames[symbols[0]] = raw
+
+        # Tickers trading on different calendars are padded with empty rows
+        results = {}
+        for symbol, frame in frames.items():
+            frame = frame.dropna(how='all')
+            if not frame.empty:
+                results[symbol] = frame
+        return results
+
+# Resampling rule for each timeframe that can be derived from finer bars
+TIMEFRAME_RULES = {
+    '1m': pd.Timedelta(minutes=1),
+    '5m': pd.Timedelta(minutes=5),
+    '15m': pd.Timedelta(minutes=15),
+    '30m': pd.Timedelta(minutes=30),
+    '1h': pd.Timedelta(hours=1),
+    '60m': pd.Timedelta(hours=1),
+    '2h': pd.Timedelta(hours=2),
+    '4h': pd.Timedelta(hours=4),
+    '1d': pd.Timedelta(days=1),
+    '1wk': 'W'
+}
+
+def resample_bars(data: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """Aggregate OHLCV bars into a coarser timeframe
+
+    Bins are aligned in the timezone of the index, so daily bars follow the
+    exchange calendar day. The last bar is partial if its period is still open,
+    just like the last bar returned by a provider.
+    """
+    if data.empty:
+        return data
+    resampled = data.resample(TIMEFRAME_RULES[timeframe], label='left', closed='left').agg({
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Volume': 'sum'
+    })
+    return resampled.dropna(subset=['Close'])
+
+def replay_file_path(data_dir: str, symbol: str, interval: str = "1d") -> str:
+    """Location of the replay file for a symbol and interval"""
+    return os.path.join(data_dir, interval, f"{quote(symbol, safe='')}.csv")
+
+def save_replay_bars(data_dir: str, symbol: str, data: pd.DataFrame, interval: str = "1d"):
+    """Write bars to the file ReplayProvider serves them from"""
+    path = replay_file_path(data_dir, symbol, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame = data[BAR_COLUMNS].copy()
+    frame.index.name = 'Date'
+    frame.to_csv(path)
+
+def generate_synthetic_bars(bars: int, interval: str = "1d", end=None, start_price: float = 100.0,
+                            volatility: float = 0.02, seed: Optional[int] = None) -> pd.DataFrame:
+    """Random-walk OHLCV bars for load tests and benchmarks"""
+    rng = np.random.default_rng(seed)
+    freq = {'1d': 'D', '1wk': 'W', '1h': 'h', '60m': 'h', '30m': '30min', '15m': '15min', '5m': '5min', '1m': 'min'}.get(interval, 'D')
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz='UTC').floor(freq)
+    if end.tzinfo is None:
+        end = end.tz_localize('UTC')
+    index = pd.date_range(end=end, periods=bars, freq=freq, name='Date')
+
+    close = start_price * np.exp(np.cumsum(rng.normal(0.0, volatility, bars)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0.0, volatility / 2, bars)) * close
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Volume': rng.integers(1_000, 1_000_000, bars).astype(float)
+    }, index=index)
+
+class ReplayProvider(MarketDataProvider):
+    """Serves recorded or synthetic bars from local CSV files
+
+    Files live at <data_dir>/<interval>/<symbol>.csv (see save_replay_bars).
+    With speed=0 every bar in a file is available and "now" is the last bar.
+    With speed > 0 the replay clock starts at `start` (default: the first bar
+    of the first file read) and advances `speed` simulated seconds per wall-clock
+    second; only bars whose timestamp has been reached are served. `latency`
+    adds a fixed delay per request to mimic a network provider.
+    """
+
+    cacheable = False
+
+    def __init__(self, data_dir: str, speed: float = 0.0, start=None, latency: float = 0.0):
+        self.data_dir = data_dir
+        self.speed = speed
+        self.start = pd.Timestamp(start) if start is not None else None
+        if self.start is not None and self.start.tzinfo is None:
+            self.start = self.start.tz_localize('UTC')
+        self.latency = latency
+        self.started_at = time.monotonic()
+        self._frames: Dict[tuple, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, symbol: str, interval: str) -> pd.DataFrame:
+        key = (symbol, interval)
+        with self._lock:
+            if key not in self._frames:
+                path = replay_file_path(self.data_dir, symbol, interval)
+                if os.path.exists(path):
+                    frame = pd.read_csv(path, index_col=0)
+                    frame.index = pd.to_datetime(frame.index, utc=True)
+                    frame.index.name = 'Date'
+                    frame = frame.sort_index()
+                else:
+                    frame = pd.DataFrame()
+                self._frames[key] = frame
+                if self.start is None and not frame.empty:
+                    self.start = frame.index[0]
+            return self._frames[key]
+
+    def now(self) -> pd.Timestamp:
+        if self.speed > 0 and self.start is not None:
+            return self.start + pd.Timedelta(seconds=(time.monotonic() - self.started_at) * self.speed)
+        latest = [frame.index[-1] for frame in self._frames.values() if not frame.empty]
+        return max(latest) if latest else pd.Timestamp.now(tz='UTC')
+
+    def history(self, symbol: str, period: str = None, interval: str = "1d", start=None) -> pd.DataFrame:
+        if self.latency:
+            time.sleep(self.latency)
+        frame = self._load(symbol, interval)
+        if frame.empty:
+            return frame
+
+        end = self.now() if self.speed > 0 else frame.index[-1]
+        frame = frame[frame.index <= end]
+        if start is not None:
+            start = pd.Timestamp(start)
+            frame = frame[frame.index >= (start if start.tzinfo else start.tz_localize('UTC'))]
+        elif period in PERIOD_OFFSETS:
+            frame = frame[frame.index >= end - PERIOD_OFFSETS[period]]
+        return frame.copy()
+
+def create_provider(config) -> MarketDataProvider:
+    """Build the market data provider selected by MARKET_DATA_PROVIDER"""
+    name = config.MARKET_DATA_PROVIDER.lower()
+    if name == 'replay':
+        return ReplayProvider(config.REPLAY_DATA_DIR, speed=config.REPLAY_SPEED)
+    if name == 'yfinance':
+        return YFinanceProvider(timeout=config.FETCH_TIMEOUT)
+    raise ValueError(f"Unknown market data provider: {config.MARKET_DATA_PROVIDER}")
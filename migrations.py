@@ -0,0 +1,195 @@
+"""Versioned schema migrations
+
+`db.create_all()` creates missing tables but never changes existing ones, so
+every schema change after the initial tables is a numbered migration here.
+Applied versions are recorded in the `schema_version` table and each
+migration runs in its own transaction. Migrations are idempotent, because
+tables created by `create_all` on a fresh database already have the current
+schema:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list migrations and whether they are applied
+"""
+import argparse
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Sequence
+
+import sqlalchemy as sa
+
+from models import db, ChartPayload, RollupWatermark, SchemaVersion
+from user_search import SEARCH_TABLE
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[sa.engine.Connection], None]
+
+def _index(table: str, name: str, columns: Sequence[str]) -> sa.Index:
+    # On a throwaway table object, so the models' metadata is left untouched
+    index_table = sa.Table(table, sa.MetaData(), *(sa.Column(column) for column in columns))
+    return sa.Index(name, *(index_table.c[column] for column in columns))
+
+def create_index(connection, table: str, name: str, columns: Sequence[str]):
+    """Create an index unless the database already has one of that name"""
+    _index(table, name, columns).create(connection, checkfirst=True)
+
+def drop_index(connection, table: str, name: str, columns: Sequence[str]):
+    """Drop an index if it exists"""
+    _index(table, name, columns).drop(connection, checkfirst=True)
+
+def add_column(connection, table: str, column: sa.Column):
+    """Add a nullable column unless the table already has it"""
+    if column.name in {existing['name'] for existing in sa.inspect(connection).get_columns(table)}:
+        return
+    sa.Table(table, sa.MetaData(), column)
+    definition = sa.schema.CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f"ALTER TABLE {connection.dialect.identifier_preparer.quote(table)} ADD COLUMN {definition}")
+
+def analyze(connection):
+    """Refresh the planner statistics so new indexes are used where they help"""
+    if connection.dialect.name in ('sqlite', 'postgresql'):
+        connection.exec_driver_sql('ANALYZE')
+
+# Indexes for the dashboard counts, the signal and subscriber lists, the
+# expiry check, the subscriber index and per-user notification lookups
+QUERY_INDEXES = (
+    ('users', 'ix_users_join_date_id', ('join_date', 'id')),
+    ('subscriptions', 'ix_subscriptions_status_end_date', ('status', 'end_date', 'user_id')),
+    ('subscriptions', 'ix_subscriptions_user_id', ('user_id',)),
+    ('signals', 'ix_signals_timestamp_id', ('timestamp', 'id')),
+    ('signals', 'ix_signals_outcome_timestamp', ('outcome', 'timestamp')),
+    ('performance', 'ix_performance_date', ('date',)),
+    ('notifications', 'ix_notifications_user_id_sent_at', ('user_id', 'sent_at')),
+)
+
+def _add_query_indexes(connection):
+    for table, name, columns in QUERY_INDEXES:
+        create_index(connection, table, name, columns)
+    analyze(connection)
+
+def _add_performance_rollups(connection):
+    add_column(connection, 'signals', sa.Column('resolved_at', sa.DateTime))
+    add_column(connection, 'performance', sa.Column('strategy', sa.String(100)))
+    add_column(connection, 'performance', sa.Column('asset_symbol', sa.String(20)))
+    RollupWatermark.__table__.create(connection, checkfirst=True)
+    # Signals closed before this column existed are rolled up on the first run
+    connection.execute(
+        sa.text("UPDATE signals SET resolved_at = closed_at WHERE resolved_at IS NULL AND closed_at IS NOT NULL")
+    )
+    create_index(connection, 'signals', 'ix_signals_resolved_at', ('resolved_at',))
+    create_index(connection, 'signals', 'ix_signals_closed_at', ('closed_at',))
+    create_index(connection, 'performance', 'ix_performance_date_strategy_asset', ('date', 'strategy', 'asset_symbol'))
+
+def _add_outbox_job_id(connection):
+    add_column(connection, 'outbox_messages', sa.Column('job_id', sa.Integer))
+    create_index(connection, 'outbox_messages', 'ix_outbox_messages_job_id', ('job_id',))
+
+SEARCHED_COLUMNS = ('username', 'first_name', 'last_name')
+
+def create_user_search(connection):
+    """Index usernames and names for substring search
+
+    PostgreSQL gets pg_trgm GIN indexes, SQLite an FTS5 trigram table kept in
+    step with `users` by triggers. Where neither is available search keeps
+    scanning with LIKE.
+    """
+    if connection.dialect.name == 'postgresql':
+        try:
+            with connection.begin_nested():
+                connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except sa.exc.DBAPIError as e:
+            logger.warning(f"pg_trgm is unavailable, subscriber search will not be indexed: {e}")
+            return
+        for column in SEARCHED_COLUMNS:
+            connection.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_users_{column}_trgm ON users USING gin ({column} gin_trgm_ops)"
+            )
+    elif connection.dialect.name == 'sqlite':
+        columns = ', '.join(SEARCHED_COLUMNS)
+        new_values = ', '.join(f"new.{column}" for column in SEARCHED_COLUMNS)
+        old_values = ', '.join(f"old.{column}" for column in SEARCHED_COLUMNS)
+        try:
+            connection.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"{columns}, content='users', content_rowid='id', tokenize='trigram')"
+            )
+        except sa.exc.OperationalError as e:
+            logger.warning(f"SQLite lacks FTS5 trigram support, subscriber search will not be indexed: {e}")
+            return
+        insert = f"INSERT INTO {SEARCH_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+        delete = f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON users BEGIN {insert} END")
+        connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON users BEGIN {delete} END")
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF {columns} ON users "
+            f"BEGIN {delete} {insert} END"
+        )
+        connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+def drop_user_search(connection):
+    """Remove the search indexes added by `create_user_search`"""
+    if connection.dialect.name == 'postgresql':
+        for column in SEARCHED_COLUMNS:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS ix_users_{column}_trgm")
+    elif connection.dialect.name == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{trigger}")
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Indexes for dashboard, signal list, subscriber list and expiry queries', _add_query_indexes),
+    Migration(2, 'Per-strategy and per-asset performance rollups', _add_performance_rollups),
+    Migration(3, 'Trigram indexes for subscriber search', create_user_search),
+    Migration(4, 'Stored chart payloads', lambda connection: ChartPayload.__table__.create(connection, checkfirst=True)),
+    Migration(5, 'Chats that blocked the bot', lambda connection: add_column(connection, 'users', sa.Column('blocked_at', sa.DateTime))),
+    Migration(6, 'Outbox messages linked to the job they were fanned out from', _add_outbox_job_id),
+]
+
+def applied_versions(connection) -> set:
+    SchemaVersion.__table__.create(connection, checkfirst=True)
+    return set(connection.execute(sa.select(SchemaVersion.version)).scalars())
+
+def upgrade(engine=None, target: int = None) -> List[int]:
+    """Apply pending migrations up to `target` (all by default); returns the versions applied"""
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    newly_applied = []
+    for migration in sorted(MIGRATIONS, key=lambda migration: migration.version):
+        if migration.version in applied or (target is not None and migration.version > target):
+            continue
+        logger.info(f"Applying migration {migration.version}: {migration.description}")
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(sa.insert(SchemaVersion).values(
+                version=migration.version, description=migration.description, applied_at=datetime.utcnow()
+            ))
+        newly_applied.append(migration.version)
+    return newly_applied
+
+def main():
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true', help='List migrations instead of applying them')
+    parser.add_argument('--target', type=int, default=None, help='Stop after this version')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        if args.status:
+            with db.engine.begin() as connection:
+                applied = applied_versions(connection)
+            for migration in MIGRATIONS:
+                print(f"{migration.version:>4} {'applied' if migration.version in applied else 'pending':<8} {migration.description}")
+            return
+        db.create_all()
+        versions = upgrade(target=args.target)
+        print(f"Applied migrations {versions}" if versions else "Database schema is up to date")
+
+if __name__ == '__main__':
+    main()
@@ -21,8 +21,17 @@ class TradeOutcome(enum.Enum):
     LOSS = "loss"
     PENDING = "pending"
 
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_join_date_id', 'join_date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     telegram_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -31,6 +40,8 @@ class User(UserMixin, db.Model):
     last_name = db.Column(db.String(100))
     join_date = db.Column(db.DateTime, default=datetime.utcnow)
     is_admin = db.Column(db.Boolean, default=False)
+    # Set when the chat blocks the bot, cleared by its next update
+    blocked_at = db.Column(db.DateTime)
     
     # Relationship
     subscription = db.relationship('Subscription', backref='user', uselist=False)
@@ -40,6 +51,10 @@ class User(UserMixin, db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_status_end_date', 'status', 'end_date', 'user_id'),
+        db.Index('ix_subscriptions_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -69,6 +84,12 @@ class Subscription(db.Model):
 
 class Signal(db.Model):
     __tablename__ = 'signals'
+    __table_args__ = (
+        db.Index('ix_signals_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_signals_outcome_timestamp', 'outcome', 'timestamp'),
+        db.Index('ix_signals_resolved_at', 'resolved_at'),
+        db.Index('ix_signals_closed_at', 'closed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     asset_symbol = db.Column(db.String(20), nullable=False)
@@ -82,15 +103,24 @@ class Signal(db.Model):
     outcome = db.Column(Enum(TradeOutcome), default=TradeOutcome.PENDING)
     profit_loss = db.Column(db.Float)
     closed_at = db.Column(db.DateTime)
+    # When the outcome was written, which can be long after closed_at
+    resolved_at = db.Column(db.DateTime)
     
     def __repr__(self):
         return f'<Signal {self.asset_symbol} {self.signal_type.value}>'
 
 class Performance(db.Model):
     __tablename__ = 'performance'
+    __table_args__ = (
+        db.Index('ix_performance_date', 'date'),
+        db.Index('ix_performance_date_strategy_asset', 'date', 'strategy', 'asset_symbol'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, default=datetime.utcnow().date)
+    # Both empty for the day's totals; one of them set for a per-strategy or per-asset row
+    strategy = db.Column(db.String(100))
+    asset_symbol = db.Column(db.String(20))
     total_signals = db.Column(db.Integer, default=0)
     winning_signals = db.Column(db.Integer, default=0)
     losing_signals = db.Column(db.Integer, default=0)
@@ -107,6 +137,9 @@ class Performance(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_sent_at', 'user_id', 'sent_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -129,4 +162,58 @@ class Strategy(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Strategy {self.name}>' 
\ No newline at end of file
+        return f'<Strategy {self.name}>' 
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox_messages'
+    __table_args__ = (
+        db.Index('ix_outbox_messages_status_available_at', 'status', 'available_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # message, signal, broadcast
+    chat_id = db.Column(db.String(50))
+    # The signal, digest or broadcast job a message row was fanned out from
+    job_id = db.Column(db.Integer, index=True)
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36), index=True)
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.kind} {self.status.value}>'
+
+class RollupWatermark(db.Model):
+    __tablename__ = 'rollup_watermarks'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} {self.value}>'
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+class ChartPayload(db.Model):
+    __tablename__ = 'chart_payloads'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # Plotly figure JSON
+    etag = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChartPayload {self.name} {self.etag}>'
\ No newline at end of file
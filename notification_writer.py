@@ -0,0 +1,109 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import db, Notification, User
+
+logger = logging.getLogger(__name__)
+
+class NotificationWriter:
+    """Buffers Notification rows and writes them in bulk off the send path
+
+    `add` only appends to an in-memory buffer. A background thread flushes the
+    buffer with one multi-row insert and one commit whenever it reaches
+    `batch_size` rows or `flush_interval` seconds have passed. Telegram ids are
+    resolved to user ids through a cache, so a flush costs at most one lookup
+    query for ids it has not seen before.
+    """
+
+    def __init__(self, app, batch_size: int = 500, flush_interval: float = 5.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict] = []
+        self._user_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, app, config) -> 'NotificationWriter':
+        return cls(app, batch_size=config.NOTIFICATION_BATCH_SIZE, flush_interval=config.NOTIFICATION_FLUSH_SECONDS)
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='notification-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread after writing everything still buffered"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def add(self, telegram_id: str, message: str, notification_type: str = "system"):
+        """Queue a notification for a delivered message"""
+        with self._lock:
+            self._buffer.append({
+                'telegram_id': str(telegram_id),
+                'message': message,
+                'notification_type': notification_type,
+                'sent_at': datetime.utcnow()
+            })
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing notifications: {e}")
+
+    def _resolve_user_ids(self, telegram_ids: set):
+        missing = [telegram_id for telegram_id in telegram_ids if telegram_id not in self._user_ids]
+        if missing:
+            self._user_ids.update(
+                db.session.query(User.telegram_id, User.id).filter(User.telegram_id.in_(missing)).all()
+            )
+
+    def flush(self) -> int:
+        """Write every buffered notification now; returns the number of rows inserted"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return 0
+
+            with self.app.app_context():
+                try:
+                    self._resolve_user_ids({item['telegram_id'] for item in pending})
+                    rows = [
+                        {
+                            'user_id': self._user_ids[item['telegram_id']],
+                            'message': item['message'],
+                            'notification_type': item['notification_type'],
+                            'sent_at': item['sent_at']
+                        }
+                        for item in pending if item['telegram_id'] in self._user_ids
+                    ]
+                    if rows:
+                        db.session.execute(db.insert(Notification), rows)
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Keep the rows for the next flush
+                    with self._lock:
+                        self._buffer[:0] = pending
+                    raise
+            logger.debug(f"Wrote {len(rows)} notifications")
+            return len(rows)
@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import logging
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest import STRATEGY_PARAMETERS, TRADE_PARAMETERS, Backtester, default_parameters
+from indicators import IndicatorMatrixCache, build_price_matrix
+
+logger = logging.getLogger(__name__)
+
+# Values tried for each parameter unless a custom search space is given
+DEFAULT_SEARCH_SPACE = {
+    'rsi_period': [7, 10, 14, 21],
+    'rsi_oversold': [20, 25, 30, 35],
+    'rsi_overbought': [65, 70, 75, 80],
+    'macd_fast': [8, 12, 16],
+    'macd_slow': [21, 26, 34],
+    'macd_signal': [5, 9, 12],
+    'bb_period': [10, 20, 30],
+    'bb_dev': [1.5, 2.0, 2.5],
+    'ema_fast': [10, 20, 30],
+    'ema_slow': [50, 100, 200]
+}
+
+def _is_valid(parameters: Dict) -> bool:
+    return (parameters.get('macd_fast', 0) < parameters.get('macd_slow', 1) and
+            parameters.get('ema_fast', 0) < parameters.get('ema_slow', 1))
+
+def parameter_grid(space: Dict[str, List]) -> List[Dict]:
+    """Every combination of the values in a search space"""
+    keys = list(space)
+    combinations = (dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys)))
+    return [parameters for parameters in combinations if _is_valid(parameters)]
+
+def random_parameters(space: Dict[str, List], samples: int, seed: Optional[int] = None) -> List[Dict]:
+    """Random combinations drawn from a search space, without duplicates"""
+    rng = random.Random(seed)
+    seen = set()
+    combinations = []
+    attempts = 0
+    while len(combinations) < samples and attempts < samples * 20:
+        attempts += 1
+        parameters = {key: rng.choice(values) for key, values in space.items()}
+        key = tuple(sorted(parameters.items()))
+        if key not in seen and _is_valid(parameters):
+            seen.add(key)
+            combinations.append(parameters)
+    return combinations
+
+class SharedPriceArrays:
+    """Price matrices placed in shared memory once for every worker process
+
+    Workers attach to the blocks by name and wrap them in NumPy arrays, so the
+    price history is never pickled or copied per task.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.specs: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Per-process state set up by _attach_worker
+_worker_blocks: List[shared_memory.SharedMemory] = []
+_worker_arrays: Dict[str, np.ndarray] = {}
+_worker_defaults: Dict = {}
+# Indicator matrices of the shared closes, each computed once per worker
+_worker_indicators: Optional[IndicatorMatrixCache] = None
+
+def _attach_worker(specs: Dict[str, Tuple[str, Tuple[int, ...], str]], defaults: Dict):
+    global _worker_defaults, _worker_indicators
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    _worker_defaults = defaults
+    _worker_indicators = IndicatorMatrixCache(_worker_arrays['closes'])
+
+def _strategy_indicators(parameters: Dict, strategies: List[str]) -> Dict[str, np.ndarray]:
+    """The indicators these strategies use, from the worker's cache"""
+    used = {key for name in strategies for key in STRATEGY_PARAMETERS[name]}
+    return _worker_indicators.get(
+        rsi_period=int(parameters['rsi_period']) if 'rsi_period' in used else None,
+        macd=(int(parameters['macd_fast']), int(parameters['macd_slow']), int(parameters['macd_signal']))
+        if 'macd_fast' in used else None,
+        bollinger=(int(parameters['bb_period']), float(parameters['bb_dev'])) if 'bb_period' in used else None,
+        ema_periods=(int(parameters['ema_fast']), int(parameters['ema_slow'])) if 'ema_fast' in used else ()
+    )
+
+def _evaluate(task: Tuple[Dict, List[str]]) -> Tuple[Dict, Dict[str, Dict]]:
+    parameters, strategies = task
+    backtester = Backtester(None, dict(_worker_defaults, **parameters))
+    results = backtester.run_matrices(
+        _worker_arrays['closes'],
+        _worker_arrays['highs'],
+        _worker_arrays['lows'],
+        equity=False,
+        strategies=strategies,
+        indicators=_strategy_indicators(backtester.parameters, strategies)
+    )
+    return parameters, results
+
+class StrategyOptimizer:
+    """Parallel parameter sweeps of the built-in strategies over historical bars"""
+
+    def __init__(self, config, workers: Optional[int] = None, metric: Optional[str] = None, min_trades: Optional[int] = None):
+        self.config = config
+        self.workers = workers or config.OPTIMIZER_WORKERS or None
+        self.metric = metric or config.OPTIMIZER_METRIC
+        self.min_trades = min_trades if min_trades is not None else config.OPTIMIZER_MIN_TRADES
+
+    def optimize(self, market_data: Dict[str, pd.DataFrame], strategies: Optional[List[str]] = None,
+                 space: Optional[Dict[str, List]] = None, samples: Optional[int] = None,
+                 seed: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """Sweep parameters for each strategy and return ranked results
+
+        Each strategy is searched over the parameters it uses (see
+        STRATEGY_PARAMETERS), plus the trade settings if `space` lists them.
+        With `samples` set, that many random combinations are drawn instead of
+        the full grid. Returns, per strategy, result dictionaries sorted best
+        first by the configured metric.
+        """
+        strategies = strategies or list(STRATEGY_PARAMETERS)
+        space = space or DEFAULT_SEARCH_SPACE
+
+        symbols, closes = build_price_matrix(market_data, 'Close')
+        if not symbols:
+            return {}
+        _, highs = build_price_matrix(market_data, 'High')
+        _, lows = build_price_matrix(market_data, 'Low')
+
+        # Strategies sharing a parameter set are evaluated together
+        tasks = []
+        for keys, group in itertools.groupby(strategies, key=lambda name: tuple(STRATEGY_PARAMETERS[name])):
+            group = list(group)
+            subspace = {key: space[key] for key in list(keys) + TRADE_PARAMETERS if key in space}
+            combinations = random_parameters(subspace, samples, seed) if samples else parameter_grid(subspace)
+            tasks.extend((parameters, group) for parameters in combinations)
+
+        logger.info(f"Evaluating {len(tasks)} parameter sets on {len(symbols)} symbols x {closes.shape[1]} bars")
+        ranked: Dict[str, List[Dict]] = {name: [] for name in strategies}
+        defaults = default_parameters(self.config)
+
+        with SharedPriceArrays({'closes': closes, 'highs': highs, 'lows': lows}) as shared:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach_worker,
+                                     initargs=(shared.specs, defaults)) as executor:
+                chunksize = max(1, len(tasks) // ((self.workers or 1) * 8))
+                for parameters, results in executor.map(_evaluate, tasks, chunksize=chunksize):
+                    for name, result in results.items():
+                        if result['trades'] >= self.min_trades:
+                            ranked[name].append(dict(result, parameters=dict(parameters)))
+
+        for name in ranked:
+            ranked[name].sort(key=lambda result: result[self.metric], reverse=True)
+        return ranked
+
+    def save_best_parameters(self, ranked: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+        """Store the best parameter set of each strategy in Strategy.parameters
+
+        Must run inside a Flask application context. Strategies without a row
+        yet are created.
+        """
+        from models import db, Strategy
+
+        saved = {}
+        for name, results in ranked.items():
+            if not results:
+                continue
+            best = results[0]
+            strategy = Strategy.query.filter_by(name=name).first()
+            if not strategy:
+                strategy = Strategy(name=name, description=f"{name} signals")
+                db.session.add(strategy)
+            strategy.parameters = dict(best['parameters'])
+            saved[name] = strategy.parameters
+            logger.info(f"{name}: {self.metric}={best[self.metric]:.2f} over {best['trades']} trades with {best['parameters']}")
+        db.session.commit()
+        return saved
+
+def main():
+    from app import app
+    from config import Config
+    from technical_analysis import TechnicalAnalyzer
+
+    parser = argparse.ArgumentParser(description='Optimize strategy parameters and store the best sets')
+    parser.add_argument('--period', default='10y', help='History to optimize over, as a yfinance period string')
+    parser.add_argument('--symbols', nargs='*', default=Config.MONITORED_ASSETS)
+    parser.add_argument('--strategies', nargs='*', default=None)
+    parser.add_argument('--samples', type=int, default=None, help='Random combinations per strategy instead of the full grid')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='Print the best sets without saving them')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    market_data = TechnicalAnalyzer(Config).get_market_data_bulk(args.symbols, period=args.period)
+    optimizer = StrategyOptimizer(Config, workers=args.workers)
+    started = datetime.utcnow()
+    ranked = optimizer.optimize(market_data, strategies=args.strategies, samples=args.samples)
+    logger.info(f"Sweep finished in {(datetime.utcnow() - started).total_seconds():.1f}s")
+
+    if args.dry_run:
+        for name, results in ranked.items():
+            if results:
+                print(name, results[0]['parameters'], f"{optimizer.metric}={results[0][optimizer.metric]:.2f}")
+        return
+
+    with app.app_context():
+        optimizer.save_best_parameters(ranked)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from telegram.constants import ParseMode
+
+from delivery import BLOCKED, DELIVERED, FAILED, FANOUT_SECONDS, format_digest_messages, format_signal_message
+from delivery_shards import shard_for
+from models import db, OutboxMessage, OutboxStatus
+from subscriber_index import subscriber_index
+
+logger = logging.getLogger(__name__)
+
+# Outbox row kinds: a text for one chat, or a job fanned out into such rows
+MESSAGE = 'message'
+SIGNAL = 'signal'
+DIGEST = 'digest'
+BROADCAST = 'broadcast'
+
+def enqueue_message(chat_id: str, text: str, notification_type: Optional[str] = None, commit: bool = True) -> OutboxMessage:
+    """Queue a text for one chat; delivered texts with a notification type are logged as Notifications"""
+    message = OutboxMessage(
+        kind=MESSAGE,
+        chat_id=str(chat_id),
+        payload={'text': text, 'notification_type': notification_type}
+    )
+    db.session.add(message)
+    if commit:
+        db.session.commit()
+    return message
+
+def enqueue_signal(signal_data: dict, commit: bool = True) -> OutboxMessage:
+    """Queue a signal for the channel and every active subscriber"""
+    job = OutboxMessage(kind=SIGNAL, payload=dict(signal_data))
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+def enqueue_digest(signals: List[dict], window_minutes: float = 0, commit: bool = True) -> OutboxMessage:
+    """Queue signals to go out as one digest per recipient
+    
+    With a window, signals are added to the digest that is still collecting
+    (one opened less than `window_minutes` ago) instead of starting a new one,
+    and the digest is sent when its window closes.
+    """
+    now = datetime.utcnow()
+    job = None
+    if window_minutes > 0:
+        # Leave a margin so a digest about to be claimed is not modified
+        job = OutboxMessage.query.filter(
+            OutboxMessage.kind == DIGEST,
+            OutboxMessage.status == OutboxStatus.PENDING,
+            OutboxMessage.available_at > now + timedelta(seconds=5)
+        ).order_by(OutboxMessage.id.desc()).first()
+    if job:
+        job.payload = {'signals': job.payload['signals'] + [dict(signal_data) for signal_data in signals]}
+    else:
+        job = OutboxMessage(
+            kind=DIGEST,
+            payload={'signals': [dict(signal_data) for signal_data in signals]},
+            available_at=now + timedelta(minutes=window_minutes)
+        )
+        db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+def enqueue_broadcast(text: str, notification_type: str = 'broadcast', commit: bool = True) -> OutboxMessage:
+    """Queue a text for every active subscriber"""
+    job = OutboxMessage(kind=BROADCAST, payload={'text': text, 'notification_type': notification_type})
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+class OutboxWorker:
+    """Drains the outbox table on the bot's event loop
+
+    Routes and scheduled jobs only insert rows, so they never wait on Telegram
+    and nothing queued is lost on restart. Each of OUTBOX_WORKERS consumers
+    claims a batch of due rows with a claim token, fans signal and broadcast
+    jobs out into one row per chat, and sends message rows through the bot's
+    MessageDispatcher. Failed sends are retried with exponential backoff up to
+    OUTBOX_MAX_ATTEMPTS; rows left claimed by a crashed process are released
+    after OUTBOX_LEASE_SECONDS. Delivery is at least once.
+
+    With delivery shards, jobs are not fanned out into rows but published to
+    the shard processes, and only the sends that failed there are queued as
+    message rows for retry. If a shard could not deliver a job at all, the
+    job is fanned out into message rows for that shard's chats only, so the
+    other shards' chats do not get it twice. The job's lease is renewed while
+    the shards work. A job that raises is retried with backoff and marked
+    failed after OUTBOX_MAX_ATTEMPTS, without holding up the rest of the batch.
+    """
+
+    def __init__(self, bot, app, config):
+        self.bot = bot
+        self.app = app
+        self.config = config
+        self.batch_size = config.OUTBOX_BATCH_SIZE
+        self.workers = config.OUTBOX_WORKERS
+        self.poll_interval = config.OUTBOX_POLL_INTERVAL
+        self.max_attempts = config.OUTBOX_MAX_ATTEMPTS
+        self.lease = timedelta(seconds=config.OUTBOX_LEASE_SECONDS)
+        self.retry_backoff = config.OUTBOX_RETRY_BACKOFF
+        self.tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _run_db(self, function, *args):
+        """Run blocking database work in a thread with its own app context and session"""
+        def call():
+            with self.app.app_context():
+                return function(*args)
+        return await asyncio.to_thread(call)
+
+    async def _consume(self):
+        while True:
+            try:
+                batch = await self._run_db(self._claim_batch)
+                if not batch:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self._process(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error draining outbox: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    def _claim_batch(self) -> List[Dict]:
+        """Mark up to batch_size due rows as ours and return them as plain dictionaries"""
+        now = datetime.utcnow()
+        db.session.query(OutboxMessage).filter(
+            OutboxMessage.status == OutboxStatus.SENDING,
+            OutboxMessage.locked_at < now - self.lease
+        ).update({'status': OutboxStatus.PENDING, 'claim_token': None}, synchronize_session=False)
+
+        due = db.session.query(OutboxMessage.id).filter(
+            OutboxMessage.status == OutboxStatus.PENDING,
+            OutboxMessage.available_at <= now
+        ).order_by(OutboxMessage.id).limit(self.batch_size)
+        token = str(uuid.uuid4())
+        db.session.query(OutboxMessage).filter(
+            OutboxMessage.id.in_([row.id for row in due]),
+            OutboxMessage.status == OutboxStatus.PENDING
+        ).update({'status': OutboxStatus.SENDING, 'claim_token': token, 'locked_at': now}, synchronize_session=False)
+        db.session.commit()
+
+        rows = db.session.query(OutboxMessage).filter_by(claim_token=token, status=OutboxStatus.SENDING).all()
+        return [
+            {'id': row.id, 'kind': row.kind, 'chat_id': row.chat_id, 'payload': row.payload,
+             'attempts': row.attempts or 0, 'claim_token': token, 'created_at': row.created_at, 'job_id': row.job_id}
+            for row in rows
+        ]
+
+    def _job_texts(self, job: Dict) -> Tuple[List[str], List[str], Optional[str]]:
+        """Texts of a job for the channel and for each subscriber, and their notification type"""
+        payload = job['payload']
+        if job['kind'] == DIGEST:
+            texts = format_digest_messages(payload['signals'])
+            channel_texts = texts
+        elif job['kind'] == SIGNAL:
+            channel_texts = [format_signal_message(payload, f"{payload['type']} SIGNAL")]
+            texts = [format_signal_message(payload, "NEW SIGNAL")]
+        else:
+            return [], [payload['text']], payload.get('notification_type')
+        if not self.config.TELEGRAM_CHANNEL_ID:
+            channel_texts = []
+        return channel_texts, texts, None
+
+    def _insert_messages(self, rows: List[tuple], queued_at: datetime, attempts: int = 0,
+                         available_at: Optional[datetime] = None, job_id: Optional[int] = None):
+        """Insert (chat_id, text, notification_type, category) message rows for a job queued at `queued_at`"""
+        now = datetime.utcnow()
+        db.session.execute(db.insert(OutboxMessage), [
+            {
+                'kind': MESSAGE,
+                'chat_id': str(chat_id),
+                'job_id': job_id,
+                'payload': {'text': text, 'notification_type': notification_type,
+                            'category': category, 'queued_at': queued_at.isoformat()},
+                'status': OutboxStatus.PENDING,
+                'attempts': attempts,
+                'available_at': available_at or now,
+                'created_at': now
+            }
+            for chat_id, text, notification_type, category in rows
+        ])
+
+    def _complete_job(self, job: Dict):
+        db.session.query(OutboxMessage).filter_by(id=job['id']).update(
+            {'status': OutboxStatus.SENT, 'sent_at': datetime.utcnow(), 'claim_token': None}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def _expand_job(self, job: Dict) -> int:
+        """Replace a signal, digest or broadcast job by message rows for each recipient"""
+        channel_texts, texts, notification_type = self._job_texts(job)
+        rows = [(self.config.TELEGRAM_CHANNEL_ID, text, None, 'channel') for text in channel_texts]
+        rows.extend(
+            (chat_id, text, notification_type, job['kind'])
+            for chat_id in subscriber_index.chat_ids() for text in texts
+        )
+        if rows:
+            self._insert_messages(rows, job['created_at'], job_id=job['id'])
+        self._complete_job(job)
+        return len(rows)
+
+    def _renew_lease(self, job: Dict):
+        db.session.query(OutboxMessage).filter_by(id=job['id'], claim_token=job['claim_token']).update(
+            {'locked_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def _finish_sharded_job(self, job: Dict, report: Dict):
+        """Queue the sends that failed in the shards for retry and mark the job sent
+
+        The chats of shards that failed the whole job get it as message rows,
+        sent by this process.
+        """
+        if report['failed_sends']:
+            retry_at = datetime.utcnow() + timedelta(seconds=self.retry_backoff)
+            self._insert_messages(report['failed_sends'], job['created_at'], attempts=1, available_at=retry_at)
+        if report['failed_shards']:
+            failed_shards = set(report['failed_shards'])
+            shards = self.bot.shards.shards
+            channel_texts, texts, notification_type = self._job_texts(job)
+            channel_id = self.config.TELEGRAM_CHANNEL_ID
+            rows = []
+            if channel_id and shard_for(channel_id, shards) in failed_shards:
+                rows.extend((channel_id, text, None, 'channel') for text in channel_texts)
+            rows.extend(
+                (chat_id, text, notification_type, job['kind'])
+                for chat_id in subscriber_index.chat_ids() if shard_for(chat_id, shards) in failed_shards
+                for text in texts
+            )
+            if rows:
+                self._insert_messages(rows, job['created_at'])
+        self._complete_job(job)
+        subscriber_index.block(*report['blocked_chats'])
+
+    def _retry_job(self, job: Dict, error: str):
+        """Release a job that raised for another attempt after a backoff, or fail it"""
+        attempts = job['attempts'] + 1
+        update = {'attempts': attempts, 'claim_token': None, 'last_error': error[:500]}
+        if attempts >= self.max_attempts:
+            update['status'] = OutboxStatus.FAILED
+        else:
+            update['status'] = OutboxStatus.PENDING
+            update['available_at'] = datetime.utcnow() + timedelta(seconds=self.retry_backoff * 2 ** (attempts - 1))
+        db.session.query(OutboxMessage).filter_by(id=job['id'], claim_token=job['claim_token']).update(
+            update, synchronize_session=False
+        )
+        db.session.commit()
+
+    async def _publish_job(self, job: Dict):
+        channel_texts, texts, notification_type = self._job_texts(job)
+        delivery = asyncio.ensure_future(
+            self.bot.shards.publish(channel_texts, texts, notification_type, job['kind'], job['created_at'])
+        )
+        try:
+            # Keep the job claimed for as long as the shards take to deliver it
+            while not (await asyncio.wait({delivery}, timeout=self.lease.total_seconds() / 3))[0]:
+                await self._run_db(self._renew_lease, job)
+        except asyncio.CancelledError:
+            delivery.cancel()
+            raise
+        report = delivery.result()
+        await self._run_db(self._finish_sharded_job, job, report)
+        if report['failed_shards']:
+            logger.warning(f"Outbox {job['kind']} job {job['id']} failed on shards {sorted(report['failed_shards'])}, "
+                           f"queued for their chats: {report['errors'][0]}")
+        logger.info(f"Outbox {job['kind']} job {job['id']} delivered by shards: {report[DELIVERED]} delivered, "
+                    f"{report[FAILED]} failed, {report[BLOCKED]} blocked")
+
+    def _record_results(self, results: List[tuple]):
+        """Persist send outcomes in one bulk update and log delivered notifications"""
+        now = datetime.utcnow()
+        updates = []
+        notifications = []
+        blocked = []
+        for message, result in results:
+            attempts = message['attempts'] + 1
+            update = {'id': message['id'], 'attempts': attempts, 'claim_token': None}
+            if result == DELIVERED:
+                update.update(status=OutboxStatus.SENT, sent_at=now, last_error=None)
+                if message['payload'].get('notification_type'):
+                    notifications.append(message)
+            elif result == BLOCKED or attempts >= self.max_attempts:
+                if result == BLOCKED:
+                    blocked.append(message['chat_id'])
+                update.update(status=OutboxStatus.FAILED, last_error=result)
+            else:
+                retry_at = now + timedelta(seconds=self.retry_backoff * 2 ** (attempts - 1))
+                update.update(status=OutboxStatus.PENDING, available_at=retry_at, last_error=result)
+            updates.append(update)
+        db.session.execute(db.update(OutboxMessage), updates)
+        db.session.commit()
+        subscriber_index.block(*blocked)
+        self._observe_fanouts({
+            message['job_id'] for (message, _), update in zip(results, updates)
+            if message['job_id'] and update['status'] != OutboxStatus.PENDING
+        }, now)
+
+        if self.bot.notification_writer:
+            for message in notifications:
+                self.bot.notification_writer.add(
+                    message['chat_id'], message['payload']['text'], message['payload']['notification_type']
+                )
+
+    def _observe_fanouts(self, job_ids: set, now: datetime):
+        """Record the fan-out time of the jobs whose last message row has just been sent or given up"""
+        if not job_ids:
+            return
+        unfinished = {job_id for job_id, in db.session.query(OutboxMessage.job_id).filter(
+            OutboxMessage.job_id.in_(job_ids),
+            OutboxMessage.status.in_([OutboxStatus.PENDING, OutboxStatus.SENDING])
+        ).distinct()}
+        finished = job_ids - unfinished
+        if not finished:
+            return
+        for kind, created_at in db.session.query(OutboxMessage.kind, OutboxMessage.created_at).filter(
+            OutboxMessage.id.in_(finished)
+        ):
+            FANOUT_SECONDS.observe((now - created_at).total_seconds(), category=kind)
+
+    @staticmethod
+    def _queued_at(message: Dict) -> datetime:
+        """When the message, or the job it was fanned out from, entered the outbox"""
+        queued_at = message['payload'].get('queued_at')
+        return datetime.fromisoformat(queued_at) if queued_at else message['created_at']
+
+    async def _process(self, batch: List[Dict]):
+        messages = []
+        for row in batch:
+            if row['kind'] == MESSAGE:
+                messages.append(row)
+                continue
+            try:
+                if self.bot.shards is not None:
+                    await self._publish_job(row)
+                    continue
+                recipients = await self._run_db(self._expand_job, row)
+                logger.info(f"Outbox {row['kind']} job {row['id']} queued for {recipients} chats")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox {row['kind']} job {row['id']} failed: {e}")
+                await self._run_db(self._retry_job, row, str(e))
+
+        if not messages:
+            return
+        results = await asyncio.gather(*(
+            self.bot.dispatcher.send(
+                message['chat_id'], message['payload']['text'], message['payload'].get('category', MESSAGE),
+                self._queued_at(message), parse_mode=ParseMode.MARKDOWN
+            )
+            for message in messages
+        ))
+        await self._run_db(self._record_results, list(zip(messages, results)))
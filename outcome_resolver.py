@@ -0,0 +1,144 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from market_data import PERIOD_OFFSETS
+from models import db, Signal, SignalType, TradeOutcome
+from render_cache import RECENT_SIGNALS, render_cache
+
+logger = logging.getLogger(__name__)
+
+class OutcomeResolver:
+    """Closes pending signals whose target or stop loss has been reached
+
+    All pending signals are loaded in one query and grouped by asset. For each
+    asset the bars after every signal are compared against its levels in a
+    single (signals x bars) array operation to find which level was touched
+    first, and all closed signals are written back with one bulk update.
+    """
+
+    def __init__(self, config, analyzer):
+        self.config = config
+        self.analyzer = analyzer
+        self.interval = config.OUTCOME_BAR_INTERVAL
+        self.max_open_days = config.SIGNAL_MAX_OPEN_DAYS
+
+    def _load_pending(self) -> pd.DataFrame:
+        rows = db.session.query(
+            Signal.id,
+            Signal.asset_symbol,
+            Signal.signal_type,
+            Signal.entry_price,
+            Signal.target_price,
+            Signal.stop_loss,
+            Signal.timestamp
+        ).filter(
+            Signal.outcome == TradeOutcome.PENDING,
+            Signal.entry_price.isnot(None),
+            Signal.target_price.isnot(None),
+            Signal.stop_loss.isnot(None)
+        ).all()
+        return pd.DataFrame(rows, columns=['id', 'symbol', 'signal_type', 'entry', 'target', 'stop', 'timestamp'])
+
+    def _history_period(self, oldest: datetime) -> str:
+        """Smallest provider period reaching back to the oldest pending signal"""
+        now = pd.Timestamp.now(tz='UTC')
+        oldest = pd.Timestamp(oldest).tz_localize('UTC')
+        for period, offset in PERIOD_OFFSETS.items():
+            if now - offset <= oldest:
+                return period
+        return 'max'
+
+    def resolve_symbol(self, signals: pd.DataFrame, bars: pd.DataFrame) -> List[Dict]:
+        """Outcomes for one asset's pending signals against its bar history
+
+        Only bars starting after a signal's timestamp count. A bar touching both
+        levels is treated as a stop loss. Signals older than SIGNAL_MAX_OPEN_DAYS
+        that hit neither level are closed at the latest close.
+        """
+        index = pd.DatetimeIndex(bars.index)
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        bar_times = index.tz_convert('UTC').as_unit('ns').asi8
+        highs = bars['High'].to_numpy(dtype=float)
+        lows = bars['Low'].to_numpy(dtype=float)
+        closes = bars['Close'].to_numpy(dtype=float)
+
+        signal_times = pd.DatetimeIndex(signals['timestamp']).tz_localize('UTC').as_unit('ns').asi8
+        entry = signals['entry'].to_numpy(dtype=float)
+        target = signals['target'].to_numpy(dtype=float)
+        stop = signals['stop'].to_numpy(dtype=float)
+        is_buy = (signals['signal_type'] == SignalType.BUY).to_numpy()
+        direction = np.where(is_buy, 1.0, -1.0)
+
+        after = bar_times[None, :] > signal_times[:, None]
+        high_hit_target = highs[None, :] >= target[:, None]
+        low_hit_target = lows[None, :] <= target[:, None]
+        high_hit_stop = highs[None, :] >= stop[:, None]
+        low_hit_stop = lows[None, :] <= stop[:, None]
+        hit_target = after & np.where(is_buy[:, None], high_hit_target, low_hit_target)
+        hit_stop = after & np.where(is_buy[:, None], low_hit_stop, high_hit_stop)
+
+        bars_count = len(bar_times)
+        first_target = np.where(hit_target.any(axis=1), hit_target.argmax(axis=1), bars_count)
+        first_stop = np.where(hit_stop.any(axis=1), hit_stop.argmax(axis=1), bars_count)
+        stopped = (first_stop < bars_count) & (first_stop <= first_target)
+        targeted = (first_target < bars_count) & ~stopped
+
+        max_age = pd.Timedelta(days=self.max_open_days).value
+        expired = ~stopped & ~targeted & (pd.Timestamp.now(tz='UTC').value - signal_times > max_age) & after.any(axis=1)
+
+        exit_price = np.where(stopped, stop, np.where(targeted, target, closes[-1]))
+        exit_bar = np.where(stopped, first_stop, np.where(targeted, first_target, bars_count - 1))
+        profit_loss = direction * (exit_price / entry - 1) * 100
+
+        updates = []
+        resolved_at = datetime.utcnow()
+        ids = signals['id'].to_numpy()
+        closed_at = pd.to_datetime(bar_times[np.minimum(exit_bar, bars_count - 1)], utc=True).tz_localize(None)
+        for row in np.flatnonzero(stopped | targeted | expired):
+            updates.append({
+                'id': int(ids[row]),
+                'outcome': TradeOutcome.WIN if profit_loss[row] > 0 else TradeOutcome.LOSS,
+                'profit_loss': round(float(profit_loss[row]), 4),
+                'closed_at': closed_at[row].to_pydatetime(),
+                'resolved_at': resolved_at
+            })
+        return updates
+
+    def resolve_pending_signals(self) -> Dict[str, int]:
+        """Resolve every pending signal and persist the closed ones in one bulk update
+
+        Must run inside a Flask application context.
+        """
+        pending = self._load_pending()
+        summary = {'checked': len(pending), 'wins': 0, 'losses': 0, 'pending': len(pending)}
+        if pending.empty:
+            return summary
+
+        period = self._history_period(pending['timestamp'].min())
+        symbols = pending['symbol'].unique().tolist()
+        market_data = self.analyzer.get_market_data_bulk(symbols, period=period, interval=self.interval)
+
+        updates = []
+        for symbol, signals in pending.groupby('symbol'):
+            bars = market_data.get(symbol)
+            if bars is None or bars.empty:
+                continue
+            updates.extend(self.resolve_symbol(signals, bars))
+
+        if updates:
+            db.session.execute(db.update(Signal), updates)
+            db.session.commit()
+            # Bulk updates bypass the ORM events that invalidate the /signals response
+            render_cache.invalidate(RECENT_SIGNALS)
+
+        summary['wins'] = sum(1 for update in updates if update['outcome'] == TradeOutcome.WIN)
+        summary['losses'] = len(updates) - summary['wins']
+        summary['pending'] = len(pending) - len(updates)
+        logger.info(f"Resolved {len(updates)} of {len(pending)} pending signals "
+                    f"({summary['wins']} wins, {summary['losses']} losses)")
+        return summary
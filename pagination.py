@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+Cursor = Tuple[datetime, int]
+
+def encode_cursor(value: datetime, row_id: int) -> str:
+    return f"{value.isoformat()}_{row_id}"
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """Parse a cursor from a query string; malformed cursors are ignored"""
+    if not cursor:
+        return None
+    value, _, row_id = cursor.rpartition('_')
+    try:
+        return datetime.fromisoformat(value), int(row_id)
+    except ValueError:
+        return None
+
+class KeysetPage:
+    """One page of rows, newest first, with cursors to the neighbouring pages"""
+
+    def __init__(self, items: List, has_prev: bool, has_next: bool, sort_attribute: str):
+        self.items = items
+        self.has_prev = has_prev and bool(items)
+        self.has_next = has_next and bool(items)
+        self.prev_cursor = self._cursor(items[0], sort_attribute) if self.has_prev else None
+        self.next_cursor = self._cursor(items[-1], sort_attribute) if self.has_next else None
+
+    @staticmethod
+    def _cursor(row, sort_attribute: str) -> str:
+        return encode_cursor(getattr(row, sort_attribute), row.id)
+
+def keyset_paginate(query, sort_column, id_column, after: Optional[str] = None,
+                    before: Optional[str] = None, per_page: int = 20) -> KeysetPage:
+    """Page through `query` ordered by (sort_column, id_column) descending
+
+    Instead of an OFFSET, each page starts from the (sort value, id) of the
+    last row on the previous page, so an index on both columns finds any page
+    as quickly as the first. `after` continues to older rows and `before`
+    goes back to newer ones.
+    """
+    key = tuple_(sort_column, id_column)
+    after_cursor = decode_cursor(after)
+    before_cursor = decode_cursor(before)
+
+    if before_cursor and not after_cursor:
+        rows = query.filter(key > tuple_(*before_cursor)).order_by(
+            sort_column.asc(), id_column.asc()
+        ).limit(per_page + 1).all()
+        if len(rows) >= per_page:
+            has_newer = len(rows) > per_page
+            rows = rows[:per_page]
+            rows.reverse()
+            return KeysetPage(rows, has_newer, True, sort_column.key)
+        # Fewer newer rows than a page left: show the first page instead
+
+    if after_cursor:
+        query = query.filter(key < tuple_(*after_cursor))
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], after_cursor is not None, len(rows) > per_page, sort_column.key)
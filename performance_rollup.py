@@ -0,0 +1,130 @@
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from chart_payloads import refresh_charts
+from models import db, Performance, RollupWatermark, Signal, TradeOutcome
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'performance'
+
+class PerformanceRollup:
+    """Keeps the daily Performance rows current as signals close
+
+    A signal counts towards the day it closed. Each run looks only at signals
+    resolved since the watermark (the latest `resolved_at` already rolled up),
+    collects the days they closed on, and rebuilds just those days: their
+    Performance rows are deleted and re-inserted from one grouped query per
+    day. Every day has a totals row (strategy and asset empty), one row per
+    strategy and one per asset. The stored dashboard charts are recomputed in
+    the same transaction.
+    """
+
+    def _watermark(self) -> Optional[datetime]:
+        watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+        return watermark.value if watermark else None
+
+    def _set_watermark(self, value: datetime):
+        watermark = db.session.get(RollupWatermark, WATERMARK_NAME)
+        if watermark is None:
+            db.session.add(RollupWatermark(name=WATERMARK_NAME, value=value))
+        else:
+            watermark.value = value
+
+    def _touched_days(self, since: Optional[datetime], until: datetime) -> List[date]:
+        query = db.session.query(db.func.date(Signal.closed_at)).filter(
+            Signal.resolved_at <= until,
+            Signal.closed_at.isnot(None)
+        )
+        if since is not None:
+            query = query.filter(Signal.resolved_at > since)
+        # DATE() comes back as a string on SQLite and as a date elsewhere
+        return sorted({value if isinstance(value, date) else date.fromisoformat(value) for value, in query.distinct()})
+
+    def _day_rows(self, day: date) -> List[Dict]:
+        """Totals, per-strategy and per-asset rows for one day"""
+        start = datetime.combine(day, time.min)
+        groups = db.session.query(
+            Signal.strategy_used,
+            Signal.asset_symbol,
+            Signal.outcome,
+            db.func.count(Signal.id),
+            db.func.coalesce(db.func.sum(Signal.profit_loss), 0.0)
+        ).filter(
+            Signal.closed_at >= start,
+            Signal.closed_at < start + timedelta(days=1),
+            Signal.outcome.in_([TradeOutcome.WIN, TradeOutcome.LOSS])
+        ).group_by(Signal.strategy_used, Signal.asset_symbol, Signal.outcome).all()
+
+        totals: Dict[Tuple[Optional[str], Optional[str]], List] = {}
+        for strategy, asset_symbol, outcome, count, profit in groups:
+            keys = [(None, None), (None, asset_symbol)]
+            if strategy:
+                keys.append((strategy, None))
+            for key in keys:
+                wins, losses, total_profit = totals.get(key, (0, 0, 0.0))
+                if outcome == TradeOutcome.WIN:
+                    wins += count
+                else:
+                    losses += count
+                totals[key] = (wins, losses, total_profit + float(profit))
+
+        rows = []
+        for (strategy, asset_symbol), (wins, losses, total_profit) in totals.items():
+            total = wins + losses
+            rows.append({
+                'date': day,
+                'strategy': strategy,
+                'asset_symbol': asset_symbol,
+                'total_signals': total,
+                'winning_signals': wins,
+                'losing_signals': losses,
+                'total_profit': round(total_profit, 4),
+                'success_rate': wins / total * 100 if total else 0.0
+            })
+        return rows
+
+    def refresh_days(self, days: Iterable[date]) -> int:
+        """Rebuild the Performance rows of `days`; returns the number of rows written"""
+        days = sorted(set(days))
+        if not days:
+            return 0
+        rows = []
+        for day in days:
+            rows.extend(self._day_rows(day))
+        db.session.query(Performance).filter(Performance.date.in_(days)).delete(synchronize_session=False)
+        if rows:
+            db.session.execute(db.insert(Performance), rows)
+        refresh_charts()
+        return len(rows)
+
+    def run(self) -> Dict[str, int]:
+        """Roll up signals resolved since the last run; must run inside an application context"""
+        since = self._watermark()
+        until = db.session.query(db.func.max(Signal.resolved_at)).scalar()
+        if until is None or (since is not None and until <= since):
+            return {'days': 0, 'rows': 0}
+
+        days = self._touched_days(since, until)
+        try:
+            written = self.refresh_days(days)
+            self._set_watermark(until)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        logger.info(f"Rolled up performance for {len(days)} days ({written} rows)")
+        return {'days': len(days), 'rows': written}
+
+    def rebuild(self) -> Dict[str, int]:
+        """Recompute every day from scratch"""
+        try:
+            db.session.query(Performance).delete(synchronize_session=False)
+            db.session.query(RollupWatermark).filter_by(name=WATERMARK_NAME).delete(synchronize_session=False)
+            refresh_charts()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return self.run()
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import Signal
+
+logger = logging.getLogger(__name__)
+
+# Key of the shared /signals response
+RECENT_SIGNALS = 'recent_signals'
+
+class RenderCache:
+    """LRU cache of rendered bot responses with a TTL
+
+    `get_or_render` makes concurrent misses for the same key share one render,
+    so a burst of identical commands costs one query. Every invalidation bumps
+    the key's generation; a render that started before the invalidation is
+    returned to its callers but not stored. The TTL bounds staleness for
+    changes made by other processes, which cannot invalidate this cache.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, key: Hashable) -> tuple:
+        return self._epoch, self._generations.get(key, 0)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: str, generation: Optional[tuple] = None, ttl: Optional[float] = None):
+        """Store `value` unless `key` was invalidated since `generation` was read"""
+        with self._lock:
+            if generation is not None and generation != self._generation(key):
+                return
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        """Drop `keys` and discard renders of them already in progress"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    async def get_or_render(self, key: Hashable, render: Callable[[], Awaitable[str]]) -> str:
+        """Cached value for `key`, or the result of `render()` stored under it"""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+
+        self.misses += 1
+        with self._lock:
+            generation = self._generation(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await render()
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the exception; nobody else has to retrieve it
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        self.set(key, value, generation)
+        return value
+
+# Shared by the bot's command handlers
+render_cache = RenderCache()
+
+# Signals changed through the ORM invalidate the /signals text once committed
+@event.listens_for(Signal, 'after_insert')
+@event.listens_for(Signal, 'after_update')
+@event.listens_for(Signal, 'after_delete')
+def _signal_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['signals_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('signals_changed', False):
+        render_cache.invalidate(RECENT_SIGNALS)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('signals_changed', None)
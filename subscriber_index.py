@@ -0,0 +1,224 @@
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import db, Subscription, SubscriptionStatus, User
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_BLOCKED = object()
+_UNBLOCKED = object()
+
+class ActiveSubscriberIndex:
+    """In-memory set of the telegram ids that signals are delivered to
+
+    Built from one query on first use, then kept current by explicit calls:
+    `update` when a subscription is created, paid or extended, `remove` when a
+    subscription is suspended, `block` when a chat blocks the bot and
+    `unblock` when it sends an update again. Changes
+    made while `load` queries the database are replayed onto its result, so
+    none are lost to a concurrent reload. Subscriptions with an
+    end date sit in a min-heap ordered by expiry, so trials and lapsed plans
+    drop out on their own without touching the database. `version` changes on
+    every membership change and `subscription_version` on every change to one
+    user's subscription, so both can be used to key caches.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._end_dates: Dict[str, Optional[datetime]] = {}
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._snapshot: Optional[List[str]] = None
+        self._user_versions: Dict[str, int] = {}
+        self._blocked: Set[str] = set()
+        # One list per running load() collecting (telegram_id, end_date, _MISSING, _BLOCKED or _UNBLOCKED)
+        self._journals: List[List[Tuple[str, object]]] = []
+        self._generation = 0
+        self.loaded = False
+        self.version = 0
+
+    def load(self):
+        """Rebuild the index from the database; must run inside an application context"""
+        journal: List[Tuple[str, object]] = []
+        with self._lock:
+            self._journals.append(journal)
+        try:
+            rows = db.session.query(User.telegram_id, Subscription.end_date).join(
+                Subscription, Subscription.user_id == User.id
+            ).filter(
+                Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE]),
+                User.blocked_at.is_(None)
+            ).all()
+            blocked = {telegram_id for telegram_id, in db.session.query(User.telegram_id).filter(User.blocked_at.isnot(None))}
+        except Exception:
+            with self._lock:
+                self._journals.remove(journal)
+            raise
+        with self._lock:
+            self._journals.remove(journal)
+            self._end_dates = {}
+            self._expiry_heap = []
+            now = datetime.utcnow()
+            for telegram_id, end_date in rows:
+                if end_date is None or end_date > now:
+                    self._end_dates[telegram_id] = end_date
+                    if end_date is not None:
+                        self._expiry_heap.append((end_date, telegram_id))
+            heapq.heapify(self._expiry_heap)
+            self._blocked = blocked
+            # Changes made while the query ran may not be in its result
+            for telegram_id, end_date in journal:
+                if end_date is _MISSING:
+                    self._end_dates.pop(telegram_id, None)
+                elif end_date is _BLOCKED:
+                    self._blocked.add(telegram_id)
+                elif end_date is _UNBLOCKED:
+                    self._blocked.discard(telegram_id)
+                else:
+                    self._set(telegram_id, end_date)
+            self._user_versions = {}
+            self._generation += 1
+            self._changed()
+            self.loaded = True
+        logger.info(f"Loaded {len(self._end_dates)} active subscribers")
+
+    def _changed(self, *telegram_ids: str):
+        self._snapshot = None
+        self.version += 1
+        for telegram_id in telegram_ids:
+            self._user_versions[telegram_id] = self._user_versions.get(telegram_id, 0) + 1
+
+    def _expire(self, now: datetime):
+        """Drop every subscription whose end date has passed"""
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            end_date, telegram_id = heapq.heappop(self._expiry_heap)
+            # Entries superseded by a later update are skipped
+            if self._end_dates.get(telegram_id) == end_date:
+                del self._end_dates[telegram_id]
+                expired.append(telegram_id)
+        if expired:
+            self._changed(*expired)
+
+    def _set(self, telegram_id: str, end_date: Optional[datetime]):
+        if end_date is not None and end_date <= datetime.utcnow():
+            self._end_dates.pop(telegram_id, None)
+            return
+        self._end_dates[telegram_id] = end_date
+        if end_date is not None:
+            heapq.heappush(self._expiry_heap, (end_date, telegram_id))
+
+    def update(self, telegram_id: str, end_date: Optional[datetime]):
+        """Record an active subscription ending at `end_date` (None: never)"""
+        telegram_id = str(telegram_id)
+        with self._lock:
+            for journal in self._journals:
+                journal.append((telegram_id, end_date))
+            if not self.loaded:
+                return
+            self._set(telegram_id, end_date)
+            self._changed(telegram_id)
+
+    def remove(self, *telegram_ids: str):
+        """Stop delivering to these chats until their subscription is updated again"""
+        telegram_ids = [str(telegram_id) for telegram_id in telegram_ids]
+        with self._lock:
+            for journal in self._journals:
+                journal.extend((telegram_id, _MISSING) for telegram_id in telegram_ids)
+            if not self.loaded:
+                return
+            removed = [
+                telegram_id for telegram_id in telegram_ids
+                if self._end_dates.pop(telegram_id, _MISSING) is not _MISSING
+            ]
+            if removed:
+                self._changed(*removed)
+
+    def _journal_blocked(self, telegram_ids: List[str], marker: object):
+        with self._lock:
+            for journal in self._journals:
+                journal.extend((telegram_id, marker) for telegram_id in telegram_ids)
+            if marker is _BLOCKED:
+                self._blocked.update(telegram_ids)
+            else:
+                self._blocked.difference_update(telegram_ids)
+
+    def block(self, *telegram_ids: str):
+        """Stop delivering to chats that blocked the bot until they send an update
+
+        The block is stored on the user, so later loads leave these chats out
+        too. Their subscriptions are not changed. Must run inside an
+        application context.
+        """
+        telegram_ids = list({str(telegram_id) for telegram_id in telegram_ids})
+        if not telegram_ids:
+            return
+        now = datetime.utcnow()
+        try:
+            for user in User.query.filter(User.telegram_id.in_(telegram_ids), User.blocked_at.is_(None)):
+                user.blocked_at = now
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._journal_blocked(telegram_ids, _BLOCKED)
+        self.remove(*telegram_ids)
+        logger.info(f"Stopped delivering to {len(telegram_ids)} chats that blocked the bot")
+
+    def is_blocked(self, telegram_id: str) -> bool:
+        with self._lock:
+            return str(telegram_id) in self._blocked
+
+    def unblock(self, telegram_id: str):
+        """Deliver to a chat that blocked the bot again, if its subscription is still active
+
+        Must run inside an application context.
+        """
+        telegram_id = str(telegram_id)
+        user = User.query.options(db.joinedload(User.subscription)).filter_by(telegram_id=telegram_id).first()
+        subscription = user.subscription if user else None
+        end_date = subscription.end_date if subscription else None
+        active = subscription is not None and subscription.status in (SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE)
+        if user is not None and user.blocked_at is not None:
+            try:
+                user.blocked_at = None
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            logger.info(f"Chat {telegram_id} unblocked the bot")
+        self._journal_blocked([telegram_id], _UNBLOCKED)
+        if active:
+            self.update(telegram_id, end_date)
+
+    def chat_ids(self) -> List[str]:
+        """Current recipients; the list is shared and must not be modified"""
+        if not self.loaded:
+            self.load()
+        with self._lock:
+            self._expire(datetime.utcnow())
+            if self._snapshot is None:
+                self._snapshot = list(self._end_dates)
+            return self._snapshot
+
+    def subscription_version(self, telegram_id: str) -> Tuple[int, int]:
+        """Changes whenever this user's subscription is updated, removed or expires"""
+        with self._lock:
+            self._expire(datetime.utcnow())
+            return self._generation, self._user_versions.get(str(telegram_id), 0)
+
+    def __contains__(self, telegram_id) -> bool:
+        with self._lock:
+            self._expire(datetime.utcnow())
+            return str(telegram_id) in self._end_dates
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(datetime.utcnow())
+            return len(self._end_dates)
+
+# Shared by the Flask routes, the scheduler and the bot
+subscriber_index = ActiveSubscriberIndex()
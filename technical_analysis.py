@@ -1,29 +1,54 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import ta
-from datetime import datetime, timedelta
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 import logging
 
+from bar_store import BarStore
+from market_data import PERIOD_OFFSETS, MarketDataProvider, create_provider, resample_bars
+from indicators import IndicatorEngine, build_price_matrix, compute_indicator_matrix
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STRENGTH_ORDER = {'strong': 3, 'medium': 2, 'weak': 1}
+
 class TechnicalAnalyzer:
-    def __init__(self, config):
+    def __init__(self, config, provider: Optional[MarketDataProvider] = None):
         self.config = config
+        self.provider = provider if provider is not None else create_provider(config)
         self.rsi_period = config.RSI_PERIOD
         self.rsi_overbought = config.RSI_OVERBOUGHT
         self.rsi_oversold = config.RSI_OVERSOLD
         self.macd_fast = config.MACD_FAST
         self.macd_slow = config.MACD_SLOW
         self.macd_signal = config.MACD_SIGNAL
+        self.fetch_batch_size = config.FETCH_BATCH_SIZE
+        self.fetch_max_workers = config.FETCH_MAX_WORKERS
+        self.last_fetch_failures: Dict[str, str] = {}
+        self.bar_store = BarStore(config.BAR_CACHE_DIR) if config.BAR_CACHE_ENABLED and self.provider.cacheable else None
+        self.streaming_indicators = config.STREAMING_INDICATORS_ENABLED
+        self.vectorized_analysis = config.VECTORIZED_ANALYSIS_ENABLED
+        self.multi_timeframe = config.MULTI_TIMEFRAME_ENABLED
+        self.base_interval = config.BASE_INTERVAL
+        self.base_period = config.BASE_PERIOD
+        self.timeframes = config.ANALYSIS_TIMEFRAMES
+        self.indicator_engines: Dict[str, IndicatorEngine] = {}
+        self.indicator_state_path = config.INDICATOR_STATE_PATH if self.provider.cacheable else None
+        if self.streaming_indicators and self.indicator_state_path and os.path.exists(self.indicator_state_path):
+            self.load_indicator_state(self.indicator_state_path)
         
-    def get_market_data(self, symbol: str, period: str = "1mo") -> pd.DataFrame:
+    def get_market_data(self, symbol: str, period: str = "1mo", interval: str = "1d") -> pd.DataFrame:
         """Fetch market data for a given symbol"""
         try:
-            ticker = yf.Ticker(symbol)
-            data = ticker.history(period=period)
+            if self.bar_store is not None and period in PERIOD_OFFSETS:
+                data = self._get_cached_market_data(symbol, period, interval)
+            else:
+                data = self._fetch_history(symbol, period=period, interval=interval)
             if data.empty:
                 logger.warning(f"No data found for {symbol}")
                 return pd.DataFrame()
@@ -32,6 +57,129 @@ class TechnicalAnalyzer:
             logger.error(f"Error fetching data for {symbol}: {e}")
             return pd.DataFrame()
     
+    def _fetch_history(self, symbol: str, period: str = None, interval: str = "1d", start=None) -> pd.DataFrame:
+        """Download bars for one symbol from the market data provider"""
+        return self.provider.history(symbol, period=period, interval=interval, start=start)
+    
+    def _period_start(self, period: str) -> pd.Timestamp:
+        """First timestamp covered by a yfinance period string"""
+        return self.provider.now() - PERIOD_OFFSETS[period]
+    
+    def _cache_resume_point(self, symbol: str, interval: str, period_start: pd.Timestamp) -> Optional[pd.Timestamp]:
+        """Timestamp to resume downloading from, or None if a full download is needed"""
+        if not self.bar_store.verify(symbol, interval):
+            return None
+        coverage_start = self.bar_store.coverage_start(symbol, interval)
+        if coverage_start is None or coverage_start > period_start:
+            return None
+        return self.bar_store.last_timestamp(symbol, interval)
+    
+    def _get_cached_market_data(self, symbol: str, period: str, interval: str) -> pd.DataFrame:
+        """Serve bars from the bar store, downloading only bars newer than the cache"""
+        period_start = self._period_start(period)
+        resume_from = self._cache_resume_point(symbol, interval, period_start)
+        try:
+            if resume_from is None:
+                data = self._fetch_history(symbol, period=period, interval=interval)
+                self.bar_store.write(symbol, interval, data, coverage_start=period_start)
+            else:
+                data = self._fetch_history(symbol, interval=interval, start=resume_from)
+                self.bar_store.write(symbol, interval, data)
+        except Exception as e:
+            if resume_from is None:
+                raise
+            logger.warning(f"Serving cached data for {symbol}, refresh failed: {e}")
+        return self.bar_store.read(symbol, interval, start=period_start)
+    
+    def _download_batch(self, symbols: List[str], period: str = None, interval: str = "1d", start=None) -> Dict[str, pd.DataFrame]:
+        """Download one batch of tickers with a single provider request"""
+        return self.provider.download(symbols, period=period, interval=interval, start=start)
+    
+    def _plan_batches(self, symbols: List[str], period: str, interval: str) -> List[Tuple[List[str], Optional[pd.Timestamp]]]:
+        """Split symbols into download batches, grouping cached symbols by resume point"""
+        groups: Dict[Optional[pd.Timestamp], List[str]] = {}
+        if self.bar_store is not None and period in PERIOD_OFFSETS:
+            period_start = self._period_start(period)
+            for symbol in symbols:
+                resume_from = self._cache_resume_point(symbol, interval, period_start)
+                key = resume_from.tz_convert('UTC').normalize() if resume_from is not None else None
+                groups.setdefault(key, []).append(symbol)
+        else:
+            groups[None] = symbols
+        
+        batch_size = max(1, self.fetch_batch_size)
+        batches = []
+        for start, group in groups.items():
+            for i in range(0, len(group), batch_size):
+                batches.append((group[i:i + batch_size], start))
+        return batches
+    
+    def get_market_data_bulk(self, symbols: List[str], period: str = "1mo", interval: str = "1d") -> Dict[str, pd.DataFrame]:
+        """Fetch market data for many symbols in concurrent batched requests
+        
+        Symbols are split into batches of FETCH_BATCH_SIZE tickers, each downloaded
+        with one request, and at most FETCH_MAX_WORKERS requests run at once. When the
+        bar cache is enabled, cached symbols only request bars newer than what is
+        stored. Symbols missing from their batch are retried individually. Symbols
+        that still have no data are recorded in self.last_fetch_failures with the reason.
+        """
+        results: Dict[str, pd.DataFrame] = {}
+        failures: Dict[str, str] = {}
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            self.last_fetch_failures = failures
+            return results
+        
+        batches = self._plan_batches(symbols, period, interval)
+        cached = self.bar_store is not None and period in PERIOD_OFFSETS
+        period_start = self._period_start(period) if cached else None
+        workers = max(1, min(self.fetch_max_workers, len(batches)))
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._download_batch, batch, period, interval, start): (batch, start)
+                for batch, start in batches
+            }
+            for future in as_completed(futures):
+                batch, start = futures[future]
+                try:
+                    downloaded = future.result()
+                except Exception as e:
+                    logger.warning(f"Batch download failed for {len(batch)} symbols: {e}")
+                    for symbol in batch:
+                        failures[symbol] = str(e)
+                    continue
+                
+                for symbol, data in downloaded.items():
+                    if cached:
+                        try:
+                            self.bar_store.write(symbol, interval, data, coverage_start=period_start if start is None else None)
+                            data = self.bar_store.read(symbol, interval, start=period_start)
+                        except Exception as e:
+                            # Left out of the results, so it is downloaded in full below
+                            logger.warning(f"Bar cache update failed for {symbol}, fetching it again: {e}")
+                            self.bar_store.clear(symbol, interval)
+                            continue
+                    results[symbol] = data
+            
+            # Retry whatever the batched requests did not return, one symbol per request
+            missing = [symbol for symbol in symbols if symbol not in results]
+            retry_futures = {executor.submit(self.get_market_data, symbol, period, interval): symbol for symbol in missing}
+            for future in as_completed(retry_futures):
+                symbol = retry_futures[future]
+                data = future.result()
+                if data.empty:
+                    failures.setdefault(symbol, 'no data returned')
+                else:
+                    results[symbol] = data
+                    failures.pop(symbol, None)
+        
+        if failures:
+            logger.warning(f"Market data unavailable for {len(failures)}/{len(symbols)} symbols: {', '.join(sorted(failures))}")
+        
+        self.last_fetch_failures = failures
+        return results
+    
     def calculate_rsi(self, data: pd.DataFrame, period: int = None) -> pd.Series:
         """Calculate RSI indicator"""
         if period is None:
@@ -57,24 +205,15 @@ class TechnicalAnalyzer:
         """Calculate Exponential Moving Average"""
         return ta.trend.EMAIndicator(data['Close'], window=period).ema_indicator()
     
-    def analyze_asset(self, symbol: str) -> Dict:
-        """Complete technical analysis of an asset"""
-        data = self.get_market_data(symbol)
-        if data.empty:
-            return {}
-        
-        # Calculate indicators
+    def _batch_indicators(self, data: pd.DataFrame) -> Dict:
+        """Latest indicator values computed over the whole series with ta"""
         rsi = self.calculate_rsi(data)
         macd, macd_signal, macd_diff = self.calculate_macd(data)
         bb_upper, bb_lower, bb_middle = self.calculate_bollinger_bands(data)
         ema_20 = self.calculate_ema(data, 20)
         ema_50 = self.calculate_ema(data, 50)
         
-        # Get latest values
-        latest = {
-            'symbol': symbol,
-            'close': data['Close'].iloc[-1],
-            'volume': data['Volume'].iloc[-1],
+        return {
             'rsi': rsi.iloc[-1] if not pd.isna(rsi.iloc[-1]) else None,
             'macd': macd.iloc[-1] if not pd.isna(macd.iloc[-1]) else None,
             'macd_signal': macd_signal.iloc[-1] if not pd.isna(macd_signal.iloc[-1]) else None,
@@ -83,15 +222,160 @@ class TechnicalAnalyzer:
             'bb_lower': bb_lower.iloc[-1] if not pd.isna(bb_lower.iloc[-1]) else None,
             'bb_middle': bb_middle.iloc[-1] if not pd.isna(bb_middle.iloc[-1]) else None,
             'ema_20': ema_20.iloc[-1] if not pd.isna(ema_20.iloc[-1]) else None,
-            'ema_50': ema_50.iloc[-1] if not pd.isna(ema_50.iloc[-1]) else None,
+            'ema_50': ema_50.iloc[-1] if not pd.isna(ema_50.iloc[-1]) else None
+        }
+    
+    def _streaming_indicators(self, key: str, data: pd.DataFrame) -> Dict:
+        """Latest indicator values from the series' incremental indicator engine
+        
+        Every bar but the last is treated as completed and committed to the engine
+        once; the last bar may still be forming, so it is only peeked at. The
+        EMAs behind RSI and MACD remember every bar they have seen, so to give
+        the same values as `ta` over `data` the state is only reused while it
+        starts at the first bar of `data`; once the window moves on it is
+        reseeded from the window.
+        """
+        closes = data['Close'].astype(float)
+        completed = closes.iloc[:-1]
+        engine = self.indicator_engines.get(key)
+        window_start = completed.index[0] if len(completed) else None
+        
+        if (engine is not None and engine.last_timestamp is not None and engine.first_timestamp == window_start
+                and engine.last_timestamp in completed.index):
+            engine.seed(completed[completed.index > engine.last_timestamp])
+        else:
+            # No state yet, or the saved state does not cover exactly these bars
+            engine = IndicatorEngine.from_config(self.config)
+            engine.seed(completed)
+            self.indicator_engines[key] = engine
+        
+        return engine.peek(float(closes.iloc[-1]))
+    
+    def load_indicator_state(self, path: str):
+        """Resume indicator engines saved by save_indicator_state"""
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load indicator state from {path}: {e}")
+            return
+        
+        expected = IndicatorEngine.from_config(self.config).params
+        for symbol, state in saved.items():
+            # Engines built with different parameters are reseeded instead
+            if state.get('params') == expected:
+                self.indicator_engines[symbol] = IndicatorEngine.from_dict(state)
+    
+    def save_indicator_state(self, path: str):
+        """Persist indicator engines so the next process resumes instead of reseeding"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({symbol: engine.to_dict() for symbol, engine in self.indicator_engines.items()}, f)
+        os.replace(tmp_path, path)
+    
+    def analyze_asset(self, symbol: str, data: Optional[pd.DataFrame] = None, timeframe: Optional[str] = None) -> Dict:
+        """Complete technical analysis of an asset"""
+        if data is None:
+            data = self.get_market_data(symbol)
+        if data.empty:
+            return {}
+        
+        if self.streaming_indicators:
+            indicators = self._streaming_indicators(f"{symbol}@{timeframe}" if timeframe else symbol, data)
+        else:
+            indicators = self._batch_indicators(data)
+        
+        # Get latest values
+        latest = {
+            'symbol': symbol,
+            'close': data['Close'].iloc[-1],
+            'volume': data['Volume'].iloc[-1],
+            **indicators,
             'timestamp': datetime.utcnow()
         }
+        if timeframe:
+            latest['timeframe'] = timeframe
         
         return latest
     
-    def generate_signals(self, symbol: str) -> List[Dict]:
+    def _timeframe_frames(self, data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """Bars for every analysis timeframe, resampled from the base-resolution bars"""
+        return {
+            timeframe: data if timeframe == self.base_interval else resample_bars(data, timeframe)
+            for timeframe in self.timeframes
+        }
+    
+    def analyze_timeframes(self, symbol: str, data: Optional[pd.DataFrame] = None) -> Dict[str, Dict]:
+        """Technical analysis of an asset on every configured timeframe
+        
+        Only the base-resolution bars are downloaded; coarser timeframes are
+        resampled from them locally, so extra timeframes add no network requests.
+        """
+        if data is None:
+            data = self.get_market_data(symbol, period=self.base_period, interval=self.base_interval)
+        if data.empty:
+            return {}
+        return {
+            timeframe: self.analyze_asset(symbol, frame, timeframe)
+            for timeframe, frame in self._timeframe_frames(data).items()
+        }
+    
+    def analyze_universe_timeframes(self, market_data: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, Dict]]:
+        """Vectorized analysis of many assets on every configured timeframe"""
+        analyses: Dict[str, Dict[str, Dict]] = {}
+        frames_by_timeframe: Dict[str, Dict[str, pd.DataFrame]] = {}
+        for symbol, data in market_data.items():
+            for timeframe, frame in self._timeframe_frames(data).items():
+                frames_by_timeframe.setdefault(timeframe, {})[symbol] = frame
+        
+        for timeframe, frames in frames_by_timeframe.items():
+            for symbol, analysis in self.analyze_universe(frames).items():
+                analysis['timeframe'] = timeframe
+                analyses.setdefault(symbol, {})[timeframe] = analysis
+        return analyses
+    
+    def analyze_universe(self, market_data: Dict[str, pd.DataFrame]) -> Dict[str, Dict]:
+        """Technical analysis of many assets with one vectorized indicator sweep
+        
+        Returns the same per-symbol dictionaries as analyze_asset, computed from a
+        single (assets x bars) close matrix instead of one ta pass per symbol.
+        """
+        symbols, closes = build_price_matrix(market_data)
+        if not symbols:
+            return {}
+        
+        indicators = compute_indicator_matrix(
+            closes,
+            rsi_period=self.rsi_period,
+            macd_fast=self.macd_fast,
+            macd_slow=self.macd_slow,
+            macd_signal=self.macd_signal
+        )
+        latest_values = {name: values[:, -1] for name, values in indicators.items()}
+        timestamp = datetime.utcnow()
+        
+        analyses = {}
+        for row, symbol in enumerate(symbols):
+            data = market_data[symbol]
+            latest = {
+                'symbol': symbol,
+                'close': data['Close'].iloc[-1],
+                'volume': data['Volume'].iloc[-1]
+            }
+            for name, values in latest_values.items():
+                latest[name] = float(values[row]) if not np.isnan(values[row]) else None
+            latest['timestamp'] = timestamp
+            analyses[symbol] = latest
+        
+        return analyses
+    
+    def generate_signals(self, symbol: str, data: Optional[pd.DataFrame] = None, analysis: Optional[Dict] = None) -> List[Dict]:
         """Generate trading signals based on technical analysis"""
-        analysis = self.analyze_asset(symbol)
+        if analysis is None:
+            analysis = self.analyze_asset(symbol, data)
         if not analysis:
             return []
         
@@ -175,25 +459,82 @@ class TechnicalAnalyzer:
         
         return signals
     
-    def get_strongest_signal(self, symbol: str) -> Optional[Dict]:
-        """Get the strongest signal for an asset"""
-        signals = self.generate_signals(symbol)
+    def _timeframe_bias(self, signals: List[Dict]) -> Optional[str]:
+        """Net direction of a timeframe's signals, weighted by strength"""
+        score = sum(
+            STRENGTH_ORDER.get(signal['strength'], 0) * (1 if signal['type'] == 'BUY' else -1)
+            for signal in signals
+        )
+        if score > 0:
+            return 'BUY'
+        if score < 0:
+            return 'SELL'
+        return None
+    
+    def generate_multi_timeframe_signals(self, symbol: str, data: Optional[pd.DataFrame] = None,
+                                         analyses: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """Signals on the primary timeframe that every higher timeframe agrees with
+        
+        The first entry of ANALYSIS_TIMEFRAMES is the primary timeframe. A signal
+        from it is kept only if the net direction of the signals on each other
+        timeframe matches its type.
+        """
+        if analyses is None:
+            analyses = self.analyze_timeframes(symbol, data)
+        primary, confirmations = self.timeframes[0], self.timeframes[1:]
+        if not analyses.get(primary):
+            return []
+        
+        biases = {}
+        for timeframe in confirmations:
+            analysis = analyses.get(timeframe)
+            biases[timeframe] = self._timeframe_bias(self.generate_signals(symbol, analysis=analysis)) if analysis else None
+        
+        confirmed = []
+        for signal in self.generate_signals(symbol, analysis=analyses[primary]):
+            if all(bias == signal['type'] for bias in biases.values()):
+                signal['timeframes'] = list(self.timeframes)
+                if confirmations:
+                    signal['reason'] += f" (confirmed on {', '.join(confirmations)})"
+                confirmed.append(signal)
+        return confirmed
+    
+    def strongest_signal(self, signals: List[Dict]) -> Optional[Dict]:
+        """Pick the strongest of a list of signals"""
         if not signals:
             return None
         
         # Prioritize by strength: strong > medium > weak
-        strength_order = {'strong': 3, 'medium': 2, 'weak': 1}
-        strongest = max(signals, key=lambda x: strength_order.get(x['strength'], 0))
-        
-        return strongest
+        return max(signals, key=lambda x: STRENGTH_ORDER.get(x['strength'], 0))
+    
+    def get_strongest_signal(self, symbol: str, data: Optional[pd.DataFrame] = None, analysis: Optional[Dict] = None) -> Optional[Dict]:
+        """Get the strongest signal for an asset"""
+        return self.strongest_signal(self.generate_signals(symbol, data, analysis))
     
     def analyze_all_assets(self) -> List[Dict]:
         """Analyze all monitored assets and return signals"""
         all_signals = []
+        market_data = {}
+        analyses = {}
+        prefetch = self.config.BULK_FETCH_ENABLED or self.vectorized_analysis
+        
+        if prefetch and self.multi_timeframe:
+            market_data = self.get_market_data_bulk(self.config.MONITORED_ASSETS, period=self.base_period, interval=self.base_interval)
+        elif prefetch:
+            market_data = self.get_market_data_bulk(self.config.MONITORED_ASSETS)
+        if self.vectorized_analysis:
+            analyses = self.analyze_universe_timeframes(market_data) if self.multi_timeframe else self.analyze_universe(market_data)
         
         for symbol in self.config.MONITORED_ASSETS:
+            if prefetch and symbol not in market_data:
+                continue
             try:
-                strongest_signal = self.get_strongest_signal(symbol)
+                if self.multi_timeframe:
+                    strongest_signal = self.strongest_signal(
+                        self.generate_multi_timeframe_signals(symbol, market_data.get(symbol), analyses.get(symbol))
+                    )
+                else:
+                    strongest_signal = self.get_strongest_signal(symbol, market_data.get(symbol), analyses.get(symbol))
                 if strongest_signal:
                     strongest_signal['symbol'] = symbol
                     all_signals.append(strongest_signal)
@@ -201,4 +542,10 @@ class TechnicalAnalyzer:
                 logger.error(f"Error analyzing {symbol}: {e}")
                 continue
         
+        if self.streaming_indicators and not self.vectorized_analysis and self.indicator_state_path:
+            try:
+                self.save_indicator_state(self.indicator_state_path)
+            except OSError as e:
+                logger.warning(f"Could not save indicator state: {e}")
+        
         return all_signals 
\ No newline at end of file
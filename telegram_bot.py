@@ -1,13 +1,22 @@
 import asyncio
 import logging
-from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 import json
+from datetime import datetime, timedelta
 
-from models import db, User, Subscription, Signal, Notification, SubscriptionStatus
+import bot_db
+from bot_db import BotDatabase
+from models import db, Signal, SubscriptionStatus
 from config import Config
+from delivery import DELIVERED, MessageDispatcher
+from delivery_shards import ShardCoordinator, shard_share
+from notification_writer import NotificationWriter
+from outbox import OutboxWorker, enqueue_digest, enqueue_signal
+from render_cache import RECENT_SIGNALS, render_cache
+from subscriber_index import subscriber_index
+from webhook import WebhookServer
 from technical_analysis import TechnicalAnalyzer
 
 logging.basicConfig(
@@ -17,16 +26,46 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TradingBot:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, app=None, set_webhook: bool = True, deliver: bool = True):
         self.config = config
+        # Only one of several webhook replicas needs to register the webhook
+        self.set_webhook = set_webhook
+        # Only one process drains the outbox, so the bot as a whole stays
+        # within Telegram's rate limits
+        self.deliver = deliver
+        self.index_refresh = None
+        self.webhook = None
+        # Flask app whose context database work on the bot loop runs in
+        self.app = app
         self.analyzer = TechnicalAnalyzer(config)
         self.application = None
+        self.dispatcher = None
+        self.loop = None
+        self.outbox_worker = None
+        # Worker processes fanning outbox jobs out by telegram_id hash
+        self.shards = None
+        # Blocking database work runs in its own thread pool, off the event loop
+        self.db = BotDatabase(app, config.BOT_DB_WORKERS)
+        # Notification rows are written in batches by a background thread
+        self.notification_writer = NotificationWriter.from_config(app, config) if app is not None else None
+        # Rendered /signals and /status replies
+        render_cache.ttl = config.RENDER_CACHE_TTL
+        render_cache.max_entries = config.RENDER_CACHE_MAX_ENTRIES
         
     async def start(self):
         """Initialize and start the bot"""
-        self.application = Application.builder().token(self.config.TELEGRAM_BOT_TOKEN).build()
+        self.loop = asyncio.get_running_loop()
+        builder = Application.builder().token(self.config.TELEGRAM_BOT_TOKEN)
+        if self.config.TELEGRAM_API_BASE_URL:
+            # A local Bot API server, or a fake one for testing
+            base_url = self.config.TELEGRAM_API_BASE_URL.rstrip('/')
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+        # Handlers await the database pool, so updates from different chats can overlap
+        self.application = builder.concurrent_updates(self.config.BOT_CONCURRENT_UPDATES).build()
         
         # Add handlers
+        # Any update from a chat that blocked the bot means it can be reached again
+        self.application.add_handler(TypeHandler(Update, self.unblock_chat), group=-1)
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("subscribe", self.subscribe_command))
@@ -34,38 +73,90 @@ class TradingBot:
         self.application.add_handler(CommandHandler("signals", self.signals_command))
         self.application.add_handler(CallbackQueryHandler(self.button_callback))
         
+        # All outgoing fan-out goes through one rate-limited dispatcher, which
+        # shares the bot's budget with the delivery shards if there are any
+        self.dispatcher = MessageDispatcher.from_config(self.application.bot, self.config, shard_share(self.config))
+        
         # Start the bot
         await self.application.initialize()
         await self.application.start()
-        await self.application.updater.start_polling()
+        if self.config.BOT_UPDATE_MODE == 'webhook':
+            await self.start_webhook()
+        else:
+            await self.application.updater.start_polling()
+        
+        # Drain queued outgoing messages on this loop
+        if self.app is not None:
+            # Subscribers are answered from the index without a profile query
+            await self.db.run(subscriber_index.load)
+            self.index_refresh = asyncio.ensure_future(self._refresh_subscriber_index())
+            self.notification_writer.start()
+            if self.deliver:
+                if self.config.DELIVERY_SHARDS > 0:
+                    self.shards = ShardCoordinator(self.config)
+                    self.shards.start()
+                self.outbox_worker = OutboxWorker(self, self.app, self.config)
+                self.outbox_worker.start()
+    
+    async def _refresh_subscriber_index(self):
+        """Reload the subscriber index to pick up changes made by other processes"""
+        while True:
+            await asyncio.sleep(self.config.SUBSCRIBER_INDEX_REFRESH_MINUTES * 60)
+            try:
+                await self.db.run(subscriber_index.load)
+            except Exception as e:
+                logger.error(f"Error refreshing subscriber index: {e}")
+    
+    async def start_webhook(self):
+        """Receive updates through the webhook endpoint instead of polling"""
+        self.webhook = WebhookServer(self.application, self.config.WEBHOOK_SECRET_TOKEN, self.config.WEBHOOK_PATH)
+        await self.webhook.start(self.config.WEBHOOK_LISTEN, self.config.WEBHOOK_PORT)
+        if self.set_webhook and self.config.WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                url=self.config.WEBHOOK_URL,
+                secret_token=self.config.WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=self.config.WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Webhook registered at {self.config.WEBHOOK_URL}")
+    
+    async def _in_app_context(self, coro):
+        with self.app.app_context():
+            return await coro
+    
+    def submit(self, coro):
+        """Run a coroutine on the bot's event loop from another thread
+        
+        Returns a concurrent.futures.Future; the caller does not wait for it.
+        """
+        if self.loop is None:
+            coro.close()
+            raise RuntimeError("Bot is not running")
+        if self.app is not None:
+            coro = self._in_app_context(coro)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        
+    async def unblock_chat(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Resume delivery to a chat that had blocked the bot"""
+        user = update.effective_user
+        if user is not None and subscriber_index.is_blocked(user.id):
+            await self.db.run(subscriber_index.unblock, str(user.id))
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
         
-        # Check if user exists in database
-        db_user = User.query.filter_by(telegram_id=str(user.id)).first()
+        db_user, created = await self.db.run(
+            bot_db.register_user,
+            str(user.id),
+            user.username,
+            user.first_name,
+            user.last_name,
+            self.config.TRIAL_DAYS
+        )
         
-        if not db_user:
-            # Create new user
-            db_user = User(
-                telegram_id=str(user.id),
-                username=user.username,
-                first_name=user.first_name,
-                last_name=user.last_name
-            )
-            db.session.add(db_user)
-            db.session.commit()
-            
-            # Create trial subscription
-            trial_end = datetime.utcnow() + timedelta(days=self.config.TRIAL_DAYS)
-            subscription = Subscription(
-                user_id=db_user.id,
-                status=SubscriptionStatus.TRIAL,
-                end_date=trial_end
-            )
-            db.session.add(subscription)
-            db.session.commit()
+        if created:
+            subscriber_index.update(db_user['telegram_id'], db_user['subscription']['end_date'])
             
             welcome_message = f"""
 🎉 Welcome to our Trading Signals Bot!
@@ -82,12 +173,12 @@ Use /subscribe to upgrade to premium when your trial ends.
 Happy trading! 📈
             """
         else:
-            subscription = db_user.subscription
-            if subscription and subscription.is_active():
+            subscription = db_user['subscription']
+            if subscription and subscription['active']:
                 welcome_message = f"""
 Welcome back, {user.first_name}! 👋
 
-Your subscription is active with {subscription.days_remaining()} days remaining.
+Your subscription is active with {subscription['days_remaining']} days remaining.
 
 Use /signals to view recent signals or /status to check your subscription.
                 """
@@ -147,21 +238,21 @@ Contact @admin for support or questions.
     async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /subscribe command"""
         user = update.effective_user
-        db_user = User.query.filter_by(telegram_id=str(user.id)).first()
+        db_user = await self.db.run(bot_db.get_user_profile, str(user.id))
         
         if not db_user:
             await update.message.reply_text("Please use /start first to register.")
             return
         
-        subscription = db_user.subscription
+        subscription = db_user['subscription']
         
-        if subscription and subscription.is_active():
-            days_left = subscription.days_remaining()
+        if subscription and subscription['active']:
+            days_left = subscription['days_remaining']
             message = f"""
 Your subscription is already active! ✅
 
 Days remaining: {days_left}
-Status: {subscription.status.value.title()}
+Status: {subscription['status'].value.title()}
 
 You can continue receiving signals until your subscription expires.
             """
@@ -210,13 +301,22 @@ Select your plan below:
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /status command"""
         user = update.effective_user
-        db_user = User.query.filter_by(telegram_id=str(user.id)).first()
+        telegram_id = str(user.id)
+        # The index bumps a user's version whenever their subscription changes
+        cache_key = ('status', telegram_id, subscriber_index.subscription_version(telegram_id))
+        if subscriber_index.loaded:
+            status_text = render_cache.get(cache_key)
+            if status_text is not None:
+                await update.message.reply_text(status_text, parse_mode=ParseMode.MARKDOWN)
+                return
+        
+        db_user = await self.db.run(bot_db.get_user_profile, telegram_id)
         
         if not db_user:
             await update.message.reply_text("Please use /start first to register.")
             return
         
-        subscription = db_user.subscription
+        subscription = db_user['subscription']
         
         if not subscription:
             await update.message.reply_text("No subscription found. Use /subscribe to get started.")
@@ -232,16 +332,16 @@ Select your plan below:
         status_text = f"""
 📊 **Subscription Status**
 
-**User:** {db_user.first_name} {db_user.last_name or ''}
-**Username:** @{db_user.username or 'N/A'}
-**Status:** {status_emoji[subscription.status]} {subscription.status.value.title()}
-**Join Date:** {db_user.join_date.strftime('%Y-%m-%d')}
+**User:** {db_user['first_name']} {db_user['last_name'] or ''}
+**Username:** @{db_user['username'] or 'N/A'}
+**Status:** {status_emoji[subscription['status']]} {subscription['status'].value.title()}
+**Join Date:** {db_user['join_date'].strftime('%Y-%m-%d')}
 
 **Subscription Details:**
-• Start Date: {subscription.start_date.strftime('%Y-%m-%d')}
-• End Date: {subscription.end_date.strftime('%Y-%m-%d') if subscription.end_date else 'N/A'}
-• Days Remaining: {subscription.days_remaining()}
-• Payment Amount: ${subscription.payment_amount}
+• Start Date: {subscription['start_date'].strftime('%Y-%m-%d')}
+• End Date: {subscription['end_date'].strftime('%Y-%m-%d') if subscription['end_date'] else 'N/A'}
+• Days Remaining: {subscription['days_remaining']}
+• Payment Amount: ${subscription['payment_amount']}
 
 **Features:**
 ✅ Real-time signals
@@ -249,32 +349,47 @@ Select your plan below:
 ✅ Performance tracking
 ✅ Custom alerts
         """
-        
-        await update.message.reply_text(status_text.strip(), parse_mode=ParseMode.MARKDOWN)
+        status_text = status_text.strip()
+        
+        if subscriber_index.loaded:
+            # Days Remaining drops by one a whole number of days before the end date
+            ttl = None
+            if subscription['end_date']:
+                remaining = subscription['end_date'] - datetime.utcnow()
+                ttl = max(0.0, (remaining - timedelta(days=remaining.days)).total_seconds())
+            render_cache.set(cache_key, status_text, ttl=ttl)
+        await update.message.reply_text(status_text, parse_mode=ParseMode.MARKDOWN)
     
     async def signals_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /signals command"""
         user = update.effective_user
-        db_user = User.query.filter_by(telegram_id=str(user.id)).first()
-        
-        if not db_user:
-            await update.message.reply_text("Please use /start first to register.")
-            return
         
-        subscription = db_user.subscription
-        
-        if not subscription or not subscription.is_active():
-            await update.message.reply_text(
-                "Your subscription has expired. Use /subscribe to renew and view signals."
-            )
-            return
+        # Active subscribers are known from the index; everyone else is checked in the database
+        if str(user.id) not in subscriber_index:
+            db_user = await self.db.run(bot_db.get_user_profile, str(user.id))
+            
+            if not db_user:
+                await update.message.reply_text("Please use /start first to register.")
+                return
+            
+            subscription = db_user['subscription']
+            
+            if not subscription or not subscription['active']:
+                await update.message.reply_text(
+                    "Your subscription has expired. Use /subscribe to renew and view signals."
+                )
+                return
         
-        # Get recent signals
-        recent_signals = Signal.query.order_by(Signal.timestamp.desc()).limit(5).all()
+        # Every subscriber gets the same text, rendered once per change to the signals
+        signals_text = await render_cache.get_or_render(RECENT_SIGNALS, self.render_recent_signals)
+        await update.message.reply_text(signals_text, parse_mode=ParseMode.MARKDOWN)
+    
+    async def render_recent_signals(self) -> str:
+        """Text of the /signals reply"""
+        recent_signals = await self.db.run(bot_db.get_recent_signals, 5)
         
         if not recent_signals:
-            await update.message.reply_text("No recent signals available.")
-            return
+            return "No recent signals available."
         
         signals_text = "📊 **Recent Trading Signals**\n\n"
         
@@ -286,17 +401,17 @@ Select your plan below:
             }
             
             signals_text += f"""
-{outcome_emoji[signal.outcome.value]} **{signal.asset_symbol} {signal.signal_type.value.upper()}**
-💰 Entry: ${signal.entry_price}
-🎯 Target: ${signal.target_price}
-🛑 Stop Loss: ${signal.stop_loss}
-📅 {signal.timestamp.strftime('%Y-%m-%d %H:%M')}
-📝 {signal.content[:100]}...
+{outcome_emoji[signal['outcome'].value]} **{signal['asset_symbol']} {signal['signal_type'].value.upper()}**
+💰 Entry: ${signal['entry_price']}
+🎯 Target: ${signal['target_price']}
+🛑 Stop Loss: ${signal['stop_loss']}
+📅 {signal['timestamp'].strftime('%Y-%m-%d %H:%M')}
+📝 {signal['content'][:100]}...
 
 ---
             """
         
-        await update.message.reply_text(signals_text.strip(), parse_mode=ParseMode.MARKDOWN)
+        return signals_text.strip()
     
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks"""
@@ -330,21 +445,16 @@ Select your plan below:
         
         # For now, simulate successful payment
         # In production, integrate with payment gateway
-        user = User.query.filter_by(telegram_id=str(query.from_user.id)).first()
+        user = await self.db.run(
+            bot_db.activate_subscription,
+            str(query.from_user.id),
+            selected_plan["days"],
+            selected_plan["price"]
+        )
         
         if user:
-            subscription = user.subscription
-            if not subscription:
-                subscription = Subscription(user_id=user.id)
-                db.session.add(subscription)
-            
-            subscription.status = SubscriptionStatus.ACTIVE
-            subscription.start_date = datetime.utcnow()
-            subscription.end_date = datetime.utcnow() + timedelta(days=selected_plan["days"])
-            subscription.payment_amount = selected_plan["price"]
-            subscription.payment_method = "manual"
-            
-            db.session.commit()
+            subscription = user['subscription']
+            subscriber_index.update(user['telegram_id'], subscription['end_date'])
             
             success_message = f"""
 ✅ **Subscription Successful!**
@@ -352,7 +462,7 @@ Select your plan below:
 Plan: {plan.title()}
 Amount: ${selected_plan['price']}
 Duration: {selected_plan['days']} days
-Expires: {subscription.end_date.strftime('%Y-%m-%d')}
+Expires: {subscription['end_date'].strftime('%Y-%m-%d')}
 
 You now have access to all premium features!
 Use /signals to view recent signals.
@@ -360,110 +470,25 @@ Use /signals to view recent signals.
             
             await query.edit_message_text(success_message.strip(), parse_mode=ParseMode.MARKDOWN)
     
-    async def send_signal_to_channel(self, signal_data: dict):
-        """Send signal to the channel"""
-        if not self.config.TELEGRAM_CHANNEL_ID:
-            logger.warning("Channel ID not configured")
-            return
-        
-        signal_type_emoji = {"BUY": "🟢", "SELL": "🔴"}
-        
-        message = f"""
-{signal_type_emoji[signal_data['type']]} **{signal_data['type']} SIGNAL**
-
-**Asset:** {signal_data['symbol']}
-**Strategy:** {signal_data['strategy']}
-**Price:** ${signal_data['price']:.2f}
-**Strength:** {signal_data['strength'].title()}
-
-**Reason:**
-{signal_data['reason']}
-
-⏰ {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
-        """
-        
-        try:
-            await self.application.bot.send_message(
-                chat_id=self.config.TELEGRAM_CHANNEL_ID,
-                text=message.strip(),
-                parse_mode=ParseMode.MARKDOWN
-            )
-        except Exception as e:
-            logger.error(f"Error sending signal to channel: {e}")
-    
-    async def send_signal_to_subscribers(self, signal_data: dict):
-        """Send signal to all active subscribers"""
-        active_subscriptions = Subscription.query.filter(
-            Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE])
-        ).all()
-        
-        signal_type_emoji = {"BUY": "🟢", "SELL": "🔴"}
-        
-        message = f"""
-{signal_type_emoji[signal_data['type']]} **NEW SIGNAL**
-
-**Asset:** {signal_data['symbol']}
-**Strategy:** {signal_data['strategy']}
-**Price:** ${signal_data['price']:.2f}
-**Strength:** {signal_data['strength'].title()}
-
-**Reason:**
-{signal_data['reason']}
-
-⏰ {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
-        """
-        
-        for subscription in active_subscriptions:
-            if subscription.is_active():
-                try:
-                    user = subscription.user
-                    await self.application.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message.strip(),
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending signal to user {user.telegram_id}: {e}")
-    
     async def send_notification(self, user_id: str, message: str, notification_type: str = "system"):
         """Send notification to a specific user"""
         try:
-            await self.application.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN
-            )
+            result = await self.dispatcher.send(user_id, message, 'notification', parse_mode=ParseMode.MARKDOWN)
             
-            # Store notification in database
-            db_user = User.query.filter_by(telegram_id=user_id).first()
-            if db_user:
-                notification = Notification(
-                    user_id=db_user.id,
-                    message=message,
-                    notification_type=notification_type
-                )
-                db.session.add(notification)
-                db.session.commit()
+            # Logged by the buffered writer, never on the send path
+            if result == DELIVERED and self.notification_writer:
+                self.notification_writer.add(user_id, message, notification_type)
                 
         except Exception as e:
             logger.error(f"Error sending notification to {user_id}: {e}")
     
     async def check_subscription_expiry(self):
         """Check for expiring subscriptions and send warnings"""
-        warning_date = datetime.utcnow() + timedelta(days=self.config.SUBSCRIPTION_WARNING_DAYS)
+        expiring = await self.db.run(bot_db.get_expiring_subscribers, self.config.SUBSCRIPTION_WARNING_DAYS)
         
-        expiring_subscriptions = Subscription.query.filter(
-            Subscription.end_date <= warning_date,
-            Subscription.status.in_([SubscriptionStatus.TRIAL, SubscriptionStatus.ACTIVE])
-        ).all()
-        
-        for subscription in expiring_subscriptions:
-            if subscription.is_active():
-                user = subscription.user
-                days_left = subscription.days_remaining()
-                
-                if days_left <= self.config.SUBSCRIPTION_WARNING_DAYS:
-                    warning_message = f"""
+        warnings = []
+        for telegram_id, days_left in expiring:
+            warning_message = f"""
 ⚠️ **Subscription Expiring Soon**
 
 Your subscription will expire in {days_left} day(s).
@@ -471,44 +496,83 @@ Your subscription will expire in {days_left} day(s).
 To continue receiving premium signals, please renew your subscription using /subscribe.
 
 Thank you for using our service!
-                    """
-                    
-                    await self.send_notification(
-                        user.telegram_id,
-                        warning_message.strip(),
-                        "subscription"
-                    )
+            """
+            
+            warnings.append(self.send_notification(
+                telegram_id,
+                warning_message.strip(),
+                "subscription"
+            ))
+        
+        # Sent concurrently; the dispatcher keeps them within rate limits
+        await asyncio.gather(*warnings)
+    
+    def signal_levels(self, signal_type: str, price: float):
+        """Target and stop-loss prices for a signal entered at `price`"""
+        price = float(price)
+        direction = 1 if signal_type == 'BUY' else -1
+        target_price = price * (1 + direction * self.config.SIGNAL_TARGET_PCT / 100)
+        stop_loss = price * (1 - direction * self.config.SIGNAL_STOP_LOSS_PCT / 100)
+        return round(target_price, 6), round(stop_loss, 6)
+    
+    def _store_signals(self, signals):
+        """Store signals and queue them for delivery; runs in the database pool"""
+        digest = []
+        
+        for signal_data in signals:
+            # Store signal in database with levels the outcome resolver checks
+            target_price, stop_loss = self.signal_levels(signal_data['type'], signal_data['price'])
+            signal = Signal(
+                asset_symbol=signal_data['symbol'],
+                signal_type=signal_data['type'],
+                entry_price=signal_data['price'],
+                target_price=target_price,
+                stop_loss=stop_loss,
+                content=signal_data['reason'],
+                strategy_used=signal_data['strategy']
+            )
+            db.session.add(signal)
+            
+            # Queue it for the channel and subscribers in the same transaction;
+            # in digest mode only urgent signals go out on their own
+            if self.config.SIGNAL_DELIVERY_MODE == 'digest' and signal_data['strength'] not in self.config.DIGEST_URGENT_STRENGTHS:
+                digest.append(signal_data)
+            else:
+                enqueue_signal(signal_data, commit=False)
+        
+        if digest:
+            enqueue_digest(digest, self.config.DIGEST_WINDOW_MINUTES, commit=False)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
     
     async def run_automated_analysis(self):
         """Run automated technical analysis and send signals"""
         try:
-            signals = self.analyzer.analyze_all_assets()
-            
-            for signal_data in signals:
-                # Store signal in database
-                signal = Signal(
-                    asset_symbol=signal_data['symbol'],
-                    signal_type=signal_data['type'],
-                    entry_price=signal_data['price'],
-                    content=signal_data['reason'],
-                    strategy_used=signal_data['strategy']
-                )
-                db.session.add(signal)
-                db.session.commit()
-                
-                # Send to channel and subscribers
-                await self.send_signal_to_channel(signal_data)
-                await self.send_signal_to_subscribers(signal_data)
-                
-                # Wait between signals to avoid rate limiting
-                await asyncio.sleep(2)
+            # Market data downloads and indicator math block, so they run off the loop
+            signals = await asyncio.to_thread(self.analyzer.analyze_all_assets)
+            await self.db.run(self._store_signals, signals)
                 
         except Exception as e:
             logger.error(f"Error in automated analysis: {e}")
     
     async def stop(self):
         """Stop the bot"""
+        if self.index_refresh:
+            self.index_refresh.cancel()
+        if self.outbox_worker:
+            await self.outbox_worker.stop()
+        if self.shards:
+            await asyncio.to_thread(self.shards.stop)
+        if self.notification_writer:
+            await asyncio.to_thread(self.notification_writer.stop)
+        await asyncio.to_thread(self.db.shutdown)
+        if self.webhook:
+            await self.webhook.stop()
         if self.application:
-            await self.application.updater.stop()
+            if self.application.updater.running:
+                await self.application.updater.stop()
             await self.application.stop()
             await self.application.shutdown() 
\ No newline at end of file
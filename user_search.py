@@ -0,0 +1,40 @@
+import logging
+
+import sqlalchemy as sa
+
+from models import db, User
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 table with trigram-tokenized usernames and names (migration 3)
+SEARCH_TABLE = 'users_search'
+# Trigram indexes only match terms of at least three characters
+TRIGRAM_MIN_LENGTH = 3
+
+def _escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _has_search_table(connection) -> bool:
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+    ).first() is not None
+
+def user_search_filter(term: str, session=None):
+    """Filter matching users whose username, first or last name contains `term`
+
+    Matching ignores case. On PostgreSQL the ILIKE is served by the pg_trgm
+    GIN indexes, on SQLite by the FTS5 trigram table. Other databases, and
+    terms shorter than a trigram, fall back to a LIKE scan.
+    """
+    session = session or db.session
+    pattern = f"%{_escape_like(term)}%"
+    columns = (User.username, User.first_name, User.last_name)
+    dialect = session.get_bind().dialect.name
+
+    if dialect == 'sqlite' and len(term) >= TRIGRAM_MIN_LENGTH and _has_search_table(session.connection()):
+        phrase = '"' + term.replace('"', '""') + '"'
+        matches = sa.text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :phrase").bindparams(phrase=phrase)
+        return User.id.in_(matches)
+    if dialect == 'postgresql':
+        return sa.or_(*(column.ilike(pattern, escape='\\') for column in columns))
+    return sa.or_(*(column.like(pattern, escape='\\') for column in columns))
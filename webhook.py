@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import socket
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    """Async HTTP endpoint that receives Telegram updates for an Application
+
+    Each POST is checked against the secret token Telegram sends with every
+    webhook call, decoded into an Update and put on the application's update
+    queue, where the registered handlers process it as they would a polled
+    update. The response is sent as soon as the update is queued. Several
+    processes can serve the same port (SO_REUSEPORT), so the endpoint scales
+    across workers on one host and across hosts behind a load balancer.
+    """
+
+    def __init__(self, application, secret_token: str, path: str = '/telegram/webhook'):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET_TOKEN must be set in webhook mode")
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.runner: Optional[web.AppRunner] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning(f"Rejected webhook call from {request.remote} with an invalid secret token")
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'pending_updates': self.application.update_queue.qsize()})
+
+    async def start(self, host: str, port: int):
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port, reuse_port=hasattr(socket, 'SO_REUSEPORT') or None)
+        await site.start()
+        logger.info(f"Webhook endpoint listening on {host}:{port}{self.path}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+def _run_worker(worker: int):
+    from app import app
+    from config import Config
+    from telegram_bot import TradingBot
+
+    logging.basicConfig(level=logging.INFO)
+    # Telegram only needs to be told about the webhook once. Outgoing signals
+    # and broadcasts are delivered by the bot in app.py, so each worker only
+    # answers the updates it receives
+    bot = TradingBot(Config, app, set_webhook=worker == 0, deliver=False)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(bot.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(bot.stop())
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Serve Telegram updates through the webhook endpoint')
+    parser.add_argument('--workers', type=int, default=Config.WEBHOOK_WORKERS,
+                        help='Processes sharing the webhook port')
+    args = parser.parse_args()
+
+    if Config.BOT_UPDATE_MODE != 'webhook':
+        parser.error("Set BOT_UPDATE_MODE=webhook to serve updates through the webhook")
+
+    processes = [multiprocessing.Process(target=_run_worker, args=(worker,)) for worker in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+if __name__ == '__main__':
+    main()